@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class RootIndex:
+    def __init__(self, dirs=None, files=None):
+        # relative directory -> mtime, "" is the root itself
+        self.dirs = dirs if dirs is not None else {}
+        # relative directory -> {file name: (size, mtime)}
+        self.files = files if files is not None else {}
+        self.paths = ()
+
+    def update_paths(self):
+        self.paths = tuple(os.path.join(rel, name) for rel in self.files for name in self.files[rel])
+
+class WatchHandler(FileSystemEventHandler):
+    def __init__(self, index, root):
+        self.index = index
+        self.root = root
+
+    def on_any_event(self, event):
+        paths = [event.src_path]
+        if getattr(event, "dest_path", None):
+            paths.append(event.dest_path)
+        for path in paths:
+            if isinstance(path, bytes):
+                path = os.fsdecode(path)
+            self.index.mark_dirty(self.root, os.path.relpath(os.path.dirname(path), self.root))
+
+class ModelIndex:
+    """
+    Persistent index of the files under the model folders, so listing them
+    doesn't walk and stat the folders (which is slow on network mounts with
+    large model libraries).
+
+    The index is loaded from path at startup and kept up to date by a worker
+    thread. Directories watchdog reports changes in (when it is installed) are
+    listed again right away and the mtime of every indexed directory is
+    checked every poll_interval seconds, which also catches the changes
+    watchdog can't see like the ones made on another machine. Lookups only
+    read what is in memory, folders that were never indexed are scanned the
+    first time they are looked up.
+    """
+    def __init__(self, path, poll_interval=10.0, excluded_dir_names=(".git",), settle_time=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.excluded_dir_names = set(excluded_dir_names)
+        self.lock = threading.Lock()
+        self.roots = {}
+        self.generation = 0
+        self.dirty = set()
+        self.save_pending = False
+        self.wake = threading.Event()
+        self.load()
+
+        self.observer = None
+        self.watched = set()
+        if Observer is not None:
+            self.observer = Observer()
+            self.observer.daemon = True
+            self.observer.start()
+            for root in self.roots:
+                self.watch(root)
+
+        self.thread = threading.Thread(target=self.worker, daemon=True, name="model_index")
+        self.thread.start()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for root, x in data["roots"].items():
+                files = {rel: {name: tuple(v) for name, v in entries.items()} for rel, entries in x["files"].items()}
+                index = RootIndex(x["dirs"], files)
+                index.update_paths()
+                self.roots[root] = index
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning("Failed to load the model index {}, the model folders will be scanned again: {}".format(self.path, e))
+            self.roots = {}
+
+    def save(self):
+        with self.lock:
+            roots = dict(self.roots)
+        data = {"roots": {root: {"dirs": index.dirs, "files": index.files} for root, index in roots.items()}}
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning("Failed to save the model index {}: {}".format(self.path, e))
+
+    def watch(self, root):
+        if self.observer is None or root in self.watched or not os.path.isdir(root):
+            return
+        try:
+            self.observer.schedule(WatchHandler(self, root), root, recursive=True)
+            self.watched.add(root)
+        except Exception as e:
+            logging.debug("Can't watch {}, relying on polling: {}".format(root, e))
+
+    def mark_dirty(self, root, rel):
+        if rel == os.curdir or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            rel = ""
+        with self.lock:
+            self.dirty.add((root, rel))
+        self.wake.set()
+
+    def get_files(self, roots):
+        """Return the generation of the index and the relative paths of the files under each root."""
+        for root in roots:
+            if root not in self.roots:
+                index = RootIndex()
+                if os.path.isdir(root):
+                    self.scan_tree(root, index, "")
+                index.update_paths()
+                with self.lock:
+                    if root not in self.roots:
+                        self.roots[root] = index
+                        self.generation += 1
+                        self.save_pending = True
+                self.watch(root)
+                self.wake.set()
+        with self.lock:
+            return self.generation, {root: self.roots[root].paths for root in roots}
+
+    def scan_dir(self, path):
+        """List one directory, returns its mtime, its subdirectories and {file name: (size, mtime)}."""
+        mtime = os.path.getmtime(path)
+        subdirs = []
+        files = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    # symlinks to directories are followed like os.walk(followlinks=True) does
+                    if entry.is_dir():
+                        if entry.name not in self.excluded_dir_names and not self.is_loop(path, entry):
+                            subdirs.append(entry.name)
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # broken link, listed like recursive_search does
+                        stat = entry.stat(follow_symlinks=False)
+                    files[entry.name] = (stat.st_size, stat.st_mtime)
+                except OSError:
+                    continue
+        return mtime, subdirs, files
+
+    def is_loop(self, path, entry):
+        # a symlink to the directory it is in or to one of its parents
+        if not entry.is_symlink():
+            return False
+        target = os.path.realpath(entry.path)
+        parent = os.path.realpath(path)
+        return parent == target or parent.startswith(target.rstrip(os.sep) + os.sep)
+
+    def scan_tree(self, root, index, rel):
+        stack = [rel]
+        while len(stack) > 0:
+            rel = stack.pop()
+            path = os.path.join(root, rel)
+            try:
+                mtime, subdirs, files = self.scan_dir(path)
+            except OSError as e:
+                logging.warning("Warning: Unable to access {}. Skipping this path. {}".format(path, e))
+                continue
+            index.dirs[rel] = mtime
+            index.files[rel] = files
+            stack.extend(os.path.join(rel, x) for x in subdirs)
+
+    def drop(self, index, rel):
+        if rel == "":
+            index.dirs.clear()
+            index.files.clear()
+            return
+        prefix = rel + os.sep
+        for x in [x for x in index.dirs if x == rel or x.startswith(prefix)]:
+            index.dirs.pop(x, None)
+            index.files.pop(x, None)
+
+    def refresh_dir(self, root, index, rel):
+        """List a directory again, scanning the subdirectories that appeared and dropping the ones that are gone."""
+        path = os.path.join(root, rel)
+        try:
+            mtime, subdirs, files = self.scan_dir(path)
+        except OSError:
+            self.drop(index, rel)
+            return
+        index.dirs[rel] = mtime
+        index.files[rel] = files
+        known = set(x for x in index.dirs if x != rel and os.path.dirname(x) == rel)
+        current = set(os.path.join(rel, x) for x in subdirs)
+        for x in known - current:
+            self.drop(index, x)
+        for x in current - known:
+            self.scan_tree(root, index, x)
+
+    def refresh_dirty(self, root, index, rel):
+        # a directory that isn't indexed yet is found by listing its parent again
+        while rel not in index.dirs and rel != "":
+            rel = os.path.dirname(rel)
+        if rel in index.dirs or os.path.isdir(root):
+            self.refresh_dir(root, index, rel)
+            return True
+        return False
+
+    def poll_root(self, root, index):
+        if len(index.dirs) == 0:
+            if not os.path.isdir(root):
+                return False
+            self.scan_tree(root, index, "")
+            self.watch(root)
+            return True
+        changed = False
+        for rel in list(index.dirs):
+            if rel not in index.dirs:
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(root, rel))
+            except OSError:
+                mtime = None
+            if mtime != index.dirs[rel]:
+                self.refresh_dir(root, index, rel)
+                changed = True
+        return changed
+
+    def worker(self):
+        # the index loaded from disk is checked right away
+        last_poll = time.monotonic() - self.poll_interval
+        while True:
+            if self.wake.wait(max(0.0, last_poll + self.poll_interval - time.monotonic())):
+                # let bursts of events (like the ones of a file being copied) settle
+                time.sleep(self.settle_time)
+            self.wake.clear()
+            with self.lock:
+                dirty = self.dirty
+                self.dirty = set()
+                roots = dict(self.roots)
+                save = self.save_pending
+                self.save_pending = False
+
+            changed = set()
+            try:
+                for root, rel in dirty:
+                    if root in roots and self.refresh_dirty(root, roots[root], rel):
+                        changed.add(root)
+                if time.monotonic() >= last_poll + self.poll_interval:
+                    for root, index in roots.items():
+                        if self.poll_root(root, index):
+                            changed.add(root)
+                    last_poll = time.monotonic()
+            except Exception as e:
+                logging.warning("Failed to update the model index: {}".format(e))
+
+            if len(changed) > 0:
+                for root in changed:
+                    roots[root].update_paths()
+                with self.lock:
+                    self.generation += 1
+                logging.debug("model index updated for {}".format(", ".join(changed)))
+            if len(changed) > 0 or save:
+                self.save()
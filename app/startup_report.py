@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+
+class StartupReport:
+    """
+    Timings of the startup steps: the prestartup scripts and imports of the
+    custom node packs (including the ones imported lazily on first use), the
+    import time of every module when --profile-startup is used and the time
+    the server took to start listening. Written as JSON with --startup-report.
+    """
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+        self.custom_nodes = []
+        self.imports = []
+        self.ready_time = None
+
+    def add_custom_node(self, phase, module_path, seconds, success, **extra):
+        entry = {"phase": phase, "path": module_path, "seconds": seconds, "success": success}
+        entry.update(extra)
+        with self.lock:
+            self.custom_nodes.append(entry)
+
+    def add_import(self, name, seconds, self_seconds):
+        with self.lock:
+            self.imports.append({"module": name, "seconds": seconds, "self_seconds": self_seconds})
+
+    def slowest_imports(self, count=None):
+        with self.lock:
+            imports = sorted(self.imports, key=lambda x: x["self_seconds"], reverse=True)
+        return imports[:count] if count is not None else imports
+
+    def mark_ready(self):
+        self.ready_time = time.perf_counter() - self.start_time
+
+    def as_dict(self):
+        with self.lock:
+            custom_nodes = list(self.custom_nodes)
+        imports = self.slowest_imports()
+        totals = {}
+        for x in custom_nodes:
+            totals[x["phase"]] = totals.get(x["phase"], 0.0) + x["seconds"]
+        return {
+            "ready_time": self.ready_time,
+            "phase_totals": totals,
+            "custom_nodes": custom_nodes,
+            "imports": imports,
+        }
+
+    def save(self, path):
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.as_dict(), f, indent=2)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning("Failed to write the startup report {}: {}".format(path, e))
+
+class TimedLoader:
+    def __init__(self, profiler, loader):
+        self.profiler = profiler
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self.profiler.stack()
+        # time spent importing other modules while this one runs, subtracted to get its self time
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            seconds = time.perf_counter() - start
+            children = stack.pop()
+            if len(stack) > 0:
+                stack[-1] += seconds
+            if getattr(module, "__loader__", None) is self:
+                module.__loader__ = self.loader
+            spec = getattr(module, "__spec__", None)
+            if spec is not None and spec.loader is self:
+                spec.loader = self.loader
+            self.profiler.report.add_import(module.__name__, seconds, seconds - children)
+
+class ImportProfiler:
+    """
+    Records how long every module imported while it is started takes to
+    import, like python -X importtime but into the startup report. It is a
+    finder at the front of sys.meta_path that asks the other finders for the
+    spec and wraps its loader to time exec_module.
+    """
+    def __init__(self, report):
+        self.report = report
+        self.local = threading.local()
+
+    def stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = TimedLoader(self, spec.loader)
+            return spec
+        return None
+
+    def start(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+report = StartupReport()
+import_profiler = ImportProfiler(report)
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+
+def render_preview(file, path, image_format, quality, channel):
+    with Image.open(file) as img:
+        if image_format in ['jpeg'] or channel == 'rgb':
+            img = img.convert("RGB")
+        img.save(path, format=image_format, quality=quality)
+
+def render_rgb(file, path):
+    with Image.open(file) as img:
+        if img.mode == "RGBA":
+            r, g, b, a = img.split()
+            new_img = Image.merge('RGB', (r, g, b))
+        else:
+            new_img = img.convert("RGB")
+        new_img.save(path, format='PNG')
+
+def render_alpha(file, path):
+    with Image.open(file) as img:
+        if img.mode == "RGBA":
+            _, _, _, a = img.split()
+        else:
+            a = Image.new('L', img.size, 255)
+
+        # alpha img
+        alpha_img = Image.new('RGBA', img.size)
+        alpha_img.putalpha(a)
+        alpha_img.save(path, format='PNG')
+
+class ViewCache:
+    """
+    On disk LRU cache of the images /view derives from output files (previews,
+    rgb only and alpha only versions). Entries are keyed by the source file,
+    its mtime and the variant so a file that is overwritten gets new ones.
+
+    Cached images get the mtime of their source so the Last-Modified and ETag
+    headers sent with them stay the same when they are rendered again.
+    """
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.rendering = {}
+        os.makedirs(self.directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.size += size
+
+    def entry_name(self, file, stat, variant):
+        key = repr((os.path.abspath(file), stat.st_mtime_ns, stat.st_size, variant))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + "." + variant[1]
+
+    def get(self, file, variant):
+        """
+        Return the path of the derived image, rendering it if it isn't cached.
+        variant is ("preview", format, quality, channel), ("rgb", "png") or ("a", "png").
+        Blocks, run it on a worker thread.
+        """
+        stat = os.stat(file)
+        name = self.entry_name(file, stat, variant)
+        path = os.path.join(self.directory, name)
+        while True:
+            with self.lock:
+                if name in self.entries and os.path.exists(path):
+                    self.entries.move_to_end(name)
+                    return path
+                event = self.rendering.get(name, None)
+                if event is None:
+                    event = self.rendering[name] = threading.Event()
+                    break
+            # another thread is rendering the same image
+            event.wait()
+
+        temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            # the temp directory can be cleaned while the server runs
+            os.makedirs(self.directory, exist_ok=True)
+            if variant[0] == "preview":
+                render_preview(file, temp_path, variant[1], variant[2], variant[3])
+            elif variant[0] == "rgb":
+                render_rgb(file, temp_path)
+            else:
+                render_alpha(file, temp_path)
+            os.utime(temp_path, ns=(time.time_ns(), stat.st_mtime_ns))
+            os.replace(temp_path, path)
+            with self.lock:
+                self.size -= self.entries.pop(name, 0)
+                self.entries[name] = os.path.getsize(path)
+                self.size += self.entries[name]
+                self.evict()
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            with self.lock:
+                self.rendering.pop(name).set()
+        return path
+
+    def evict(self):
+        while self.size > self.max_size and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                logging.warning("Failed to remove cached view {}: {}".format(name, e))
@@ -31,6 +31,20 @@ class EnumAction(argparse.Action):
         setattr(namespace, self.dest, value)
 
 
+def client_weight(value):
+    """Argparse type for CLIENT_ID=WEIGHT, returns (client_id, weight)."""
+    client_id, sep, weight = value.rpartition("=")
+    if sep == "" or client_id == "":
+        raise argparse.ArgumentTypeError(f"'{value}' is not CLIENT_ID=WEIGHT")
+    try:
+        weight = float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"the weight of '{value}' is not a number")
+    if not weight > 0:
+        raise argparse.ArgumentTypeError(f"the weight of '{value}' must be greater than 0")
+    return (client_id, weight)
+
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--listen", type=str, default="127.0.0.1", metavar="IP", nargs="?", const="0.0.0.0", help="Specify the IP address to listen on (default: 127.0.0.1). If --listen is provided without an argument, it defaults to 0.0.0.0. (listens on all)")
@@ -112,6 +126,35 @@ parser.add_argument("--dont-print-server", action="store_true", help="Don't prin
 parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test for CI.")
 parser.add_argument("--windows-standalone-build", action="store_true", help="Windows standalone build: Enable convenient things that most people using the standalone windows build will probably enjoy (like auto opening the page on startup).")
 
+parser.add_argument("--cache-lru", type=int, default=0, metavar="N", help="Keep up to N node results from previous prompts in an LRU cache keyed by node signature. May use more RAM/VRAM.")
+
+parser.add_argument("--parallel-cpu-nodes", type=int, default=0, metavar="N", help="Run up to N independent nodes that declare THREAD_SAFE (CPU bound image and mask ops) at the same time on a thread pool. Other nodes still run one at a time.")
+
+parser.add_argument("--prompt-workers", type=str, default=None, metavar="TAG", nargs="+", help="Start one prompt worker with its own executor per TAG (for example: --prompt-workers cpu cpu cuda:0). Prompts posted with a \"worker_tag\" only run on the workers with that tag, the others run on any worker. Nodes that aren't THREAD_SAFE (model loading, sampling) still run one at a time across all workers.")
+
+parser.add_argument("--batch-prompts", type=int, default=1, metavar="N", help="Take up to N queued prompts that only differ in the inputs of nodes with a BATCH_FUNCTION and run those nodes for all of them in one batched call.")
+
+parser.add_argument("--stream-lists", action="store_true", help="When a node is mapped over a list, run the chain of list mapped nodes after it one list element at a time so intermediate lists aren't held in memory and the first results are saved early.")
+
+parser.add_argument("--queue-journal", type=str, default=None, metavar="PATH", help="Log the changes to the prompt queue to the file at PATH so pending and running prompts are queued again when the server is restarted.")
+parser.add_argument("--priority-classes", type=str, default=["high", "normal", "low"], metavar="NAME", nargs="+", help="Names of the priority classes prompts can be queued in with \"priority_class\", highest first. Prompts without one go in \"normal\" (or the last class if there is no \"normal\").")
+parser.add_argument("--client-weights", type=client_weight, default=[], metavar="CLIENT_ID=WEIGHT", nargs="+", help="Share of the prompts started for these clients when several clients have prompts queued in the same priority class. The default weight is 1.")
+parser.add_argument("--max-queue-per-client", type=int, default=0, metavar="N", help="Reject new prompts with 429 when their client_id already has N prompts queued. 0 means no limit.")
+
+parser.add_argument("--history-memory-size", type=int, default=10000, metavar="N", help="Number of prompt history items kept in memory.")
+parser.add_argument("--history-db", type=str, default=None, metavar="PATH", help="Also store the prompt history in a SQLite database at PATH. Items that don't fit in memory are read back from it instead of being dropped.")
+
+parser.add_argument("--image-workers", type=int, default=2, metavar="N", help="Number of threads that decode and encode images for /view and /upload/mask.")
+parser.add_argument("--view-cache-size", type=int, default=512, metavar="MB", help="Size of the on disk cache of the previews and channel images /view generates.")
+
+parser.add_argument("--model-index", type=str, default=None, metavar="PATH", help="Keep an index of the files in the model folders in the file at PATH and list the models from it instead of walking the folders on every lookup. The index is kept up to date with watchdog when it is installed and by checking the folders for changes every --model-index-poll seconds.")
+parser.add_argument("--model-index-poll", type=float, default=10.0, metavar="SECONDS", help="How often the folders in the model index are checked for changes.")
+
+parser.add_argument("--parallel-custom-nodes", type=int, default=1, metavar="N", help="Import up to N custom node packs at the same time at startup. Only the packs --custom-node-manifests found to do nothing else than register nodes when imported are imported in parallel, the others are imported one at a time in the usual order. They are still registered in the usual order and the packs that fail to import are imported again one at a time.")
+parser.add_argument("--custom-node-manifests", type=str, default=None, metavar="PATH", help="Cache the nodes every custom node pack registers in the file at PATH. Packs whose files didn't change since are not imported at startup but when one of their nodes is first used, except the ones that do more than register nodes when imported (add server routes or on_prompt handlers, register model folders, patch ComfyUI modules...).")
+parser.add_argument("--startup-report", type=str, default=None, metavar="PATH", help="Write the time taken by the prestartup scripts and custom node imports and the time until the server was listening as JSON to the file at PATH.")
+parser.add_argument("--profile-startup", action="store_true", help="Time the import of every module until the server is listening, log the slowest ones and add them to the --startup-report.")
+
 parser.add_argument("--disable-metadata", action="store_true", help="Disable saving prompt metadata in files.")
 
 parser.add_argument("--multi-user", action="store_true", help="Enables per-user storage.")
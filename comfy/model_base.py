@@ -1,8 +1,6 @@
 import torch
 import logging
 from comfy.ldm.modules.diffusionmodules.openaimodel import UNetModel, Timestep
-from comfy.ldm.cascade.stage_c import StageC
-from comfy.ldm.cascade.stage_b import StageB
 from comfy.ldm.modules.encoders.noise_aug_modules import CLIPEmbeddingNoiseAugmentation
 from comfy.ldm.modules.diffusionmodules.upscaling import ImageConcatWithNoiseAugmentation
 import comfy.model_management
@@ -511,6 +509,7 @@ class SDXL_instructpix2pix(IP2P, SDXL):
 
 class StableCascade_C(BaseModel):
     def __init__(self, model_config, model_type=ModelType.STABLE_CASCADE, device=None):
+        from comfy.ldm.cascade.stage_c import StageC
         super().__init__(model_config, model_type, device=device, unet_model=StageC)
         self.diffusion_model.eval().requires_grad_(False)
 
@@ -540,6 +539,7 @@ class StableCascade_C(BaseModel):
 
 class StableCascade_B(BaseModel):
     def __init__(self, model_config, model_type=ModelType.STABLE_CASCADE, device=None):
+        from comfy.ldm.cascade.stage_b import StageB
         super().__init__(model_config, model_type, device=device, unet_model=StageB)
         self.diffusion_model.eval().requires_grad_(False)
 
@@ -1,5 +1,4 @@
 from .k_diffusion import sampling as k_diffusion_sampling
-from .extra_samplers import uni_pc
 import torch
 import collections
 from comfy import model_management
@@ -679,8 +678,10 @@ def calculate_sigmas(model_sampling, scheduler_name, steps):
 
 def sampler_object(name):
     if name == "uni_pc":
+        from .extra_samplers import uni_pc
         sampler = KSAMPLER(uni_pc.sample_unipc)
     elif name == "uni_pc_bh2":
+        from .extra_samplers import uni_pc
         sampler = KSAMPLER(uni_pc.sample_unipc_bh2)
     elif name == "ddim":
         sampler = ksampler("euler", inpaint_options={"random": True})
@@ -4,15 +4,12 @@ import logging
 
 from comfy import model_management
 from .ldm.models.autoencoder import AutoencoderKL, AutoencodingEngine
-from .ldm.cascade.stage_a import StageA
-from .ldm.cascade.stage_c_coder import StageC_coder
 
 import yaml
 
 import comfy.utils
 
 from . import clip_vision
-from . import gligen
 from . import diffusers_convert
 from . import model_base
 from . import model_detection
@@ -183,6 +180,7 @@ class VAE:
             elif "taesd_decoder.1.weight" in sd:
                 self.first_stage_model = comfy.taesd.taesd.TAESD()
             elif "vquantizer.codebook.weight" in sd: #VQGan: stage a of stable cascade
+                from .ldm.cascade.stage_a import StageA
                 self.first_stage_model = StageA()
                 self.downscale_ratio = 4
                 self.upscale_ratio = 4
@@ -192,6 +190,7 @@ class VAE:
                 self.process_input = lambda image: image
                 self.process_output = lambda image: image
             elif "backbone.1.0.block.0.1.num_batches_tracked" in sd: #effnet: encoder for stage c latent of stable cascade
+                from .ldm.cascade.stage_c_coder import StageC_coder
                 self.first_stage_model = StageC_coder()
                 self.downscale_ratio = 32
                 self.latent_channels = 16
@@ -200,6 +199,7 @@ class VAE:
                     new_sd["encoder.{}".format(k)] = sd[k]
                 sd = new_sd
             elif "blocks.11.num_batches_tracked" in sd: #previewer: decoder for stage c latent of stable cascade
+                from .ldm.cascade.stage_c_coder import StageC_coder
                 self.first_stage_model = StageC_coder()
                 self.latent_channels = 16
                 new_sd = {}
@@ -207,6 +207,7 @@ class VAE:
                     new_sd["previewer.{}".format(k)] = sd[k]
                 sd = new_sd
             elif "encoder.backbone.1.0.block.0.1.num_batches_tracked" in sd: #combined effnet and previewer for stable cascade
+                from .ldm.cascade.stage_c_coder import StageC_coder
                 self.first_stage_model = StageC_coder()
                 self.downscale_ratio = 32
                 self.latent_channels = 16
@@ -411,6 +412,7 @@ def load_clip(ckpt_paths, embedding_directory=None, clip_type=CLIPType.STABLE_DI
     return clip
 
 def load_gligen(ckpt_path):
+    from . import gligen
     data = comfy.utils.load_torch_file(ckpt_path, safe_load=True)
     model = gligen.load_gligen(data)
     if model_management.should_use_fp16():
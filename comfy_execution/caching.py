@@ -0,0 +1,206 @@
+import hashlib
+import itertools
+import json
+import math
+import threading
+from collections import OrderedDict
+
+import nodes
+import folder_paths
+from comfy_execution.graph import is_link, postorder
+
+def is_always_changed(is_changed):
+    # IS_CHANGED returning NaN (or raising) means the node must always be re executed
+    if isinstance(is_changed, float):
+        return math.isnan(is_changed)
+    if isinstance(is_changed, (list, tuple)):
+        return any(is_always_changed(x) for x in is_changed)
+    return False
+
+def get_hidden_inputs(class_def):
+    return set(get_input_types(class_def).get("hidden", {}).values())
+
+def hidden_input_digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+class InputTypesCache:
+    """
+    INPUT_TYPES() results per node class. Many of them list model folders or the
+    input directory, those results are kept with the folders they looked up and
+    computed again once one of them changed. The results that don't look up any
+    folder can depend on anything (settings, custom node state...) so they are
+    never cached. clear() drops everything, for the results that depend on more
+    than the folders they listed.
+    """
+    def __init__(self):
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def get(self, class_def):
+        entry = self.cache.get(class_def, None)
+        if entry is not None and not folder_paths.folder_access_changed(entry[1]):
+            return entry[0]
+        with folder_paths.track_folder_access() as accesses:
+            input_types = class_def.INPUT_TYPES()
+        if len(accesses) > 0:
+            with self.lock:
+                self.cache[class_def] = (input_types, accesses)
+        return input_types
+
+    def clear(self):
+        with self.lock:
+            self.cache = {}
+
+input_types_cache = InputTypesCache()
+
+def get_input_types(class_def):
+    return input_types_cache.get(class_def)
+
+class ValidationCache:
+    """
+    Nodes that passed validation, keyed by a signature over their class_type,
+    literal inputs and the signatures of the nodes linked to them, so unchanged
+    parts of a graph aren't validated again when it is submitted again.
+    """
+    def __init__(self, max_items=10000):
+        self.max_items = max_items
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def prompt_signatures(self, prompt, node_ids):
+        signatures = {}
+        for unique_id in postorder(prompt, node_ids):
+            inputs = prompt[unique_id]['inputs']
+            signature = [prompt[unique_id]['class_type']]
+            for x in sorted(inputs.keys()):
+                value = inputs[x]
+                if is_link(value):
+                    signature.append((x, "link", signatures.get(value[0]), value[1]))
+                else:
+                    signature.append((x, repr(value)))
+            signatures[unique_id] = hashlib.sha256(repr(signature).encode("utf-8")).hexdigest()
+        return signatures
+
+    def get(self, signature, class_inputs):
+        """Return the converted inputs of a node validated before with the same INPUT_TYPES() result."""
+        with self.lock:
+            entry = self.cache.get(signature, None)
+            # INPUT_TYPES() results that aren't cached are new objects every time
+            if entry is None or (entry[0] is not class_inputs and entry[0] != class_inputs):
+                return None
+            self.cache.move_to_end(signature)
+            return entry[1]
+
+    def set(self, signature, class_inputs, inputs):
+        with self.lock:
+            self.cache[signature] = (class_inputs, dict(inputs))
+            self.cache.move_to_end(signature)
+            if len(self.cache) > self.max_items:
+                self.cache.popitem(last=False)
+
+validation_cache = ValidationCache()
+
+class OutputCache:
+    """
+    Cache of node outputs keyed by node signature instead of node id.
+
+    The signature of a node is a hash over its class_type, its IS_CHANGED result,
+    its literal inputs and the signatures of the nodes linked to its inputs. Two
+    identical subgraphs therefore share their cache entries no matter how the
+    nodes are numbered in the prompt that was submitted.
+
+    With lru_size 0 only the results belonging to the last executed prompt are
+    kept (the classic behavior), otherwise up to lru_size extra results of older
+    prompts are kept around and evicted least recently used first.
+    """
+    def __init__(self, lru_size=0):
+        self.lru_size = lru_size
+        self.cache = OrderedDict()
+        self.signatures = {}
+        self.pinned = set()
+        self.unique_counter = itertools.count()
+
+    def clear(self):
+        self.cache.clear()
+        self.signatures = {}
+        self.pinned = set()
+
+    def set_prompt(self, prompt, is_changed, extra_data=None):
+        """
+        Compute the signature of every node in the prompt.
+        is_changed(node_id) returns the IS_CHANGED result of a node or raises.
+        """
+        self.signatures = self.prompt_signatures(prompt, is_changed, extra_data)
+
+    def prompt_signatures(self, prompt, is_changed, extra_data=None):
+        signatures = {}
+        # PROMPT and EXTRA_PNGINFO are the same for every node, only hash them once
+        hidden_digests = {}
+        for node_id in postorder(prompt, prompt.keys()):
+            signatures[node_id] = self.compute_signature(prompt, node_id, is_changed, signatures, extra_data or {}, hidden_digests)
+        return signatures
+
+    def compute_signature(self, prompt, unique_id, is_changed, signatures, extra_data, hidden_digests):
+        class_type = prompt[unique_id]['class_type']
+        class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+        inputs = prompt[unique_id]['inputs']
+
+        changed = ""
+        if hasattr(class_def, 'IS_CHANGED'):
+            try:
+                changed = is_changed(unique_id)
+            except Exception:
+                changed = float("NaN")
+            if is_always_changed(changed):
+                changed = ("always_changed", next(self.unique_counter))
+
+        signature = [class_type, repr(changed)]
+        hidden = get_hidden_inputs(class_def)
+        if "UNIQUE_ID" in hidden:
+            signature.append(("unique_id", unique_id))
+        for kind, value in (("PROMPT", prompt), ("EXTRA_PNGINFO", extra_data.get("extra_pnginfo", None))):
+            if kind in hidden:
+                if kind not in hidden_digests:
+                    hidden_digests[kind] = hidden_input_digest(value)
+                signature.append((kind.lower(), hidden_digests[kind]))
+        for x in sorted(inputs.keys()):
+            value = inputs[x]
+            if is_link(value):
+                signature.append((x, "link", signatures.get(value[0]), value[1]))
+            else:
+                signature.append((x, repr(value)))
+        return hashlib.sha256(repr(signature).encode("utf-8")).hexdigest()
+
+    def get(self, node_id):
+        signature = self.signatures.get(node_id, None)
+        if signature is None or signature not in self.cache:
+            return None
+        self.cache.move_to_end(signature)
+        return self.cache[signature]
+
+    def set(self, node_id, output_data, output_ui):
+        self.set_signature(self.signatures[node_id], output_data, output_ui)
+
+    def set_signature(self, signature, output_data, output_ui):
+        self.cache[signature] = (output_data, output_ui)
+        self.cache.move_to_end(signature)
+
+    def has_signature(self, signature):
+        return signature in self.cache
+
+    def pin(self, signatures):
+        """Keep these results until unpin() even if they don't belong to the current prompt."""
+        self.pinned.update(signatures)
+
+    def unpin(self):
+        self.pinned = set()
+
+    def clean_unused(self):
+        current = set(self.signatures.values()) | self.pinned
+        extra = len([s for s in self.cache if s not in current])
+        for signature in list(self.cache.keys()):
+            if extra <= self.lru_size:
+                break
+            if signature not in current:
+                self.cache.pop(signature)
+                extra -= 1
@@ -0,0 +1,236 @@
+import heapq
+
+def is_link(value):
+    return isinstance(value, list) and len(value) == 2
+
+def get_linked_nodes(prompt, unique_id, skip_inputs=()):
+    out = []
+    inputs = prompt[unique_id]['inputs']
+    for x in inputs:
+        if x in skip_inputs:
+            continue
+        if is_link(inputs[x]) and inputs[x][0] not in out:
+            out.append(inputs[x][0])
+    return out
+
+def postorder(prompt, node_ids, visited=None, linked_nodes=None):
+    """
+    Yield node_ids and every node linked upstream of them, dependencies first.
+
+    The order is the one a depth first recursion over the node inputs would
+    produce but the walk uses an explicit stack so long chains don't hit the
+    recursion limit. Nodes in visited are neither yielded nor expanded.
+    linked_nodes(unique_id) can be given to follow only some of the links.
+    """
+    if visited is None:
+        visited = set()
+    if linked_nodes is None:
+        linked_nodes = lambda x: get_linked_nodes(prompt, x)
+    for start in node_ids:
+        if start in visited or start not in prompt:
+            continue
+        visited.add(start)
+        stack = [(start, iter(linked_nodes(start)))]
+        while len(stack) > 0:
+            unique_id, linked = stack[-1]
+            for input_unique_id in linked:
+                if input_unique_id not in visited and input_unique_id in prompt:
+                    visited.add(input_unique_id)
+                    stack.append((input_unique_id, iter(linked_nodes(input_unique_id))))
+                    break
+            else:
+                stack.pop()
+                yield unique_id
+
+class DependencyCycleError(Exception):
+    pass
+
+class ExecutionList:
+    """
+    Scheduler for the nodes that have to run to produce a set of outputs.
+
+    The dependency graph of the uncached nodes is built once when the outputs
+    are added. The output that depends on the least amount of unexecuted nodes
+    is always worked on first and its nodes are taken from a ready queue of
+    nodes whose inputs are all available, in the order a depth first walk of
+    the inputs would run them. Several nodes can be staged at once when they
+    are run concurrently, each one must be passed to complete_node_execution
+    when it's done. While staged nodes block the current output, ready nodes
+    of the other outputs can be staged too (see stage_node_execution).
+
+    Lazy inputs (lazy_inputs(unique_id) returns their names) are not followed
+    when the graph is built, the nodes behind them are only added with
+    add_dependencies once the node asks for them.
+    """
+    def __init__(self, prompt, cached, lazy_inputs=None):
+        self.prompt = prompt
+        self.cached = set(cached)
+        self.lazy_inputs = lazy_inputs
+        self.outputs = []
+        self.order = {}
+        self.required_by = {}
+        self.dependents = {}
+        self.pending_inputs = {}
+        self.remaining = {}
+        self.executed = set()
+        self.current_output = None
+        self.ready = []
+        self.staged = set()
+        # nodes of any output whose inputs are all available and that aren't staged yet
+        self.unblocked = set()
+
+    def get_eager_links(self, unique_id):
+        skip_inputs = ()
+        if self.lazy_inputs is not None:
+            skip_inputs = self.lazy_inputs(unique_id)
+        return get_linked_nodes(self.prompt, unique_id, skip_inputs)
+
+    def add_node(self, unique_id):
+        self.dependents.setdefault(unique_id, set())
+        linked = [x for x in self.get_eager_links(unique_id) if x in self.prompt and x not in self.cached]
+        self.pending_inputs[unique_id] = len([x for x in linked if x not in self.executed])
+        if self.pending_inputs[unique_id] == 0:
+            self.unblocked.add(unique_id)
+        for input_unique_id in linked:
+            self.dependents.setdefault(input_unique_id, set()).add(unique_id)
+
+    def add_output(self, node_id):
+        if node_id in self.order:
+            return
+        order = {}
+        for unique_id in postorder(self.prompt, [node_id], visited=set(self.cached), linked_nodes=self.get_eager_links):
+            order[unique_id] = len(order)
+            self.required_by.setdefault(unique_id, []).append(node_id)
+            if unique_id not in self.pending_inputs:
+                self.add_node(unique_id)
+        self.order[node_id] = order
+        self.remaining[node_id] = len(order)
+        self.outputs.append(node_id)
+
+    def add_dependencies(self, unique_id, input_unique_ids):
+        """
+        Put a staged node back to wait for more nodes, used for the lazy inputs
+        it asked for. The nodes needed to compute them are added to the outputs
+        that need unique_id.
+        """
+        self.staged.discard(unique_id)
+        visited = self.cached | self.executed
+        for output in self.required_by[unique_id]:
+            order = self.order[output]
+            for new_unique_id in postorder(self.prompt, input_unique_ids, visited=set(visited), linked_nodes=self.get_eager_links):
+                if new_unique_id in order:
+                    continue
+                order[new_unique_id] = len(order)
+                self.required_by.setdefault(new_unique_id, []).append(output)
+                self.remaining[output] += 1
+                if new_unique_id not in self.pending_inputs:
+                    self.add_node(new_unique_id)
+                if output == self.current_output and self.pending_inputs[new_unique_id] == 0 and new_unique_id not in self.staged:
+                    heapq.heappush(self.ready, (order[new_unique_id], new_unique_id))
+
+        for input_unique_id in input_unique_ids:
+            if input_unique_id in visited or unique_id in self.dependents.setdefault(input_unique_id, set()):
+                continue
+            self.dependents[input_unique_id].add(unique_id)
+            self.pending_inputs[unique_id] += 1
+
+        if self.pending_inputs[unique_id] == 0:
+            self.unblocked.add(unique_id)
+            # it can come from another output when it was staged while the current one was blocked
+            order = self.order.get(self.current_output, {})
+            if unique_id in order:
+                heapq.heappush(self.ready, (order[unique_id], unique_id))
+
+    def is_empty(self):
+        return all(self.remaining[x] == 0 for x in self.outputs)
+
+    def select_output(self):
+        #always execute the output that depends on the least amount of unexecuted nodes first
+        candidates = [(self.remaining[x], x) for x in self.outputs if self.remaining[x] > 0]
+        if len(candidates) == 0:
+            self.current_output = None
+            return
+        self.current_output = min(candidates)[1]
+        order = self.order[self.current_output]
+        self.ready = [(order[x], x) for x in order if x in self.unblocked]
+        heapq.heapify(self.ready)
+
+    def stage_node_execution(self, accept=None):
+        """
+        Return the next node to run or None if the staged nodes have to complete
+        first. Raises DependencyCycleError if the nodes left for the current
+        output can never become ready.
+
+        When nothing of the current output is ready because of staged nodes and
+        accept is given, a ready node of another output that accept(unique_id)
+        is true for is returned instead so it can run next to them.
+        """
+        while True:
+            if self.current_output is None or self.remaining[self.current_output] == 0:
+                self.select_output()
+                if self.current_output is None:
+                    return None
+            if len(self.ready) == 0:
+                if len(self.staged) > 0:
+                    if accept is not None:
+                        return self.stage_other_output(accept)
+                    return None
+                blocked = [x for x in self.order[self.current_output] if x not in self.executed]
+                raise DependencyCycleError("Dependency cycle detected between nodes: {}".format(", ".join(map(str, blocked))))
+            unique_id = heapq.heappop(self.ready)[1]
+            # nodes streamed together with an upstream node are completed before they are staged
+            if unique_id in self.unblocked:
+                self.unblocked.discard(unique_id)
+                self.staged.add(unique_id)
+                return unique_id
+
+    def stage_other_output(self, accept):
+        # the node the outputs closest to completion would run first
+        best = None
+        for unique_id in self.unblocked:
+            if not accept(unique_id):
+                continue
+            key = (min((self.remaining[x], self.order[x][unique_id]) for x in self.required_by[unique_id]), unique_id)
+            if best is None or key < best:
+                best = key
+        if best is None:
+            return None
+        unique_id = best[1]
+        self.unblocked.discard(unique_id)
+        self.staged.add(unique_id)
+        return unique_id
+
+    def complete_node_execution(self, unique_id):
+        self.staged.discard(unique_id)
+        self.unblocked.discard(unique_id)
+        self.executed.add(unique_id)
+        for output in self.required_by.get(unique_id, []):
+            self.remaining[output] -= 1
+        order = self.order.get(self.current_output, {})
+        for dependent in self.dependents.get(unique_id, []):
+            self.pending_inputs[dependent] -= 1
+            if self.pending_inputs[dependent] == 0 and dependent not in self.executed:
+                self.unblocked.add(dependent)
+                if dependent in order:
+                    heapq.heappush(self.ready, (order[dependent], dependent))
+
+    def get_plan(self):
+        """Return the node ids in the order they will run if nothing fails."""
+        plan_list = ExecutionList(self.prompt, self.cached, self.lazy_inputs)
+        plan_list.outputs = list(self.outputs)
+        plan_list.order = self.order
+        plan_list.required_by = self.required_by
+        plan_list.dependents = self.dependents
+        plan_list.pending_inputs = dict(self.pending_inputs)
+        plan_list.remaining = dict(self.remaining)
+        plan_list.executed = set(self.executed)
+        plan_list.unblocked = set(self.unblocked) | self.staged
+        plan = []
+        try:
+            while not plan_list.is_empty():
+                unique_id = plan_list.stage_node_execution()
+                plan.append(unique_id)
+                plan_list.complete_node_execution(unique_id)
+        except DependencyCycleError:
+            pass
+        return plan
@@ -0,0 +1,147 @@
+import copy
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class PromptHistory:
+    """
+    History of executed prompts.
+
+    The newest max_items entries are kept in memory. When db_path is set every
+    entry is also appended to a SQLite database so older entries are spilled to
+    disk instead of being dropped, lookups by prompt_id use the primary key
+    index and pages are read with a single range query. An entry that can't be
+    written stays in memory and is written again with the next one.
+
+    It has its own lock so the prompt queue doesn't have to hold its mutex while
+    an entry is written.
+    """
+    def __init__(self, max_items, db_path=None):
+        self.max_items = max_items
+        self.lock = threading.RLock()
+        # the newest entries of the database, or all of them without one
+        self.entries = OrderedDict()
+        # entries that failed to be written, they come after the ones in the database
+        self.unsaved = OrderedDict()
+        self.db = None
+        self.count = 0
+        if db_path is not None:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS history (seq INTEGER PRIMARY KEY AUTOINCREMENT, prompt_id TEXT UNIQUE NOT NULL, entry TEXT NOT NULL)")
+            self.db.commit()
+            self.count = self.db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            logging.info("Loaded {} history items from {}".format(self.count, db_path))
+
+    def __len__(self):
+        if self.db is None:
+            return len(self.entries)
+        return self.count + len(self.unsaved)
+
+    def __contains__(self, prompt_id):
+        with self.lock:
+            if prompt_id in self.entries or prompt_id in self.unsaved:
+                return True
+            if self.db is not None:
+                return self.db.execute("SELECT 1 FROM history WHERE prompt_id = ?", (prompt_id,)).fetchone() is not None
+            return False
+
+    def add(self, prompt_id, entry):
+        with self.lock:
+            self.entries.pop(prompt_id, None)
+            self.unsaved.pop(prompt_id, None)
+            if self.db is None:
+                self.entries[prompt_id] = entry
+                self.trim()
+                return
+            self.unsaved[prompt_id] = entry
+            self.save(prompt_id)
+
+    def save(self, prompt_id):
+        """Write the unsaved entries, prompt_id is the one that was just added."""
+        for x, entry in list(self.unsaved.items()):
+            try:
+                data = json.dumps(entry)
+                deleted = self.db.execute("DELETE FROM history WHERE prompt_id = ?", (x,)).rowcount
+                self.db.execute("INSERT INTO history (prompt_id, entry) VALUES (?, ?)", (x, data))
+                self.db.commit()
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                self.db.rollback()
+                if x == prompt_id:
+                    logging.error("Failed to save history item {} to disk, it is only kept in memory: {}".format(x, e))
+                continue
+            del self.unsaved[x]
+            self.count += 1 - deleted
+            self.entries[x] = entry
+            self.trim()
+
+    def trim(self):
+        while len(self.entries) > max(self.max_items, 0):
+            self.entries.popitem(last=False)
+
+    def get(self, prompt_id):
+        with self.lock:
+            if prompt_id in self.entries:
+                return copy.deepcopy(self.entries[prompt_id])
+            if prompt_id in self.unsaved:
+                return copy.deepcopy(self.unsaved[prompt_id])
+            if self.db is not None:
+                row = self.db.execute("SELECT entry FROM history WHERE prompt_id = ?", (prompt_id,)).fetchone()
+                if row is not None:
+                    return json.loads(row[0])
+            return None
+
+    def get_page(self, max_items=None, offset=-1):
+        with self.lock:
+            total = len(self)
+            if offset < 0:
+                if max_items is not None:
+                    offset = total - max_items
+                offset = max(offset, 0)
+            end = total if max_items is None else min(total, offset + max_items)
+
+            out = {}
+            # the in memory entries are always the newest ones of the database
+            saved = total - len(self.unsaved)
+            memory_start = saved - len(self.entries)
+            if offset < memory_start and self.db is not None:
+                rows = self.db.execute("SELECT prompt_id, entry FROM history ORDER BY seq LIMIT ? OFFSET ?", (min(end, memory_start) - offset, offset))
+                for prompt_id, entry in rows:
+                    out[prompt_id] = json.loads(entry)
+
+            start = max(offset, memory_start) - memory_start
+            stop = min(end, saved) - memory_start
+            if stop > start:
+                if start > len(self.entries) - stop:
+                    # walk from the newest end when the page is closer to it
+                    page = list(itertools.islice(reversed(self.entries.items()), len(self.entries) - stop, len(self.entries) - start))
+                    page.reverse()
+                else:
+                    page = itertools.islice(self.entries.items(), start, stop)
+                for prompt_id, entry in page:
+                    out[prompt_id] = entry
+
+            if end > saved:
+                for prompt_id, entry in itertools.islice(self.unsaved.items(), max(offset, saved) - saved, end - saved):
+                    out[prompt_id] = entry
+            return out
+
+    def delete(self, prompt_id):
+        with self.lock:
+            self.entries.pop(prompt_id, None)
+            self.unsaved.pop(prompt_id, None)
+            if self.db is not None:
+                cursor = self.db.execute("DELETE FROM history WHERE prompt_id = ?", (prompt_id,))
+                self.db.commit()
+                self.count -= cursor.rowcount
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.unsaved = OrderedDict()
+            if self.db is not None:
+                self.db.execute("DELETE FROM history")
+                self.db.commit()
+                self.count = 0
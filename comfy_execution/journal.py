@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import threading
+import time
+
+class QueueJournal:
+    """
+    Append only log of the changes made to the prompt queue so the prompts that
+    were pending or running are queued again after a crash or restart.
+
+    record() only hands the change to a writer thread that appends everything
+    recorded since its last write and fsyncs once per batch, at most every
+    sync_interval seconds, so queueing prompts stays cheap when many of them are
+    posted at once. The log is compacted on startup and whenever most of it is
+    about prompts that are done.
+    """
+    def __init__(self, path, sync_interval=0.1, compact_size=10000):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_size = compact_size
+        self.cond = threading.Condition()
+        self.records = []
+        self.lines = 0
+        self.recorded = 0
+        self.synced = 0
+
+        # the prompts that were running are queued again as pending ones
+        self.recovered = self.load()
+        self.live = {item[1]: False for item, started in self.recovered}
+        self.rewrite([(item, False) for item, started in self.recovered])
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.thread = threading.Thread(target=self.writer, daemon=True, name="queue_journal")
+        self.thread.start()
+
+    def load(self):
+        """Return (item, started) for the prompts the log says are pending or running, oldest first."""
+        items = {}
+        started = set()
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op, data = json.loads(line)
+                except ValueError:
+                    # the last line can be cut short by a crash
+                    logging.warning("Ignoring an incomplete line in the queue journal {}".format(self.path))
+                    continue
+                if op == "put":
+                    items[data[1]] = tuple(data)
+                elif op == "start":
+                    started.add(data)
+                elif op in ("done", "delete"):
+                    items.pop(data, None)
+                    started.discard(data)
+                elif op == "clear":
+                    items = {x: items[x] for x in items if x in started}
+        return [(items[x], x in started) for x in items]
+
+    def rewrite(self, items):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for item, started in items:
+                f.write(json.dumps(["put", item]) + "\n")
+                if started:
+                    f.write(json.dumps(["start", item[1]]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.lines = len(items) + len([x for x in items if x[1]])
+
+    def record(self, op, data):
+        with self.cond:
+            if op == "put":
+                self.live[data[1]] = False
+            elif op == "start":
+                self.live[data] = True
+            elif op in ("done", "delete"):
+                self.live.pop(data, None)
+            elif op == "clear":
+                self.live = {x: True for x in self.live if self.live[x]}
+            self.records.append((op, data))
+            self.recorded += 1
+            self.cond.notify()
+
+    def flush(self, timeout=None):
+        """Wait until everything recorded so far is on disk, returns False if it timed out."""
+        with self.cond:
+            target = self.recorded
+            return self.cond.wait_for(lambda: self.synced >= target, timeout)
+
+    def writer(self):
+        while True:
+            with self.cond:
+                while len(self.records) == 0:
+                    self.cond.wait()
+                records = self.records
+                self.records = []
+                compact = self.lines + len(records) > max(self.compact_size, 4 * len(self.live))
+
+            try:
+                for op, data in records:
+                    self.file.write(json.dumps([op, data]) + "\n")
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.lines += len(records)
+                if compact:
+                    self.file.close()
+                    self.rewrite(self.load())
+                    self.file = open(self.path, "a", encoding="utf-8")
+            except (OSError, TypeError, ValueError) as e:
+                logging.warning("Failed to write the queue journal {}: {}".format(self.path, e))
+
+            with self.cond:
+                self.synced += len(records)
+                self.cond.notify_all()
+            time.sleep(self.sync_interval)
@@ -0,0 +1,145 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+def get_peak_rss():
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+def get_gpu_memory():
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda.memory_allocated()
+
+def get_gpu_peak_memory():
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda.max_memory_allocated()
+
+def describe_value(value):
+    shape = getattr(value, "shape", None)
+    if shape is None:
+        return None
+    out = {"type": type(value).__name__, "shape": list(shape)}
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        out["bytes"] = value.element_size() * value.nelement()
+    elif hasattr(value, "nbytes"):
+        out["bytes"] = int(value.nbytes)
+    return out
+
+def describe_outputs(output_data):
+    """Shape and size of the tensors (or dicts of tensors like latents) in each output of a node."""
+    out = []
+    for values in output_data:
+        described = []
+        for value in values:
+            if isinstance(value, dict):
+                value = value.get("samples", None)
+            d = describe_value(value)
+            if d is not None:
+                described.append(d)
+        out.append(described)
+    return out
+
+def difference(end, start):
+    if end is None or start is None:
+        return None
+    return end - start
+
+class NodeProfiler:
+    """
+    Records how long every node of a prompt took, how much memory it used,
+    the size of what it returned and whether its outputs came from the cache.
+
+    Peak RSS and GPU memory are process wide, when nodes run concurrently the
+    deltas of a node include the work of the nodes running next to it.
+
+    The outputs a batched call computed for the other prompts of a batch are
+    recorded as batched with their share of its wall time instead of cached.
+    """
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        # node signature -> share of the batched call that computed its outputs
+        self.batched = {}
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+        self.start_time = time.perf_counter()
+
+    def add_record(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def record_batch(self, signatures, wall_time, batch_size):
+        with self.lock:
+            for signature in signatures:
+                self.batched[signature] = {"wall_time": wall_time, "batch_size": batch_size}
+
+    def clear_batch(self):
+        with self.lock:
+            self.batched = {}
+
+    def record_cached(self, unique_id, class_type, output_data, signature=None):
+        with self.lock:
+            batched = self.batched.pop(signature, None)
+        record = {
+            "node_id": unique_id,
+            "class_type": class_type,
+            "cached": batched is None,
+        }
+        if batched is not None:
+            record["batched"] = True
+            record.update(batched)
+        record["outputs"] = describe_outputs(output_data)
+        self.add_record(record)
+
+    @contextmanager
+    def profile(self, unique_id, class_type):
+        """
+        Measure the node executed inside the with block. The yielded dict can
+        be given the node outputs under "output_data".
+        """
+        record = {"node_id": unique_id, "class_type": class_type, "cached": False}
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        rss_start = get_peak_rss()
+        gpu_start = get_gpu_memory()
+        if gpu_start is not None:
+            torch.cuda.reset_peak_memory_stats()
+        try:
+            yield record
+        finally:
+            wall_end = time.perf_counter()
+            record["start"] = wall_start - self.start_time
+            record["wall_time"] = wall_end - wall_start
+            record["cpu_time"] = time.thread_time() - cpu_start
+            record["peak_rss_delta"] = difference(get_peak_rss(), rss_start)
+            record["gpu_memory_delta"] = difference(get_gpu_memory(), gpu_start)
+            record["gpu_peak_memory_delta"] = difference(get_gpu_peak_memory(), gpu_start)
+            output_data = record.pop("output_data", None)
+            if output_data is not None:
+                record["outputs"] = describe_outputs(output_data)
+            self.add_record(record)
+
+    def get_records(self):
+        with self.lock:
+            return list(self.records)
@@ -0,0 +1,216 @@
+import heapq
+import time
+
+class ClientQueue:
+    """
+    Heap of the prompts of one client. Removed prompts are only marked dead and
+    dropped when they reach the top, the heap is rebuilt when most of it is dead.
+    """
+    def __init__(self):
+        self.heap = []
+        self.dead = set()
+
+    def __len__(self):
+        return len(self.heap) - len(self.dead)
+
+    def __iter__(self):
+        return (x for x in self.heap if x[1] not in self.dead)
+
+    def push(self, item):
+        if item[1] in self.dead:
+            self.compact()
+        heapq.heappush(self.heap, item)
+
+    def compact(self):
+        self.heap = [x for x in self.heap if x[1] not in self.dead]
+        heapq.heapify(self.heap)
+        self.dead = set()
+
+    def peek(self):
+        while len(self.heap) > 0 and self.heap[0][1] in self.dead:
+            self.dead.discard(heapq.heappop(self.heap)[1])
+        if len(self.heap) == 0:
+            return None
+        return self.heap[0]
+
+    def discard(self, prompt_id):
+        self.dead.add(prompt_id)
+        if len(self.dead) > len(self.heap) // 2:
+            self.compact()
+
+class PriorityClass:
+    def __init__(self, name):
+        self.name = name
+        self.clients = {}
+        self.passes = {}
+        self.virtual_time = 0.0
+        self.length = 0
+        self.submitted = 0
+        self.started = 0
+        self.total_wait = 0.0
+
+class FairQueue:
+    """
+    Pending prompts grouped by priority class and by client_id.
+
+    Classes are served in strict priority order. Inside a class the clients take
+    turns with weighted round robin: every client has a pass value that grows
+    by 1 / weight each time one of its prompts is started and the client with
+    the lowest pass goes next, so a client that queues hundreds of prompts
+    doesn't starve the others. Prompts queued with "front" (a negative number)
+    skip the rotation of their class.
+
+    Prompts are indexed by prompt_id so looking one up or removing it doesn't
+    scan the queue.
+    """
+    def __init__(self, classes, default_class, client_weights=None):
+        self.order = [PriorityClass(x) for x in classes]
+        self.classes = {x.name: x for x in self.order}
+        self.default_class = default_class
+        self.client_weights = client_weights or {}
+        self.client_depths = {}
+        self.enqueue_times = {}
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(list(self.index.values()))
+
+    def __contains__(self, prompt_id):
+        return prompt_id in self.index
+
+    def get(self, prompt_id):
+        return self.index.get(prompt_id, None)
+
+    def class_of(self, item):
+        return self.classes[item[3].get("priority_class", self.default_class)]
+
+    def client_depth(self, client_id):
+        return self.client_depths.get(client_id, 0)
+
+    def push(self, item):
+        priority_class = self.class_of(item)
+        client_id = item[3].get("client_id", None)
+        items = priority_class.clients.get(client_id, None)
+        if items is None:
+            # a client that comes back doesn't get to use the turns it didn't take while it was idle
+            items = priority_class.clients[client_id] = ClientQueue()
+            priority_class.passes[client_id] = priority_class.virtual_time
+        items.push(item)
+        self.index[item[1]] = item
+        priority_class.length += 1
+        priority_class.submitted += 1
+        self.client_depths[client_id] = self.client_depths.get(client_id, 0) + 1
+        self.enqueue_times[item[1]] = time.time()
+
+    def remove(self, item):
+        """Remove a queued prompt, returns the time it was queued at."""
+        del self.index[item[1]]
+        priority_class = self.class_of(item)
+        client_id = item[3].get("client_id", None)
+        items = priority_class.clients[client_id]
+        items.discard(item[1])
+        if len(items) == 0:
+            del priority_class.clients[client_id]
+            del priority_class.passes[client_id]
+        priority_class.length -= 1
+        self.client_depths[client_id] -= 1
+        if self.client_depths[client_id] == 0:
+            del self.client_depths[client_id]
+        return self.enqueue_times.pop(item[1], None)
+
+    def best_in_class(self, priority_class, accept=None):
+        """The client and prompt of priority_class that goes next, None if accept(item) isn't true for any."""
+        best = None
+        for client_id, items in priority_class.clients.items():
+            if accept is None:
+                candidate = items.peek()
+            else:
+                candidate = min((x for x in items if accept(x)), default=None)
+                if candidate is None:
+                    continue
+            if candidate[0] < 0:
+                key = (0, candidate[0], 0.0, candidate)
+            else:
+                key = (1, 0, priority_class.passes[client_id], candidate)
+            if best is None or key < best[0]:
+                best = (key, client_id, candidate)
+        if best is None:
+            return None
+        return best[1], best[2]
+
+    def start(self, priority_class, client_id, item):
+        """Remove a prompt that is about to run and charge its client for the turn."""
+        client_pass = priority_class.passes[client_id]
+        priority_class.virtual_time = max(priority_class.virtual_time, client_pass)
+        enqueue_time = self.remove(item)
+        if client_id in priority_class.passes:
+            priority_class.passes[client_id] = client_pass + 1.0 / self.client_weights.get(client_id, 1.0)
+        priority_class.started += 1
+        if enqueue_time is not None:
+            priority_class.total_wait += time.time() - enqueue_time
+        return item
+
+    def pop(self, accept=None):
+        """Remove and return the next prompt accept(item) is true for, None if there isn't any."""
+        for priority_class in self.order:
+            best = self.best_in_class(priority_class, accept)
+            if best is not None:
+                return self.start(priority_class, *best)
+        return None
+
+    def pop_compatible(self, compatible, max_items, accept=None):
+        """
+        Remove and return up to max_items prompts compatible(item) is true for, to
+        run together with a prompt returned by pop().
+
+        They are taken in the order pop() would have returned them and their
+        clients are charged a turn each. Only the highest class that still has
+        prompts accept(item) is true for is looked at, a compatible prompt of a
+        lower class doesn't get to run before the prompts waiting above it.
+        """
+        out = []
+        while len(out) < max_items:
+            priority_class = None
+            for x in self.order:
+                if any(accept is None or accept(i) for items in x.clients.values() for i in items):
+                    priority_class = x
+                    break
+            if priority_class is None:
+                break
+            best = self.best_in_class(priority_class, lambda x: (accept is None or accept(x)) and compatible(x))
+            if best is None:
+                break
+            out.append(self.start(priority_class, *best))
+        return out
+
+    def clear(self):
+        for priority_class in self.order:
+            priority_class.clients = {}
+            priority_class.passes = {}
+            priority_class.length = 0
+        self.client_depths = {}
+        self.enqueue_times = {}
+        self.index = {}
+
+    def get_metrics(self):
+        now = time.time()
+        out = {}
+        for priority_class in self.order:
+            oldest = None
+            for items in priority_class.clients.values():
+                for x in items:
+                    t = self.enqueue_times.get(x[1], None)
+                    if t is not None and (oldest is None or t < oldest):
+                        oldest = t
+            out[priority_class.name] = {
+                "pending": priority_class.length,
+                "clients": len(priority_class.clients),
+                "submitted": priority_class.submitted,
+                "started": priority_class.started,
+                "average_wait": priority_class.total_wait / priority_class.started if priority_class.started > 0 else 0.0,
+                "oldest_wait": now - oldest if oldest is not None else 0.0,
+            }
+        return out
@@ -7,7 +7,6 @@ from PIL.PngImagePlugin import PngInfo
 
 import numpy as np
 import json
-import os
 
 MAX_RESOLUTION = nodes.MAX_RESOLUTION
 
@@ -24,6 +23,7 @@ class ImageCrop:
     FUNCTION = "crop"
 
     CATEGORY = "image/transform"
+    THREAD_SAFE = True
 
     def crop(self, image, width, height, x, y):
         x = min(x, image.shape[2] - 1)
@@ -43,6 +43,7 @@ class RepeatImageBatch:
     FUNCTION = "repeat"
 
     CATEGORY = "image/batch"
+    THREAD_SAFE = True
 
     def repeat(self, image, amount):
         s = image.repeat((amount, 1,1,1))
@@ -59,6 +60,7 @@ class ImageFromBatch:
     FUNCTION = "frombatch"
 
     CATEGORY = "image/batch"
+    THREAD_SAFE = True
 
     def frombatch(self, image, batch_index, length):
         s_in = image
@@ -94,6 +96,7 @@ class SaveAnimatedWEBP:
     OUTPUT_NODE = True
 
     CATEGORY = "image/animation"
+    THREAD_SAFE = True
 
     def save_images(self, images, fps, filename_prefix, lossless, quality, method, num_frames=0, prompt=None, extra_pnginfo=None):
         method = self.methods.get(method)
@@ -121,8 +124,8 @@ class SaveAnimatedWEBP:
 
         c = len(pil_images)
         for i in range(0, c, num_frames):
-            file = f"{filename}_{counter:05}_.webp"
-            pil_images[i].save(os.path.join(full_output_folder, file), save_all=True, duration=int(1000.0/fps), append_images=pil_images[i + 1:i + num_frames], exif=metadata, lossless=lossless, quality=quality, method=method)
+            with folder_paths.create_save_file(full_output_folder, filename, counter, lambda c: f"{filename}_{c:05}_.webp") as (f, file, counter):
+                pil_images[i].save(f, format="WEBP", save_all=True, duration=int(1000.0/fps), append_images=pil_images[i + 1:i + num_frames], exif=metadata, lossless=lossless, quality=quality, method=method)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -156,6 +159,7 @@ class SaveAnimatedPNG:
     OUTPUT_NODE = True
 
     CATEGORY = "image/animation"
+    THREAD_SAFE = True
 
     def save_images(self, images, fps, compress_level, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
@@ -176,8 +180,8 @@ class SaveAnimatedPNG:
                 for x in extra_pnginfo:
                     metadata.add(b"comf", x.encode("latin-1", "strict") + b"\0" + json.dumps(extra_pnginfo[x]).encode("latin-1", "strict"), after_idat=True)
 
-        file = f"{filename}_{counter:05}_.png"
-        pil_images[0].save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=compress_level, save_all=True, duration=int(1000.0/fps), append_images=pil_images[1:])
+        with folder_paths.create_save_file(full_output_folder, filename, counter, lambda c: f"{filename}_{c:05}_.png") as (f, file, counter):
+            pil_images[0].save(f, format="PNG", pnginfo=metadata, compress_level=compress_level, save_all=True, duration=int(1000.0/fps), append_images=pil_images[1:])
         results.append({
             "filename": file,
             "subfolder": subfolder,
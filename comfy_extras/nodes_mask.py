@@ -85,6 +85,7 @@ class ImageCompositeMasked:
     FUNCTION = "composite"
 
     CATEGORY = "image"
+    THREAD_SAFE = True
 
     def composite(self, destination, source, x, y, resize_source, mask = None):
         destination = destination.clone().movedim(-1, 1)
@@ -101,6 +102,7 @@ class MaskToImage:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "mask_to_image"
@@ -120,6 +122,7 @@ class ImageToMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "image_to_mask"
@@ -140,6 +143,7 @@ class ImageColorToMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "image_to_mask"
@@ -162,6 +166,7 @@ class SolidMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
 
@@ -181,6 +186,7 @@ class InvertMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
 
@@ -204,6 +210,7 @@ class CropMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
 
@@ -228,6 +235,7 @@ class MaskComposite:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
 
@@ -275,6 +283,7 @@ class FeatherMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
 
@@ -318,6 +327,7 @@ class GrowMask:
         }
     
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
 
@@ -352,6 +362,7 @@ class ThresholdMask:
         }
 
     CATEGORY = "mask"
+    THREAD_SAFE = True
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "image_to_mask"
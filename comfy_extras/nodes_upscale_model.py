@@ -1,5 +1,4 @@
 import os
-from comfy_extras.chainner_models import model_loading
 from comfy import model_management
 import torch
 import comfy.utils
@@ -16,6 +15,7 @@ class UpscaleModelLoader:
     CATEGORY = "loaders"
 
     def load_model(self, model_name):
+        from comfy_extras.chainner_models import model_loading
         model_path = folder_paths.get_full_path("upscale_models", model_name)
         sd = comfy.utils.load_torch_file(model_path, safe_load=True)
         if "module.layers.0.residual_group.blocks.0.norm1.weight" in sd:
@@ -2,15 +2,28 @@ import sys
 import copy
 import logging
 import threading
-import heapq
+import time
 import traceback
 import inspect
+import contextlib
+import concurrent.futures
 from typing import List, Literal, NamedTuple, Optional
 
 import nodes
+import comfy_execution.caching
+import comfy_execution.graph
+import comfy_execution.history
+import comfy_execution.journal
+import comfy_execution.profiler
+import comfy_execution.scheduler
+from comfy.cli_args import args
+
+# nodes that aren't THREAD_SAFE (model loading, sampling...) share the model management state,
+# the prompt workers run them under this lock so only one of them runs at a time in the process
+serial_node_lock = threading.RLock()
 
 def get_input_data(inputs, class_def, unique_id, outputs={}, prompt={}, extra_data={}):
-    valid_inputs = class_def.INPUT_TYPES()
+    valid_inputs = comfy_execution.caching.get_input_types(class_def)
     input_data_all = {}
     for x in inputs:
         input_data = inputs[x]
@@ -37,7 +50,14 @@ def get_input_data(inputs, class_def, unique_id, outputs={}, prompt={}, extra_da
                 input_data_all[x] = [unique_id]
     return input_data_all
 
-def map_node_over_list(obj, input_data_all, func, allow_interrupt=False):
+# get a slice of inputs, repeat last input when list isn't long enough
+def slice_dict(d, i):
+    d_new = dict()
+    for k,v in d.items():
+        d_new[k] = v[i if len(v) > i else -1]
+    return d_new
+
+def map_node_over_list(obj, input_data_all, func, allow_interrupt=False, prompt_id=None):
     # check if node wants the lists
     input_is_list = False
     if hasattr(obj, "INPUT_IS_LIST"):
@@ -47,36 +67,30 @@ def map_node_over_list(obj, input_data_all, func, allow_interrupt=False):
         max_len_input = 0
     else:
         max_len_input = max([len(x) for x in input_data_all.values()])
-     
-    # get a slice of inputs, repeat last input when list isn't long enough
-    def slice_dict(d, i):
-        d_new = dict()
-        for k,v in d.items():
-            d_new[k] = v[i if len(v) > i else -1]
-        return d_new
-    
+
     results = []
     if input_is_list:
         if allow_interrupt:
-            nodes.before_node_execution()
+            nodes.before_node_execution(prompt_id)
         results.append(getattr(obj, func)(**input_data_all))
     elif max_len_input == 0:
         if allow_interrupt:
-            nodes.before_node_execution()
+            nodes.before_node_execution(prompt_id)
         results.append(getattr(obj, func)())
     else:
         for i in range(max_len_input):
             if allow_interrupt:
-                nodes.before_node_execution()
+                nodes.before_node_execution(prompt_id)
             results.append(getattr(obj, func)(**slice_dict(input_data_all, i)))
     return results
 
-def get_output_data(obj, input_data_all):
-    
+def get_output_data(obj, input_data_all, prompt_id=None):
+    return_values = map_node_over_list(obj, input_data_all, obj.FUNCTION, allow_interrupt=True, prompt_id=prompt_id)
+    return merge_output_data(obj, return_values)
+
+def merge_output_data(obj, return_values):
     results = []
     uis = []
-    return_values = map_node_over_list(obj, input_data_all, obj.FUNCTION, allow_interrupt=True)
-
     for r in return_values:
         if isinstance(r, dict):
             if 'ui' in r:
@@ -105,6 +119,82 @@ def get_output_data(obj, input_data_all):
         ui = {k: [y for x in uis for y in x[k]] for k in uis[0].keys()}
     return output, ui
 
+def worker_accepts(worker_tag):
+    """Filter for the queued prompts a worker with worker_tag can run, None when it can run all of them."""
+    if worker_tag is None:
+        return None
+    # untagged prompts run on any worker, tagged ones only on workers with the same tag
+    return lambda x: x[3].get("worker_tag", None) in (None, worker_tag)
+
+def batch_compatible(item, other):
+    """
+    Two queued prompts can be batched when their graphs are identical except for
+    the literal inputs of nodes that define a BATCH_FUNCTION.
+    """
+    if item[4] != other[4] or item[3].get("worker_tag", None) != other[3].get("worker_tag", None):
+        return False
+    prompt = item[2]
+    other_prompt = other[2]
+    if prompt.keys() != other_prompt.keys():
+        return False
+    batched = False
+    for node_id in prompt:
+        class_type = prompt[node_id]['class_type']
+        if class_type != other_prompt[node_id]['class_type']:
+            return False
+        inputs = prompt[node_id]['inputs']
+        other_inputs = other_prompt[node_id]['inputs']
+        if inputs == other_inputs:
+            continue
+        if not hasattr(nodes.NODE_CLASS_MAPPINGS[class_type], "BATCH_FUNCTION") or inputs.keys() != other_inputs.keys():
+            return False
+        for x in inputs:
+            if isinstance(inputs[x], list) or isinstance(other_inputs[x], list):
+                if inputs[x] != other_inputs[x]:
+                    return False
+        batched = True
+    return batched
+
+def get_batched_output_data(obj, class_def, unique_id, input_data_all, outputs, output_cache, batch, profiler=None, prompt_id=None):
+    """
+    Run the node for this prompt and for the same node of the other prompts in the batch
+    with one call to its BATCH_FUNCTION. The results of the other prompts are put in the
+    output cache so they are cache hits when those prompts are executed, their profiles
+    get a share of the time the call took.
+    """
+    signature = output_cache.signatures[unique_id]
+    siblings = []
+    for prompt, extra_data, signatures in batch:
+        sibling_signature = signatures.get(unique_id, None)
+        if sibling_signature is None or sibling_signature == signature or output_cache.has_signature(sibling_signature):
+            continue
+        if sibling_signature in [x[0] for x in siblings]:
+            continue
+        inputs = prompt[unique_id]['inputs']
+        # the linked inputs have to be the ones already computed for this prompt
+        same_links = True
+        for x in inputs:
+            if isinstance(inputs[x], list):
+                if signatures.get(inputs[x][0], None) != output_cache.signatures.get(inputs[x][0], None):
+                    same_links = False
+        if same_links:
+            siblings.append((sibling_signature, get_input_data(inputs, class_def, unique_id, outputs, prompt, extra_data)))
+
+    all_inputs = [input_data_all] + [x[1] for x in siblings]
+    if len(siblings) == 0 or getattr(obj, "INPUT_IS_LIST", False) or any(len(v) != 1 for d in all_inputs for v in d.values()):
+        return get_output_data(obj, input_data_all, prompt_id)
+
+    nodes.before_node_execution(prompt_id)
+    start = time.perf_counter()
+    return_values = getattr(obj, obj.BATCH_FUNCTION)([{k: v[0] for k, v in d.items()} for d in all_inputs])
+    if profiler is not None:
+        profiler.record_batch([x[0] for x in siblings], (time.perf_counter() - start) / len(all_inputs), len(all_inputs))
+    results = [merge_output_data(obj, [r]) for r in return_values]
+    for (sibling_signature, _), result in zip(siblings, results[1:]):
+        output_cache.set_signature(sibling_signature, *result)
+        output_cache.pin([sibling_signature])
+    return results[0]
+
 def format_value(x):
     if x is None:
         return None
@@ -113,7 +203,8 @@ def format_value(x):
     else:
         return str(x)
 
-def recursive_execute(server, prompt, outputs, current_item, extra_data, executed, prompt_id, outputs_ui, object_storage):
+def execute_node(server, prompt, outputs, current_item, extra_data, executed, prompt_id, outputs_ui, object_storage, output_cache, batch=None, profiler=None):
+    # every linked input has been computed by the time the scheduler stages this node
     unique_id = current_item
     inputs = prompt[unique_id]['inputs']
     class_type = prompt[unique_id]['class_type']
@@ -121,18 +212,6 @@ def recursive_execute(server, prompt, outputs, current_item, extra_data, execute
     if unique_id in outputs:
         return (True, None, None)
 
-    for x in inputs:
-        input_data = inputs[x]
-
-        if isinstance(input_data, list):
-            input_unique_id = input_data[0]
-            output_index = input_data[1]
-            if input_unique_id not in outputs:
-                result = recursive_execute(server, prompt, outputs, input_unique_id, extra_data, executed, prompt_id, outputs_ui, object_storage)
-                if result[0] is not True:
-                    # Another node failed further upstream
-                    return result
-
     input_data_all = None
     try:
         input_data_all = get_input_data(inputs, class_def, unique_id, outputs, prompt, extra_data)
@@ -140,125 +219,249 @@ def recursive_execute(server, prompt, outputs, current_item, extra_data, execute
             server.last_node_id = unique_id
             server.send_sync("executing", { "node": unique_id, "prompt_id": prompt_id }, server.client_id)
 
-        obj = object_storage.get((unique_id, class_type), None)
-        if obj is None:
-            obj = class_def()
-            object_storage[(unique_id, class_type)] = obj
+        obj = get_node_object(object_storage, unique_id, class_type)
 
-        output_data, output_ui = get_output_data(obj, input_data_all)
+        with profiler.profile(unique_id, class_type) if profiler is not None else contextlib.nullcontext({}) as record:
+            if batch is not None and hasattr(class_def, "BATCH_FUNCTION"):
+                output_data, output_ui = get_batched_output_data(obj, class_def, unique_id, input_data_all, outputs, output_cache, batch, profiler, prompt_id)
+            else:
+                output_data, output_ui = get_output_data(obj, input_data_all, prompt_id)
+            record["output_data"] = output_data
         outputs[unique_id] = output_data
+        output_cache.set(unique_id, output_data, output_ui)
         if len(output_ui) > 0:
             outputs_ui[unique_id] = output_ui
             if server.client_id is not None:
                 server.send_sync("executed", { "node": unique_id, "output": output_ui, "prompt_id": prompt_id }, server.client_id)
     except Exception as ex:
-        typ, _, tb = sys.exc_info()
-        exception_type = full_type_name(typ)
-        input_data_formatted = {}
-        if input_data_all is not None:
-            input_data_formatted = {}
-            for name, inputs in input_data_all.items():
-                input_data_formatted[name] = [format_value(x) for x in inputs]
-
-        output_data_formatted = {}
-        for node_id, node_outputs in outputs.items():
-            output_data_formatted[node_id] = [[format_value(x) for x in l] for l in node_outputs]
-
-        logging.error(f"!!! Exception during processing!!! {ex}")
-        logging.error(traceback.format_exc())
-
-        error_details = {
-            "node_id": unique_id,
-            "exception_message": str(ex),
-            "exception_type": exception_type,
-            "traceback": traceback.format_tb(tb),
-            "current_inputs": input_data_formatted,
-            "current_outputs": output_data_formatted
-        }
-        return (False, error_details, ex)
+        return (False, execution_error_details(unique_id, ex, input_data_all, outputs), ex)
 
     executed.add(unique_id)
 
     return (True, None, None)
 
-def recursive_will_execute(prompt, outputs, current_item, memo={}):
-    unique_id = current_item
-
-    if unique_id in memo:
-        return memo[unique_id]
-
+def execution_error_details(unique_id, ex, input_data_all, outputs):
+    typ, _, tb = sys.exc_info()
+    exception_type = full_type_name(typ)
+    input_data_formatted = {}
+    if input_data_all is not None:
+        input_data_formatted = {}
+        for name, inputs in input_data_all.items():
+            input_data_formatted[name] = [format_value(x) for x in inputs]
+
+    output_data_formatted = {}
+    for node_id, node_outputs in list(outputs.items()):
+        output_data_formatted[node_id] = [[format_value(x) for x in l] for l in node_outputs]
+
+    logging.error(f"!!! Exception during processing!!! {ex}")
+    logging.error(traceback.format_exc())
+
+    return {
+        "node_id": unique_id,
+        "exception_message": str(ex),
+        "exception_type": exception_type,
+        "traceback": traceback.format_tb(tb),
+        "current_inputs": input_data_formatted,
+        "current_outputs": output_data_formatted
+    }
+
+def get_lazy_inputs(class_def):
+    lazy = set()
+    valid_inputs = comfy_execution.caching.get_input_types(class_def)
+    for group in ("required", "optional"):
+        for x, info in valid_inputs.get(group, {}).items():
+            if len(info) > 1 and isinstance(info[1], dict) and info[1].get("lazy", False):
+                lazy.add(x)
+    return lazy
+
+def get_node_object(object_storage, unique_id, class_type):
+    obj = object_storage.get((unique_id, class_type), None)
+    if obj is None:
+        obj = nodes.NODE_CLASS_MAPPINGS[class_type]()
+        object_storage[(unique_id, class_type)] = obj
+    return obj
+
+def get_lazy_requests(prompt, outputs, unique_id, extra_data, object_storage):
+    """
+    Ask a node with lazy inputs which of them it needs. Lazy inputs that are
+    not computed yet are passed to check_lazy_status() as None. Returns the
+    ids of the linked nodes that still have to run.
+    """
     inputs = prompt[unique_id]['inputs']
-    will_execute = []
-    if unique_id in outputs:
+    class_type = prompt[unique_id]['class_type']
+    class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+    lazy = get_lazy_inputs(class_def)
+    if not any(x in lazy and comfy_execution.graph.is_link(inputs[x]) and inputs[x][0] not in outputs for x in inputs):
         return []
 
-    for x in inputs:
-        input_data = inputs[x]
-        if isinstance(input_data, list):
-            input_unique_id = input_data[0]
-            output_index = input_data[1]
-            if input_unique_id not in outputs:
-                will_execute += recursive_will_execute(prompt, outputs, input_unique_id, memo)
+    obj = get_node_object(object_storage, unique_id, class_type)
+    if not hasattr(obj, "check_lazy_status"):
+        return []
+    input_data_all = get_input_data(inputs, class_def, unique_id, outputs, prompt, extra_data)
+    requested = []
+    for result in map_node_over_list(obj, input_data_all, "check_lazy_status"):
+        if result is not None:
+            requested.extend(result)
+
+    needed = []
+    for x in requested:
+        if x not in lazy or x not in inputs or not comfy_execution.graph.is_link(inputs[x]):
+            continue
+        input_unique_id = inputs[x][0]
+        if input_unique_id not in outputs and input_unique_id not in needed:
+            needed.append(input_unique_id)
+    return needed
+
+def is_streamable(class_def):
+    # the node must be called once per list element and return one element per output
+    if getattr(class_def, "INPUT_IS_LIST", False) or any(getattr(class_def, "OUTPUT_IS_LIST", [])):
+        return False
+    return not hasattr(class_def, "BATCH_FUNCTION") and len(get_lazy_inputs(class_def)) == 0
+
+def get_consumers(prompt):
+    consumers = {}
+    for unique_id in prompt:
+        inputs = prompt[unique_id]['inputs']
+        for x in inputs:
+            if comfy_execution.graph.is_link(inputs[x]):
+                consumers.setdefault(inputs[x][0], []).append(unique_id)
+    return consumers
+
+def get_stream_region(prompt, unique_id, outputs, consumers, execution_list):
+    """
+    Find the nodes that can be run one list element at a time together with
+    unique_id: the nodes downstream of it that are mapped over its outputs and
+    whose other linked inputs are already computed and not longer than the list.
+    Returns (region, length) with the nodes in execution order, or None.
+    """
+    class_def = nodes.NODE_CLASS_MAPPINGS[prompt[unique_id]['class_type']]
+    if not is_streamable(class_def):
+        return None
+    input_data_all = get_input_data(prompt[unique_id]['inputs'], class_def, unique_id, outputs, prompt)
+    length = max([len(x) for x in input_data_all.values()], default=0)
+    if length < 2:
+        return None
 
-    memo[unique_id] = will_execute + [unique_id]
-    return memo[unique_id]
+    region = [unique_id]
+    members = set(region)
+    candidates = list(consumers.get(unique_id, []))
+    while len(candidates) > 0:
+        candidate = candidates.pop(0)
+        if candidate in members or candidate in outputs or candidate in execution_list.executed or candidate in execution_list.staged:
+            continue
+        if candidate not in execution_list.required_by:
+            continue
+        if not is_streamable(nodes.NODE_CLASS_MAPPINGS[prompt[candidate]['class_type']]):
+            continue
+        inputs = prompt[candidate]['inputs']
+        ready = True
+        for x in inputs:
+            value = inputs[x]
+            if not comfy_execution.graph.is_link(value) or value[0] in members:
+                continue
+            if value[0] not in outputs or len(outputs[value[0]][value[1]]) > length:
+                ready = False
+                break
+        if not ready:
+            # it is seen again if one of its other inputs joins the region
+            continue
+        region.append(candidate)
+        members.add(candidate)
+        candidates.extend(consumers.get(candidate, []))
 
-def recursive_output_delete_if_changed(prompt, old_prompt, outputs, current_item):
-    unique_id = current_item
+    if len(region) < 2:
+        return None
+    return region, length
+
+def execute_stream(server, prompt, outputs, region, length, consumers, extra_data, executed, prompt_id, outputs_ui, object_storage, output_cache, profiler=None):
+    """
+    Run the nodes of a region found by get_stream_region() one list element at
+    a time. The results of nodes only used inside the region are dropped after
+    each element, the others (and output nodes) are merged like get_output_data()
+    would.
+    """
+    members = set(region)
+    keep = set(x for x in region if not all(c in members for c in consumers.get(x, [None])))
+    objs = {}
+    inputs_all = {}
+    returns = {}
+    unique_id = region[0]
+    input_data_all = None
+    try:
+        for unique_id in region:
+            class_type = prompt[unique_id]['class_type']
+            class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+            inputs_all[unique_id] = get_input_data(prompt[unique_id]['inputs'], class_def, unique_id, outputs, prompt, extra_data)
+            objs[unique_id] = get_node_object(object_storage, unique_id, class_type)
+            returns[unique_id] = []
+
+        with profiler.profile(region[0], prompt[region[0]]['class_type']) if profiler is not None else contextlib.nullcontext({}) as record:
+            record["streamed_nodes"] = region[1:]
+            for i in range(length):
+                elements = {}
+                for unique_id in region:
+                    obj = objs[unique_id]
+                    input_data_all = inputs_all[unique_id]
+                    if i == 0 and server.client_id is not None:
+                        server.last_node_id = unique_id
+                        server.send_sync("executing", { "node": unique_id, "prompt_id": prompt_id }, server.client_id)
+                    kwargs = slice_dict(input_data_all, i)
+                    inputs = prompt[unique_id]['inputs']
+                    for x in inputs:
+                        if comfy_execution.graph.is_link(inputs[x]) and inputs[x][0] in elements:
+                            kwargs[x] = elements[inputs[x][0]][inputs[x][1]]
+                    nodes.before_node_execution(prompt_id)
+                    r = getattr(obj, obj.FUNCTION)(**kwargs)
+                    output_data, _ = merge_output_data(obj, [r])
+                    elements[unique_id] = [o[0] for o in output_data]
+                    if unique_id not in keep:
+                        r = {"ui": r["ui"]} if isinstance(r, dict) and "ui" in r else {}
+                    returns[unique_id].append(r)
+            input_data_all = None
+
+            for unique_id in region:
+                output_data, output_ui = merge_output_data(objs[unique_id], returns[unique_id])
+                if unique_id in keep:
+                    outputs[unique_id] = output_data
+                    output_cache.set(unique_id, output_data, output_ui)
+                    if unique_id == region[0]:
+                        record["output_data"] = output_data
+                if len(output_ui) > 0:
+                    outputs_ui[unique_id] = output_ui
+                    if server.client_id is not None:
+                        server.send_sync("executed", { "node": unique_id, "output": output_ui, "prompt_id": prompt_id }, server.client_id)
+    except Exception as ex:
+        return (False, execution_error_details(unique_id, ex, input_data_all, outputs), ex)
+
+    executed.update(region)
+    return (True, None, None)
+
+def dependency_cycle_error(node_id, ex):
+    return {
+        "node_id": node_id,
+        "exception_message": str(ex),
+        "exception_type": full_type_name(type(ex)),
+        "traceback": [],
+        "current_inputs": {},
+        "current_outputs": {},
+    }
+
+def get_is_changed(prompt, unique_id):
     inputs = prompt[unique_id]['inputs']
     class_type = prompt[unique_id]['class_type']
     class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-
-    is_changed_old = ''
-    is_changed = ''
-    to_delete = False
-    if hasattr(class_def, 'IS_CHANGED'):
-        if unique_id in old_prompt and 'is_changed' in old_prompt[unique_id]:
-            is_changed_old = old_prompt[unique_id]['is_changed']
-        if 'is_changed' not in prompt[unique_id]:
-            input_data_all = get_input_data(inputs, class_def, unique_id, outputs)
-            if input_data_all is not None:
-                try:
-                    #is_changed = class_def.IS_CHANGED(**input_data_all)
-                    is_changed = map_node_over_list(class_def, input_data_all, "IS_CHANGED")
-                    prompt[unique_id]['is_changed'] = is_changed
-                except:
-                    to_delete = True
-        else:
-            is_changed = prompt[unique_id]['is_changed']
-
-    if unique_id not in outputs:
-        return True
-
-    if not to_delete:
-        if is_changed != is_changed_old:
-            to_delete = True
-        elif unique_id not in old_prompt:
-            to_delete = True
-        elif inputs == old_prompt[unique_id]['inputs']:
-            for x in inputs:
-                input_data = inputs[x]
-
-                if isinstance(input_data, list):
-                    input_unique_id = input_data[0]
-                    output_index = input_data[1]
-                    if input_unique_id in outputs:
-                        to_delete = recursive_output_delete_if_changed(prompt, old_prompt, outputs, input_unique_id)
-                    else:
-                        to_delete = True
-                    if to_delete:
-                        break
-        else:
-            to_delete = True
-
-    if to_delete:
-        d = outputs.pop(unique_id)
-        del d
-    return to_delete
+    # linked inputs are covered by the upstream signatures so they are passed as None
+    input_data_all = get_input_data(inputs, class_def, unique_id)
+    return map_node_over_list(class_def, input_data_all, "IS_CHANGED")
 
 class PromptExecutor:
     def __init__(self, server):
         self.server = server
+        self.output_cache = comfy_execution.caching.OutputCache(lru_size=args.cache_lru)
+        self.profiler = comfy_execution.profiler.NodeProfiler()
+        self.thread_pool = None
+        if args.parallel_cpu_nodes > 0:
+            self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.parallel_cpu_nodes, thread_name_prefix="node_worker")
         self.reset()
 
     def reset(self):
@@ -267,49 +470,96 @@ class PromptExecutor:
         self.outputs_ui = {}
         self.status_messages = []
         self.success = True
-        self.old_prompt = {}
+        self.execution_plan = []
+        self.batch = None
+        self.output_cache.clear()
 
     def add_message(self, event, data, broadcast: bool):
         self.status_messages.append((event, data))
         if self.server.client_id is not None or broadcast:
             self.server.send_sync(event, data, self.server.client_id)
 
+    def set_batch(self, items):
+        """
+        Prepare to execute a group of queued prompts made by PromptQueue.get_compatible(),
+        they must then be executed one after another before calling clear_batch().
+        """
+        self.batch = []
+        for item in items:
+            prompt = item[2]
+            signatures = self.output_cache.prompt_signatures(prompt, lambda x, prompt=prompt: get_is_changed(prompt, x), item[3])
+            self.batch.append((prompt, item[3], signatures))
+
+    def clear_batch(self):
+        self.batch = None
+        self.output_cache.unpin()
+        self.profiler.clear_batch()
+
+    def execute_node_in_context(self, context, node_args):
+        # pool threads report progress for the prompt of the worker that dispatched them
+        self.server.set_execution_context(context)
+        return execute_node(*node_args)
+
+    def complete_running_nodes(self, execution_list, running, block, wait_all=False):
+        """
+        Mark the nodes that finished on the thread pool as completed. Returns
+        (error, ex) for the first node that failed after waiting for the
+        remaining ones, None otherwise.
+        """
+        if len(running) == 0:
+            return None
+        if wait_all:
+            done, _ = concurrent.futures.wait(running)
+        elif block:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+        else:
+            done = [f for f in running if f.done()]
+
+        failure = None
+        for future in done:
+            node_id = running.pop(future)
+            success, error, ex = future.result()
+            if success is not True:
+                if failure is None:
+                    failure = (error, ex)
+                continue
+            execution_list.complete_node_execution(node_id)
+
+        if failure is not None:
+            self.success = False
+            self.complete_running_nodes(execution_list, running, block=True, wait_all=True)
+        return failure
+
     def handle_execution_error(self, prompt_id, prompt, current_outputs, executed, error, ex):
         node_id = error["node_id"]
         class_type = prompt[node_id]["class_type"]
 
         # First, send back the status to the frontend depending
         # on the exception type
-        mes = {
-            "prompt_id": prompt_id,
-            "node_id": node_id,
-            "node_type": class_type,
-            "executed": list(executed),
-
-            "exception_message": error["exception_message"],
-            "exception_type": error["exception_type"],
-            "traceback": error["traceback"],
-            "current_inputs": error["current_inputs"],
-            "current_outputs": error["current_outputs"],
-        }
-        self.add_message("execution_error", mes, broadcast=False)
-
-        
-        # Next, remove the subsequent outputs since they will not be executed
-        to_delete = []
-        for o in self.outputs:
-            if (o not in current_outputs) and (o not in executed):
-                to_delete += [o]
-                if o in self.old_prompt:
-                    d = self.old_prompt.pop(o)
-                    del d
-        for o in to_delete:
-            d = self.outputs.pop(o)
-            del d
+        if isinstance(ex, nodes.InterruptProcessingException):
+            mes = {
+                "prompt_id": prompt_id,
+                "node_id": node_id,
+                "node_type": class_type,
+                "executed": list(executed),
+            }
+            self.add_message("execution_interrupted", mes, broadcast=True)
+        else:
+            mes = {
+                "prompt_id": prompt_id,
+                "node_id": node_id,
+                "node_type": class_type,
+                "executed": list(executed),
+
+                "exception_message": error["exception_message"],
+                "exception_type": error["exception_type"],
+                "traceback": error["traceback"],
+                "current_inputs": error["current_inputs"],
+                "current_outputs": error["current_outputs"],
+            }
+            self.add_message("execution_error", mes, broadcast=False)
 
     def execute(self, prompt, prompt_id, extra_data={}, execute_outputs=[]):
-        nodes.interrupt_processing(False)
-
         if "client_id" in extra_data:
             self.server.client_id = extra_data["client_id"]
         else:
@@ -317,15 +567,8 @@ class PromptExecutor:
 
         self.status_messages = []
         self.add_message("execution_start", { "prompt_id": prompt_id}, broadcast=False)
+        self.profiler.reset()
 
-        #delete cached outputs if nodes don't exist for them
-        to_delete = []
-        for o in self.outputs:
-            if o not in prompt:
-                to_delete += [o]
-        for o in to_delete:
-            d = self.outputs.pop(o)
-            del d
         to_delete = []
         for o in self.object_storage:
             if o[0] not in prompt:
@@ -338,46 +581,110 @@ class PromptExecutor:
             d = self.object_storage.pop(o)
             del d
 
+        #look up cached outputs by node signature so renumbered or resubmitted graphs reuse them
+        self.output_cache.set_prompt(prompt, lambda x: get_is_changed(prompt, x), extra_data)
+        self.outputs = {}
+        self.outputs_ui = {}
         for x in prompt:
-            recursive_output_delete_if_changed(prompt, self.old_prompt, self.outputs, x)
+            cached = self.output_cache.get(x)
+            if cached is not None:
+                self.outputs[x] = cached[0]
+                self.profiler.record_cached(x, prompt[x]['class_type'], cached[0], self.output_cache.signatures.get(x, None))
+                if len(cached[1]) > 0:
+                    self.outputs_ui[x] = cached[1]
 
         current_outputs = set(self.outputs.keys())
-        for x in list(self.outputs_ui.keys()):
-            if x not in current_outputs:
-                d = self.outputs_ui.pop(x)
-                del d
-
         self.add_message("execution_cached",
                       { "nodes": list(current_outputs) , "prompt_id": prompt_id},
                       broadcast=False)
         executed = set()
-        output_node_id = None
-        to_execute = []
-
+        execution_list = comfy_execution.graph.ExecutionList(prompt, current_outputs, lambda x: get_lazy_inputs(nodes.NODE_CLASS_MAPPINGS[prompt[x]['class_type']]))
         for node_id in list(execute_outputs):
-            to_execute += [(0, node_id)]
+            execution_list.add_output(node_id)
+        self.execution_plan = execution_list.get_plan()
+        logging.debug("Execution plan for prompt {}: {}".format(prompt_id, self.execution_plan))
+
+        consumers = get_consumers(prompt)
+        running = {}
+        while not execution_list.is_empty():
+            error = self.complete_running_nodes(execution_list, running, block=False)
+            if error is not None:
+                self.handle_execution_error(prompt_id, prompt, current_outputs, executed, *error)
+                break
+
+            accept = None
+            if self.thread_pool is not None and len(running) < args.parallel_cpu_nodes:
+                #a free pool thread can run a THREAD_SAFE node of another output while the current one waits
+                accept = lambda x: getattr(nodes.NODE_CLASS_MAPPINGS[prompt[x]['class_type']], "THREAD_SAFE", False)
+            try:
+                node_id = execution_list.stage_node_execution(accept)
+            except comfy_execution.graph.DependencyCycleError as ex:
+                self.success = False
+                error = dependency_cycle_error(execution_list.current_output, ex)
+                #nodes still running on the pool must not write their outputs after the error is reported
+                self.complete_running_nodes(execution_list, running, block=True, wait_all=True)
+                self.handle_execution_error(prompt_id, prompt, current_outputs, executed, error, ex)
+                break
+
+            if node_id is None:
+                #nothing is ready until one of the nodes running on the thread pool completes
+                error = self.complete_running_nodes(execution_list, running, block=True)
+                if error is not None:
+                    self.handle_execution_error(prompt_id, prompt, current_outputs, executed, *error)
+                    break
+                continue
+
+            class_def = nodes.NODE_CLASS_MAPPINGS[prompt[node_id]['class_type']]
+            thread_safe = getattr(class_def, "THREAD_SAFE", False)
+            try:
+                with contextlib.nullcontext() if thread_safe else serial_node_lock:
+                    lazy_requests = get_lazy_requests(prompt, self.outputs, node_id, extra_data, self.object_storage)
+            except Exception as ex:
+                self.success = False
+                error = execution_error_details(node_id, ex, None, self.outputs)
+                self.complete_running_nodes(execution_list, running, block=True, wait_all=True)
+                self.handle_execution_error(prompt_id, prompt, current_outputs, executed, error, ex)
+                break
+            if len(lazy_requests) > 0:
+                #run the nodes behind the lazy inputs it asked for first, it is staged again once they are done
+                execution_list.add_dependencies(node_id, lazy_requests)
+                continue
 
-        while len(to_execute) > 0:
-            #always execute the output that depends on the least amount of unexecuted nodes first
-            memo = {}
-            to_execute = sorted(list(map(lambda a: (len(recursive_will_execute(prompt, self.outputs, a[-1], memo)), a[-1]), to_execute)))
-            output_node_id = to_execute.pop(0)[-1]
+            if args.stream_lists and self.batch is None:
+                stream = get_stream_region(prompt, node_id, self.outputs, consumers, execution_list)
+                if stream is not None:
+                    with serial_node_lock:
+                        self.success, error, ex = execute_stream(self.server, prompt, self.outputs, stream[0], stream[1], consumers, extra_data, executed, prompt_id, self.outputs_ui, self.object_storage, self.output_cache, self.profiler)
+                    if self.success is not True:
+                        self.complete_running_nodes(execution_list, running, block=True, wait_all=True)
+                        self.handle_execution_error(prompt_id, prompt, current_outputs, executed, error, ex)
+                        break
+                    for x in stream[0]:
+                        execution_list.complete_node_execution(x)
+                    continue
+
+            node_args = (self.server, prompt, self.outputs, node_id, extra_data, executed, prompt_id, self.outputs_ui, self.object_storage, self.output_cache, self.batch, self.profiler)
+            if self.thread_pool is not None and thread_safe:
+                running[self.thread_pool.submit(self.execute_node_in_context, self.server.get_execution_context(), node_args)] = node_id
+                continue
 
             # This call shouldn't raise anything if there's an error deep in
             # the actual SD code, instead it will report the node where the
             # error was raised
-            self.success, error, ex = recursive_execute(self.server, prompt, self.outputs, output_node_id, extra_data, executed, prompt_id, self.outputs_ui, self.object_storage)
+            with contextlib.nullcontext() if thread_safe else serial_node_lock:
+                self.success, error, ex = execute_node(*node_args)
             if self.success is not True:
+                self.complete_running_nodes(execution_list, running, block=True, wait_all=True)
                 self.handle_execution_error(prompt_id, prompt, current_outputs, executed, error, ex)
                 break
+            execution_list.complete_node_execution(node_id)
 
-        for x in executed:
-            self.old_prompt[x] = copy.deepcopy(prompt[x])
+        self.output_cache.clean_unused()
         self.server.last_node_id = None
 
 
 
-def validate_inputs(prompt, item, validated):
+def validate_inputs(prompt, item, validated, signatures=None):
     unique_id = item
     if unique_id in validated:
         return validated[unique_id]
@@ -386,9 +693,18 @@ def validate_inputs(prompt, item, validated):
     class_type = prompt[unique_id]['class_type']
     obj_class = nodes.NODE_CLASS_MAPPINGS[class_type]
 
-    class_inputs = obj_class.INPUT_TYPES()
+    class_inputs = comfy_execution.caching.get_input_types(obj_class)
     required_inputs = class_inputs['required']
 
+    # widget values of nodes that passed validation before don't have to be checked again,
+    # custom VALIDATE_INPUTS functions can depend on files so those nodes are always checked
+    signature = None
+    validated_inputs = None
+    if signatures is not None and not hasattr(obj_class, "VALIDATE_INPUTS"):
+        signature = signatures.get(unique_id, None)
+        if signature is not None:
+            validated_inputs = comfy_execution.caching.validation_cache.get(signature, class_inputs)
+
     errors = []
     valid = True
 
@@ -447,7 +763,7 @@ def validate_inputs(prompt, item, validated):
                 errors.append(error)
                 continue
             try:
-                r = validate_inputs(prompt, o_id, validated)
+                r = validate_inputs(prompt, o_id, validated, signatures)
                 if r[0] is False:
                     # `r` will be set in `validated[o_id]` already
                     valid = False
@@ -472,6 +788,10 @@ def validate_inputs(prompt, item, validated):
                 validated[o_id] = (False, reasons, o_id)
                 continue
         else:
+            if validated_inputs is not None and x in validated_inputs:
+                inputs[x] = validated_inputs[x]
+                continue
+
             try:
                 if type_input == "INT":
                     val = int(val)
@@ -585,17 +905,36 @@ def validate_inputs(prompt, item, validated):
         ret = (False, errors, unique_id)
     else:
         ret = (True, [], unique_id)
+        if signature is not None and validated_inputs is None:
+            comfy_execution.caching.validation_cache.set(signature, class_inputs, inputs)
 
     validated[unique_id] = ret
     return ret
 
+def get_validation_links(prompt, unique_id):
+    """The nodes validate_inputs() validates before unique_id: the ones linked to its required inputs with the right type."""
+    try:
+        inputs = prompt[unique_id]['inputs']
+        required_inputs = comfy_execution.caching.get_input_types(nodes.NODE_CLASS_MAPPINGS[prompt[unique_id]['class_type']])['required']
+        out = []
+        for x in required_inputs:
+            val = inputs.get(x, None)
+            if not comfy_execution.graph.is_link(val) or val[0] in out:
+                continue
+            if nodes.NODE_CLASS_MAPPINGS[prompt[val[0]]['class_type']].RETURN_TYPES[val[1]] == required_inputs[x][0]:
+                out.append(val[0])
+        return out
+    except Exception:
+        # validate_inputs() reports the problem when it validates unique_id
+        return []
+
 def full_type_name(klass):
     module = klass.__module__
     if module == 'builtins':
         return klass.__qualname__
     return module + '.' + klass.__qualname__
 
-def validate_prompt(prompt):
+def validate_prompt(prompt, validated=None):
     outputs = set()
     for x in prompt:
         class_ = nodes.NODE_CLASS_MAPPINGS[prompt[x]['class_type']]
@@ -614,12 +953,25 @@ def validate_prompt(prompt):
     good_outputs = set()
     errors = []
     node_errors = {}
-    validated = {}
+    if validated is None:
+        validated = {}
+    signatures = comfy_execution.caching.validation_cache.prompt_signatures(prompt, outputs)
     for o in outputs:
+        # validate the upstream nodes first so validate_inputs() finds them in validated
+        # instead of recursing down long chains of nodes
+        for unique_id in comfy_execution.graph.postorder(prompt, [o], visited=set(validated), linked_nodes=lambda x: get_validation_links(prompt, x)):
+            if unique_id == o:
+                break
+            try:
+                validate_inputs(prompt, unique_id, validated, signatures)
+            except Exception:
+                # raised again and recorded when the node linked to it is validated
+                pass
+
         valid = False
         reasons = []
         try:
-            m = validate_inputs(prompt, o, validated)
+            m = validate_inputs(prompt, o, validated, signatures)
             valid = m[0]
             reasons = m[1]
         except Exception as ex:
@@ -684,7 +1036,86 @@ def validate_prompt(prompt):
 
     return (True, None, list(good_outputs), node_errors)
 
-MAXIMUM_HISTORY_SIZE = 10000
+def apply_overrides(prompt, overrides):
+    """
+    Return a copy of prompt with the widget values in overrides ({node_id: {input_name: value}})
+    replaced. The nodes that aren't overridden are shared with prompt.
+    """
+    out = dict(prompt)
+    for node_id, inputs in overrides.items():
+        if node_id not in prompt:
+            raise ValueError("node {} is not in the prompt".format(node_id))
+        if not isinstance(inputs, dict):
+            raise ValueError("the overrides of node {} must be a dict of input values".format(node_id))
+        for x in inputs:
+            if comfy_execution.graph.is_link(inputs[x]) or comfy_execution.graph.is_link(prompt[node_id]['inputs'].get(x, None)):
+                raise ValueError("input {} of node {} is a link, only widget values can be overridden".format(x, node_id))
+        node = dict(prompt[node_id])
+        node['inputs'] = dict(node['inputs'])
+        node['inputs'].update(inputs)
+        out[node_id] = node
+    return out
+
+def validate_prompt_batch(prompt, overrides_list):
+    """
+    Validate a template prompt once and then, for every entry of overrides_list,
+    only the nodes it overrides. Returns the same tuple as validate_prompt()
+    followed by the list of prompts, nothing is returned if any of them is invalid.
+    """
+    validated = {}
+    valid = validate_prompt(prompt, validated)
+    if valid[0] is not True:
+        return valid + ([],)
+
+    prompts = []
+    for i, overrides in enumerate(overrides_list):
+        try:
+            if not isinstance(overrides, dict):
+                raise ValueError("overrides must be a dict of node ids")
+            variant = apply_overrides(prompt, overrides)
+        except ValueError as ex:
+            error = {
+                "type": "invalid_override",
+                "message": "Invalid prompt override",
+                "details": "variant {}: {}".format(i, ex),
+                "extra_info": {"variant": i}
+            }
+            return (False, error, [], {}, [])
+
+        # nodes that don't depend on the overridden values keep the result of the template
+        variant_validated = {x: validated[x] for x in validated if x not in overrides}
+        node_errors = {}
+        for node_id in overrides:
+            try:
+                result = validate_inputs(variant, node_id, variant_validated)
+            except Exception as ex:
+                result = (False, [{
+                    "type": "exception_during_validation",
+                    "message": "Exception when validating node",
+                    "details": str(ex),
+                    "extra_info": {}
+                }], node_id)
+            if result[0] is not True:
+                node_errors[node_id] = {
+                    "errors": result[1],
+                    "dependent_outputs": [],
+                    "class_type": variant[node_id]['class_type']
+                }
+        if len(node_errors) > 0:
+            details = ["{}: {}".format(e['message'], e['details']) for x in node_errors.values() for e in x["errors"]]
+            error = {
+                "type": "prompt_variant_failed_validation",
+                "message": "Prompt variant failed validation",
+                "details": "variant {}: {}".format(i, "\n".join(details)),
+                "extra_info": {"variant": i}
+            }
+            return (False, error, [], node_errors, [])
+        prompts.append(variant)
+
+    return valid + (prompts,)
+
+class QueueFullError(Exception):
+    pass
 
 class PromptQueue:
     def __init__(self, server):
@@ -692,28 +1123,88 @@ class PromptQueue:
         self.mutex = threading.RLock()
         self.not_empty = threading.Condition(self.mutex)
         self.task_counter = 0
-        self.queue = []
+        self.queue = comfy_execution.scheduler.FairQueue(args.priority_classes, self.default_priority_class(), dict(args.client_weights))
         self.currently_running = {}
-        self.history = {}
+        self.history = comfy_execution.history.PromptHistory(args.history_memory_size, args.history_db)
         self.flags = {}
+        self.worker_flags = {}
+        self.snapshot = None
+        self.journal = None
+        if args.queue_journal is not None:
+            self.journal = comfy_execution.journal.QueueJournal(args.queue_journal)
+            self.recover()
         server.prompt_queue = self
 
+    def recover(self):
+        running = 0
+        for item, started in self.journal.recovered:
+            if item[3].get("priority_class", None) not in (None, *args.priority_classes):
+                del item[3]["priority_class"]
+            if item[3].get("worker_tag", None) not in (None, *(args.prompt_workers or [])):
+                # no worker would ever take it
+                logging.warning("Prompt {} was queued for the worker tag {} which no worker has anymore, it will run on any worker.".format(item[1], item[3]["worker_tag"]))
+                del item[3]["worker_tag"]
+            self.queue.push(item)
+            if started:
+                running += 1
+            if item[0] >= self.server.number:
+                self.server.number = int(item[0]) + 1
+        if len(self.journal.recovered) > 0:
+            logging.info("Queued {} prompts again from {}, {} of them were running when the server stopped.".format(len(self.journal.recovered), args.queue_journal, running))
+
+    def record(self, op, data):
+        if self.journal is not None:
+            self.journal.record(op, data)
+
+    def default_priority_class(self):
+        if "normal" in args.priority_classes:
+            return "normal"
+        return args.priority_classes[-1]
+
+    def is_full(self, client_id):
+        return args.max_queue_per_client > 0 and self.queue.client_depth(client_id) >= args.max_queue_per_client
+
     def put(self, item):
         with self.mutex:
-            heapq.heappush(self.queue, item)
+            if self.is_full(item[3].get("client_id", None)):
+                raise QueueFullError("Too many prompts queued for this client, the limit is {}".format(args.max_queue_per_client))
+            self.queue.push(item)
+            self.record("put", item)
+            self.snapshot = None
+            self.server.queue_updated()
+            self.not_empty.notify_all()
+
+    def put_many(self, items):
+        """Queue all the items or, if the client would go over its limit, none of them."""
+        with self.mutex:
+            depths = {}
+            for item in items:
+                client_id = item[3].get("client_id", None)
+                depths[client_id] = depths.get(client_id, 0) + 1
+            for client_id in depths:
+                if args.max_queue_per_client > 0 and self.queue.client_depth(client_id) + depths[client_id] > args.max_queue_per_client:
+                    raise QueueFullError("Too many prompts queued for this client, the limit is {}".format(args.max_queue_per_client))
+            for item in items:
+                self.queue.push(item)
+                self.record("put", item)
+            self.snapshot = None
             self.server.queue_updated()
-            self.not_empty.notify()
+            self.not_empty.notify_all()
 
-    def get(self, timeout=None):
+    def get(self, timeout=None, worker_tag=None):
+        accept = worker_accepts(worker_tag)
         with self.not_empty:
-            while len(self.queue) == 0:
+            item = self.queue.pop(accept)
+            while item is None:
                 self.not_empty.wait(timeout=timeout)
-                if timeout is not None and len(self.queue) == 0:
+                item = self.queue.pop(accept)
+                if timeout is not None and item is None:
                     return None
-            item = heapq.heappop(self.queue)
             i = self.task_counter
             self.currently_running[i] = copy.deepcopy(item)
             self.task_counter += 1
+            self.record("start", item[1])
+            self.snapshot = None
             self.server.queue_updated()
             return (item, i)
 
@@ -723,29 +1214,55 @@ class PromptQueue:
         messages: List[str]
 
     def task_done(self, item_id, outputs,
-                  status: Optional['PromptQueue.ExecutionStatus']):
+                  status: Optional['PromptQueue.ExecutionStatus'],
+                  profile=None):
         with self.mutex:
-            prompt = self.currently_running.pop(item_id)
-            if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
-
-            status_dict: Optional[dict] = None
-            if status is not None:
-                status_dict = copy.deepcopy(status._asdict())
-
-            self.history[prompt[1]] = {
-                "prompt": prompt,
-                "outputs": copy.deepcopy(outputs),
-                'status': status_dict,
-            }
+            prompt = self.currently_running[item_id]
+
+        status_dict: Optional[dict] = None
+        if status is not None:
+            status_dict = copy.deepcopy(status._asdict())
+
+        # the history writes to disk so it is added to without holding the mutex, the prompt
+        # is listed as running until then so it is always either running or in the history
+        self.history.add(prompt[1], {
+            "prompt": prompt,
+            "outputs": copy.deepcopy(outputs),
+            'status': status_dict,
+            'profile': profile,
+        })
+
+        with self.mutex:
+            self.currently_running.pop(item_id)
+            self.record("done", prompt[1])
+            nodes.interrupt_processing(False, prompt[1])
+            self.snapshot = None
             self.server.queue_updated()
 
-    def get_current_queue(self):
+    def get_compatible(self, item, max_items, worker_tag=None):
+        """
+        Take up to max_items queued prompts that can be batched with item, see batch_compatible().
+        """
         with self.mutex:
             out = []
-            for x in self.currently_running.values():
-                out += [x]
-            return (out, copy.deepcopy(self.queue))
+            for x in self.queue.pop_compatible(lambda x: batch_compatible(item, x), max_items, worker_accepts(worker_tag)):
+                i = self.task_counter
+                self.currently_running[i] = copy.deepcopy(x)
+                self.task_counter += 1
+                self.record("start", x[1])
+                out.append((x, i))
+            if len(out) > 0:
+                self.snapshot = None
+                self.server.queue_updated()
+            return out
+
+    def get_current_queue(self):
+        # queued items are never modified so a shallow copy of the lists is enough,
+        # it is only rebuilt when the queue changed since the last call
+        with self.mutex:
+            if self.snapshot is None:
+                self.snapshot = (list(self.currently_running.values()), list(self.queue))
+            return self.snapshot
 
     def get_tasks_remaining(self):
         with self.mutex:
@@ -753,59 +1270,97 @@ class PromptQueue:
 
     def wipe_queue(self):
         with self.mutex:
-            self.queue = []
+            self.queue.clear()
+            self.record("clear", None)
+            self.snapshot = None
             self.server.queue_updated()
 
     def delete_queue_item(self, function):
         with self.mutex:
-            for x in range(len(self.queue)):
-                if function(self.queue[x]):
-                    if len(self.queue) == 1:
-                        self.wipe_queue()
-                    else:
-                        self.queue.pop(x)
-                        heapq.heapify(self.queue)
+            for x in self.queue:
+                if function(x):
+                    self.queue.remove(x)
+                    self.record("delete", x[1])
+                    self.snapshot = None
                     self.server.queue_updated()
                     return True
         return False
 
-    def get_history(self, prompt_id=None, max_items=None, offset=-1):
+    def delete_queue_items(self, prompt_ids):
         with self.mutex:
-            if prompt_id is None:
-                out = {}
-                i = 0
-                if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        out[k] = self.history[k]
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
-                return out
-            elif prompt_id in self.history:
-                return {prompt_id: copy.deepcopy(self.history[prompt_id])}
-            else:
-                return {}
+            deleted = 0
+            for prompt_id in prompt_ids:
+                item = self.queue.get(prompt_id)
+                if item is not None:
+                    self.queue.remove(item)
+                    self.record("delete", prompt_id)
+                    deleted += 1
+            if deleted > 0:
+                self.snapshot = None
+                self.server.queue_updated()
+            return deleted
+
+    def interrupt(self, prompt_id=None):
+        """
+        Stop the running prompt prompt_id, or every running prompt when it is None.
+        Returns the number of prompts that were interrupted.
+        """
+        with self.mutex:
+            # the flag is cleared by task_done() so it only ever exists for running prompts
+            interrupted = 0
+            for x in self.currently_running.values():
+                if prompt_id is None or x[1] == prompt_id:
+                    nodes.interrupt_processing(True, x[1])
+                    interrupted += 1
+            return interrupted
 
-    def wipe_history(self):
+    def get_metrics(self):
         with self.mutex:
-            self.history = {}
+            metrics = self.queue.get_metrics()
+            for name in metrics:
+                metrics[name]["running"] = 0
+            for x in self.currently_running.values():
+                metrics[self.queue.class_of(x).name]["running"] += 1
+            return metrics
+
+    def get_history(self, prompt_id=None, max_items=None, offset=-1):
+        if prompt_id is None:
+            return self.history.get_page(max_items=max_items, offset=offset)
+        entry = self.history.get(prompt_id)
+        if entry is not None:
+            return {prompt_id: entry}
+        else:
+            return {}
+
+    def wipe_history(self):
+        self.history.clear()
 
     def delete_history_item(self, id_to_delete):
+        self.history.delete(id_to_delete)
+
+    def add_worker(self, worker_id):
         with self.mutex:
-            self.history.pop(id_to_delete, None)
+            self.worker_flags.setdefault(worker_id, {})
 
     def set_flag(self, name, data):
         with self.mutex:
             self.flags[name] = data
-            self.not_empty.notify()
+            for flags in self.worker_flags.values():
+                flags[name] = data
+            self.not_empty.notify_all()
 
-    def get_flags(self, reset=True):
+    def get_flags(self, reset=True, worker_id=None):
+        # every prompt worker gets its own copy of the flags so each one resets its executor
         with self.mutex:
+            if worker_id is None:
+                flags = self.flags
+            else:
+                flags = self.worker_flags.setdefault(worker_id, {})
             if reset:
-                ret = self.flags
-                self.flags = {}
-                return ret
+                if worker_id is None:
+                    self.flags = {}
+                else:
+                    self.worker_flags[worker_id] = {}
+                return flags
             else:
-                return self.flags.copy()
+                return flags.copy()
@@ -1,6 +1,8 @@
 import os
 import time
 import logging
+import threading
+from contextlib import contextmanager
 
 supported_pt_extensions = set(['.ckpt', '.pt', '.bin', '.pth', '.safetensors', '.pkl'])
 
@@ -41,6 +43,19 @@ user_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "user
 
 filename_list_cache = {}
 
+# set with set_model_index(), the filename lists are then built from it instead of walking the folders
+model_index = None
+# (index generation, folders, extensions) each filename list was built from the model index for
+filename_list_keys = {}
+# (filename list, {name: full path}) built together with the filename lists so get_full_path doesn't stat
+full_path_cache = {}
+
+# (output folder, filename prefix) -> (next counter, whether the files up to it were created with create_save_file)
+save_counters = {}
+save_counters_lock = threading.Lock()
+
+folder_access_log = threading.local()
+
 if not os.path.exists(input_directory):
     try:
         os.makedirs(input_directory)
@@ -61,17 +76,67 @@ def set_input_directory(input_dir):
 
 def get_output_directory():
     global output_directory
+    log_directory_access(output_directory)
     return output_directory
 
 def get_temp_directory():
     global temp_directory
+    log_directory_access(temp_directory)
     return temp_directory
 
 def get_input_directory():
     global input_directory
+    log_directory_access(input_directory)
     return input_directory
 
 
+@contextmanager
+def track_folder_access():
+    """
+    Record the model folders and directories looked up inside the block so a result
+    computed from them can be checked for staleness later with folder_access_changed().
+    """
+    previous = getattr(folder_access_log, "accesses", None)
+    accesses = {}
+    folder_access_log.accesses = accesses
+    try:
+        yield accesses
+    finally:
+        folder_access_log.accesses = previous
+        if previous is not None:
+            previous.update(accesses)
+
+def log_directory_access(directory):
+    accesses = getattr(folder_access_log, "accesses", None)
+    if accesses is not None and ("directory", directory) not in accesses:
+        try:
+            accesses[("directory", directory)] = os.path.getmtime(directory)
+        except OSError:
+            accesses[("directory", directory)] = None
+
+def log_folder_access(folder_name, cached):
+    accesses = getattr(folder_access_log, "accesses", None)
+    if accesses is not None:
+        accesses[("folder", folder_name)] = cached
+
+def folder_access_changed(accesses):
+    for (kind, name), value in accesses.items():
+        if kind == "folder":
+            try:
+                if cached_filename_list_(name) is not value:
+                    return True
+            except OSError:
+                return True
+        else:
+            try:
+                mtime = os.path.getmtime(name)
+            except OSError:
+                mtime = None
+            if mtime != value:
+                return True
+    return False
+
+
 #NOTE: used in http server so don't put folders that should not be accessed remotely
 def get_directory_by_type(type_name):
     if type_name == "output":
@@ -130,6 +195,13 @@ def add_model_folder_path(folder_name, full_folder_path):
     else:
         folder_names_and_paths[folder_name] = ([full_folder_path], set())
 
+def set_model_index(index):
+    global model_index
+    model_index = index
+    filename_list_cache.clear()
+    filename_list_keys.clear()
+    full_path_cache.clear()
+
 def get_folder_paths(folder_name):
     return folder_names_and_paths[folder_name][0][:]
 
@@ -177,6 +249,14 @@ def get_full_path(folder_name, filename):
         return None
     folders = folder_names_and_paths[folder_name]
     filename = os.path.relpath(os.path.join("/", filename), "/")
+    # the map is only used while the filename list it was built with is current, that list is
+    # checked against the folder mtimes (or the model index generation) every time a prompt is
+    # validated so a file removed or moved to another folder is noticed without a stat here
+    full_path = cached_full_path(folder_name, filename)
+    if full_path is not None:
+        return full_path
+
+    # not in the filename list (added since it was built or filtered out by extension)
     for x in folders[0]:
         full_path = os.path.join(x, filename)
         if os.path.isfile(full_path):
@@ -186,21 +266,65 @@ def get_full_path(folder_name, filename):
 
     return None
 
+def cached_full_path(folder_name, filename):
+    if model_index is not None:
+        out = indexed_filename_list_(folder_name)
+    else:
+        out = filename_list_cache.get(folder_name, None)
+    entry = full_path_cache.get(folder_name, None)
+    if out is None or entry is None or entry[0] is not out:
+        return None
+    return entry[1].get(filename, None)
+
+def add_full_paths(full_paths, folder, files):
+    # the first folder a name is found in wins like in get_full_path
+    for x in files:
+        if x not in full_paths:
+            full_paths[x] = os.path.join(folder, x)
+
 def get_filename_list_(folder_name):
     global folder_names_and_paths
     output_list = set()
     folders = folder_names_and_paths[folder_name]
     output_folders = {}
+    full_paths = {}
     for x in folders[0]:
         files, folders_all = recursive_search(x, excluded_dir_names=[".git"])
-        output_list.update(filter_files_extensions(files, folders[1]))
+        files = filter_files_extensions(files, folders[1])
+        output_list.update(files)
+        add_full_paths(full_paths, x, files)
         output_folders = {**output_folders, **folders_all}
 
-    return (sorted(list(output_list)), output_folders, time.perf_counter())
+    out = (sorted(list(output_list)), output_folders, time.perf_counter())
+    full_path_cache[folder_name] = (out, full_paths)
+    return out
+
+def indexed_filename_list_(folder_name):
+    folders = folder_names_and_paths[folder_name]
+    roots = tuple(folders[0])
+    key = (model_index.generation, roots, tuple(sorted(folders[1])))
+    out = filename_list_cache.get(folder_name, None)
+    if out is not None and filename_list_keys.get(folder_name, None) == key:
+        return out
+
+    generation, files = model_index.get_files(roots)
+    output_list = set()
+    full_paths = {}
+    for x in roots:
+        root_files = filter_files_extensions(files[x], folders[1])
+        output_list.update(root_files)
+        add_full_paths(full_paths, x, root_files)
+    out = (sorted(list(output_list)), {}, time.perf_counter())
+    filename_list_cache[folder_name] = out
+    full_path_cache[folder_name] = (out, full_paths)
+    filename_list_keys[folder_name] = (generation, roots, key[2])
+    return out
 
 def cached_filename_list_(folder_name):
     global filename_list_cache
     global folder_names_and_paths
+    if model_index is not None:
+        return indexed_filename_list_(folder_name)
     if folder_name not in filename_list_cache:
         return None
     out = filename_list_cache[folder_name]
@@ -225,18 +349,81 @@ def get_filename_list(folder_name):
         out = get_filename_list_(folder_name)
         global filename_list_cache
         filename_list_cache[folder_name] = out
+    log_folder_access(folder_name, out)
     return list(out[0])
 
-def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height=0):
-    def map_filename(filename):
-        prefix_len = len(os.path.basename(filename_prefix))
-        prefix = filename[:prefix_len + 1]
+def scan_save_counter(full_output_folder, filename):
+    def map_filename(file):
+        prefix_len = len(filename)
+        prefix = file[:prefix_len + 1]
         try:
-            digits = int(filename[prefix_len + 1:].split('_')[0])
+            digits = int(file[prefix_len + 1:].split('_')[0])
         except:
             digits = 0
         return (digits, prefix)
 
+    try:
+        counter = max(filter(lambda a: a[1][:-1] == filename and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
+    except ValueError:
+        counter = 1
+    except FileNotFoundError:
+        os.makedirs(full_output_folder, exist_ok=True)
+        counter = 1
+    return counter
+
+def next_save_counter(full_output_folder, filename, rescan=False):
+    """
+    Hand out the next counter for a filename prefix. The output folder is only
+    listed when the files saved with the previous counter weren't created with
+    create_save_file (custom nodes can use several counters per call).
+    """
+    key = (full_output_folder, filename)
+    with save_counters_lock:
+        entry = save_counters.get(key, None)
+        if entry is not None and entry[1] and not rescan:
+            counter = entry[0]
+        else:
+            counter = scan_save_counter(full_output_folder, filename)
+            if entry is not None:
+                counter = max(counter, entry[0])
+        save_counters[key] = (counter + 1, False)
+    return counter
+
+@contextmanager
+def create_save_file(full_output_folder, filename, counter, file_name):
+    """
+    Create the file file_name(counter) without overwriting an existing one, a
+    new counter is taken when it's already there (saved by another process or
+    a concurrent save). Gives the file opened for writing, its name and the
+    counter used. The file is removed again when writing it fails so an empty
+    file isn't left in the output folder.
+    """
+    while True:
+        file = file_name(counter)
+        path = os.path.join(full_output_folder, file)
+        try:
+            f = open(path, "xb")
+            break
+        except FileExistsError:
+            counter = max(next_save_counter(full_output_folder, filename, rescan=True), counter + 1)
+        except FileNotFoundError:
+            os.makedirs(full_output_folder, exist_ok=True)
+
+    key = (full_output_folder, filename)
+    with save_counters_lock:
+        entry = save_counters.get(key, None)
+        save_counters[key] = (max(counter + 1, entry[0] if entry is not None else 0), True)
+    try:
+        with f:
+            yield f, file, counter
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height=0):
     def compute_vars(input, image_width, image_height):
         input = input.replace("%width%", str(image_width))
         input = input.replace("%height%", str(image_height))
@@ -257,11 +444,5 @@ def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height
         logging.error(err)
         raise Exception(err)
 
-    try:
-        counter = max(filter(lambda a: a[1][:-1] == filename and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
-    except ValueError:
-        counter = 1
-    except FileNotFoundError:
-        os.makedirs(full_output_folder, exist_ok=True)
-        counter = 1
+    counter = next_save_counter(full_output_folder, filename)
     return full_output_folder, filename, counter, subfolder, filename_prefix
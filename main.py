@@ -1,6 +1,12 @@
 import comfy.options
 comfy.options.enable_args_parsing()
 
+import sys
+from app import startup_report
+# started before the arguments are parsed so the imports done by the prestartup scripts are timed too
+if "--profile-startup" in sys.argv:
+    startup_report.import_profiler.start()
+
 import os
 import importlib.util
 import folder_paths
@@ -33,6 +39,7 @@ def execute_prestartup_script():
                 time_before = time.perf_counter()
                 success = execute_script(script_path)
                 node_prestartup_times.append((time.perf_counter() - time_before, module_path, success))
+                startup_report.report.add_custom_node("prestartup", module_path, node_prestartup_times[-1][0], success)
     if len(node_prestartup_times) > 0:
         print("\nPrestartup times for custom nodes:")
         for n in sorted(node_prestartup_times):
@@ -63,10 +70,12 @@ import comfy.utils
 import yaml
 import execution
 import server
+import app.model_index
 from server import BinaryEventTypes
 from nodes import init_custom_nodes
 
-def prompt_worker(q, server):
+def prompt_worker(q, server, worker_id=0, worker_tag=None):
+    q.add_worker(worker_id)
     e = execution.PromptExecutor(server)
     last_gc_collect = 0
     need_gc = False
@@ -77,29 +86,40 @@ def prompt_worker(q, server):
         if need_gc:
             timeout = max(gc_collect_interval - (current_time - last_gc_collect), 0.0)
 
-        queue_item = q.get(timeout=timeout)
+        queue_item = q.get(timeout=timeout, worker_tag=worker_tag)
         if queue_item is not None:
-            item, item_id = queue_item
-            execution_start_time = time.perf_counter()
-            prompt_id = item[1]
-            server.last_prompt_id = prompt_id
-
-            e.execute(item[2], prompt_id, item[3], item[4])
-            need_gc = True
-            q.task_done(item_id,
-                        e.outputs_ui,
-                        status=execution.PromptQueue.ExecutionStatus(
-                            status_str='success' if e.success else 'error',
-                            completed=e.success,
-                            messages=e.status_messages))
-            if server.client_id is not None:
-                server.send_sync("executing", { "node": None, "prompt_id": prompt_id }, server.client_id)
-
-            current_time = time.perf_counter()
-            execution_time = current_time - execution_start_time
-            logging.info("Prompt executed in {:.2f} seconds".format(execution_time))
-
-        flags = q.get_flags()
+            batch = [queue_item]
+            if args.batch_prompts > 1:
+                batch += q.get_compatible(queue_item[0], args.batch_prompts - 1, worker_tag)
+                if len(batch) > 1:
+                    e.set_batch([x[0] for x in batch])
+
+            for item, item_id in batch:
+                execution_start_time = time.perf_counter()
+                prompt_id = item[1]
+                server.last_prompt_id = prompt_id
+
+                e.execute(item[2], prompt_id, item[3], item[4])
+                need_gc = True
+                q.task_done(item_id,
+                            e.outputs_ui,
+                            status=execution.PromptQueue.ExecutionStatus(
+                                status_str='success' if e.success else 'error',
+                                completed=e.success,
+                                messages=e.status_messages),
+                            profile=e.profiler.get_records())
+                if server.client_id is not None:
+                    server.send_sync("executing", { "node": None, "prompt_id": prompt_id }, server.client_id)
+
+                current_time = time.perf_counter()
+                execution_time = current_time - execution_start_time
+                if worker_tag is None:
+                    logging.info("Prompt executed in {:.2f} seconds".format(execution_time))
+                else:
+                    logging.info("Prompt executed in {:.2f} seconds on worker {} ({})".format(execution_time, worker_id, worker_tag))
+            e.clear_batch()
+
+        flags = q.get_flags(worker_id=worker_id)
         free_memory = flags.get("free_memory", False)
 
         if free_memory:
@@ -182,12 +202,19 @@ if __name__ == "__main__":
         for config_path in itertools.chain(*args.extra_model_paths_config):
             load_extra_path_config(config_path)
 
+    if args.model_index is not None:
+        folder_paths.set_model_index(app.model_index.ModelIndex(args.model_index, args.model_index_poll))
+
     init_custom_nodes()
 
     server.add_routes()
     hijack_progress(server)
 
-    threading.Thread(target=prompt_worker, daemon=True, args=(q, server,)).start()
+    if args.prompt_workers:
+        for worker_id, worker_tag in enumerate(args.prompt_workers):
+            threading.Thread(target=prompt_worker, daemon=True, args=(q, server, worker_id, worker_tag)).start()
+    else:
+        threading.Thread(target=prompt_worker, daemon=True, args=(q, server,)).start()
 
     if args.output_directory:
         output_dir = os.path.abspath(args.output_directory)
@@ -216,9 +243,28 @@ if __name__ == "__main__":
             webbrowser.open(f"{scheme}://{address}:{port}")
         call_on_start = startup_server
 
+    if args.startup_report is not None or args.profile_startup:
+        def save_startup_report(scheme, address, port, call_on_start=call_on_start):
+            startup_report.report.mark_ready()
+            if args.profile_startup:
+                startup_report.import_profiler.stop()
+                logging.info("\nSlowest imports at startup:")
+                for x in startup_report.report.slowest_imports(20):
+                    logging.info("{:8.1f} ms {:8.1f} ms total {}".format(x["self_seconds"] * 1000, x["seconds"] * 1000, x["module"]))
+            if args.startup_report is not None:
+                startup_report.report.save(args.startup_report)
+            if call_on_start is not None:
+                call_on_start(scheme, address, port)
+        call_on_start = save_startup_report
+
     try:
         loop.run_until_complete(run(server, address=args.listen, port=args.port, verbose=not args.dont_print_server, call_on_start=call_on_start))
     except KeyboardInterrupt:
         logging.info("\nStopped server")
 
+    if q.journal is not None:
+        # the writer thread only fsyncs every so often, don't lose what was recorded since
+        if not q.journal.flush(timeout=10.0):
+            logging.warning("Timed out writing the queue journal {}".format(args.queue_journal))
+
     cleanup_temp()
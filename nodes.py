@@ -18,15 +18,33 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "co
 from comfy.cli_args import args
 
 import importlib
+import threading
+import types
+import concurrent.futures
 
 import folder_paths
 import node_helpers
+from app import startup_report
 
-def before_node_execution():
+class InterruptProcessingException(Exception):
     pass
 
-def interrupt_processing(value=True):
-    pass
+# prompts that were asked to stop, every running prompt has its own flag so the
+# prompt workers don't clear or trip the interrupts of each other
+interrupt_lock = threading.Lock()
+interrupted_prompts = set()
+
+def before_node_execution(prompt_id=None):
+    with interrupt_lock:
+        if prompt_id in interrupted_prompts:
+            raise InterruptProcessingException()
+
+def interrupt_processing(value=True, prompt_id=None):
+    with interrupt_lock:
+        if value:
+            interrupted_prompts.add(prompt_id)
+        else:
+            interrupted_prompts.discard(prompt_id)
 
 MAX_RESOLUTION=16384
 
@@ -253,6 +271,7 @@ class SaveImage:
     OUTPUT_NODE = True
 
     CATEGORY = "image"
+    THREAD_SAFE = True
 
     def save_images(self, images, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
@@ -271,8 +290,8 @@ class SaveImage:
                         metadata.add_text(x, json.dumps(extra_pnginfo[x]))
 
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
-            file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            with folder_paths.create_save_file(full_output_folder, filename, counter, lambda c: f"{filename_with_batch_num}_{c:05}_.png") as (f, file, counter):
+                img.save(f, format="PNG", pnginfo=metadata, compress_level=self.compress_level)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -306,6 +325,7 @@ class ImageInvert:
     FUNCTION = "invert"
 
     CATEGORY = "image"
+    THREAD_SAFE = True
 
     def invert(self, image):
         s = 1.0 - image
@@ -392,48 +412,250 @@ NODE_DISPLAY_NAME_MAPPINGS = {
 
 EXTENSION_WEB_DIRS = {}
 
-def load_custom_node(module_path, ignore=set()):
+def get_custom_node_module_name(module_path):
     module_name = os.path.basename(module_path)
     if os.path.isfile(module_path):
         sp = os.path.splitext(module_path)
         module_name = sp[0]
+    return module_name
+
+def import_custom_node(module_path):
+    """Import a custom node module or package, returns the module, its name and its directory."""
+    module_name = get_custom_node_module_name(module_path)
+    if os.path.isfile(module_path):
+        module_spec = importlib.util.spec_from_file_location(module_name, module_path)
+        module_dir = os.path.split(module_path)[0]
+    else:
+        module_spec = importlib.util.spec_from_file_location(module_name, os.path.join(module_path, "__init__.py"))
+        module_dir = module_path
+
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_name] = module
+    module_spec.loader.exec_module(module)
+    return module, module_name, module_dir
+
+def register_custom_node(module_path, module, module_name, module_dir, ignore=set()):
+    if hasattr(module, "WEB_DIRECTORY") and getattr(module, "WEB_DIRECTORY") is not None:
+        web_dir = os.path.abspath(os.path.join(module_dir, getattr(module, "WEB_DIRECTORY")))
+        if os.path.isdir(web_dir):
+            EXTENSION_WEB_DIRS[module_name] = web_dir
+
+    if hasattr(module, "NODE_CLASS_MAPPINGS") and getattr(module, "NODE_CLASS_MAPPINGS") is not None:
+        for name in module.NODE_CLASS_MAPPINGS:
+            if name not in ignore:
+                NODE_CLASS_MAPPINGS[name] = module.NODE_CLASS_MAPPINGS[name]
+        if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS") and getattr(module, "NODE_DISPLAY_NAME_MAPPINGS") is not None:
+            NODE_DISPLAY_NAME_MAPPINGS.update(module.NODE_DISPLAY_NAME_MAPPINGS)
+        return True
+    else:
+        logging.warning(f"Skip {module_path} module for custom nodes due to the lack of NODE_CLASS_MAPPINGS.")
+        return False
+
+def load_custom_node(module_path, ignore=set(), imported=None):
+    """imported can be the result of an import_custom_node() call that already ran."""
     try:
         logging.debug("Trying to load custom node {}".format(module_path))
-        if os.path.isfile(module_path):
-            module_spec = importlib.util.spec_from_file_location(module_name, module_path)
-            module_dir = os.path.split(module_path)[0]
-        else:
-            module_spec = importlib.util.spec_from_file_location(module_name, os.path.join(module_path, "__init__.py"))
-            module_dir = module_path
-
-        module = importlib.util.module_from_spec(module_spec)
-        sys.modules[module_name] = module
-        module_spec.loader.exec_module(module)
-
-        if hasattr(module, "WEB_DIRECTORY") and getattr(module, "WEB_DIRECTORY") is not None:
-            web_dir = os.path.abspath(os.path.join(module_dir, getattr(module, "WEB_DIRECTORY")))
-            if os.path.isdir(web_dir):
-                EXTENSION_WEB_DIRS[module_name] = web_dir
-
-        if hasattr(module, "NODE_CLASS_MAPPINGS") and getattr(module, "NODE_CLASS_MAPPINGS") is not None:
-            for name in module.NODE_CLASS_MAPPINGS:
-                if name not in ignore:
-                    NODE_CLASS_MAPPINGS[name] = module.NODE_CLASS_MAPPINGS[name]
-            if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS") and getattr(module, "NODE_DISPLAY_NAME_MAPPINGS") is not None:
-                NODE_DISPLAY_NAME_MAPPINGS.update(module.NODE_DISPLAY_NAME_MAPPINGS)
-            return True
-        else:
-            logging.warning(f"Skip {module_path} module for custom nodes due to the lack of NODE_CLASS_MAPPINGS.")
-            return False
+        if imported is None:
+            imported = import_custom_node(module_path)
+        return register_custom_node(module_path, *imported, ignore=ignore)
     except Exception as e:
         logging.warning(traceback.format_exc())
         logging.warning(f"Cannot import {module_path} module for custom nodes: {e}")
         return False
 
+CUSTOM_NODE_MANIFEST_VERSION = 2
+
+# the modules custom node packs patch when they are imported
+CORE_MODULES = ("comfy", "comfy_extras", "comfy_execution", "app", "nodes", "folder_paths", "execution", "server", "latent_preview", "node_helpers")
+
+def is_core_module(name):
+    return any(name == x or name.startswith(x + ".") for x in CORE_MODULES)
+
+def get_server_hooks():
+    server = sys.modules.get("server", None)
+    instance = getattr(getattr(server, "PromptServer", None), "instance", None)
+    if instance is None:
+        return {}
+    return {
+        "server routes": len(instance.routes) + len(instance.app.router.routes()),
+        "server middlewares": len(instance.app.middlewares),
+        "on_prompt handlers": len(instance.on_prompt_handlers),
+    }
+
+def get_import_state():
+    """
+    Snapshot of what importing a custom node pack can change besides the nodes it
+    registers: the server hooks, the model folders, sys.modules and the globals of
+    the core modules and their classes. Compared with get_import_side_effects().
+    """
+    modules = dict(sys.modules)
+    folders = {x: (tuple(y[0]), tuple(sorted(y[1]))) for x, y in folder_paths.folder_names_and_paths.items()}
+    attributes = {}
+    for name, module in modules.items():
+        if not is_core_module(name):
+            continue
+        for key, value in list(getattr(module, "__dict__", {}).items()):
+            attributes[(name, key)] = value
+            if isinstance(value, type) and value.__module__ == name:
+                for class_key, class_value in list(value.__dict__.items()):
+                    attributes[(name, key, class_key)] = class_value
+    return get_server_hooks(), modules, folders, attributes
+
+def get_import_side_effects(before, after):
+    """Describe what changed between two get_import_state() snapshots."""
+    hooks, modules, folders, attributes = before
+    new_hooks, new_modules, new_folders, new_attributes = after
+    effects = []
+    for name in new_hooks:
+        if new_hooks[name] != hooks.get(name, 0):
+            effects.append("added {}".format(name))
+    for name in folders.keys() | new_folders.keys():
+        if folders.get(name, None) != new_folders.get(name, None):
+            effects.append("changed model folder {}".format(name))
+    for name, module in new_modules.items():
+        if name in modules:
+            if modules[name] is not module:
+                effects.append("replaced sys.modules[{}]".format(name))
+        elif getattr(module, "__name__", None) != name:
+            effects.append("added sys.modules[{}]".format(name))
+    for key, value in new_attributes.items():
+        if key in attributes:
+            changed = attributes[key] is not value
+        elif len(key) == 2:
+            # submodules imported since are added to their parent
+            changed = key[0] in modules and not isinstance(value, types.ModuleType)
+        else:
+            changed = key[:2] in attributes
+        if changed:
+            effects.append("patched {}".format(".".join(key)))
+    return effects
+
+def get_custom_node_key(module_path):
+    """Hash of the name, size and mtime of the files of a custom node pack."""
+    files = []
+    if os.path.isfile(module_path):
+        stat = os.stat(module_path)
+        files.append((os.path.basename(module_path), stat.st_mtime_ns, stat.st_size))
+    else:
+        for dirpath, subdirs, filenames in os.walk(module_path):
+            subdirs[:] = [d for d in subdirs if d not in (".git", "__pycache__", "node_modules")]
+            for file_name in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, file_name))
+                except OSError:
+                    continue
+                files.append((os.path.relpath(os.path.join(dirpath, file_name), module_path), stat.st_mtime_ns, stat.st_size))
+    return hashlib.sha256(repr(sorted(files)).encode("utf-8")).hexdigest()
+
+def get_custom_node_manifest(module_path, module_name, module, key, ignore, side_effects):
+    """
+    What importing a custom node pack registers, so it can be registered again without importing it.
+    side_effects is the get_import_side_effects() of its import.
+    """
+    node_names = [x for x in getattr(module, "NODE_CLASS_MAPPINGS", None) or {} if x not in ignore]
+    display_names = {x: y for x, y in (getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", None) or {}).items() if isinstance(x, str) and isinstance(y, str)}
+    return {
+        "version": CUSTOM_NODE_MANIFEST_VERSION,
+        "key": key,
+        "module_name": module_name,
+        "nodes": node_names,
+        "display_names": display_names,
+        "web_directory": EXTENSION_WEB_DIRS.get(module_name, None),
+        # what a pack does when imported besides registering nodes (routes, on_prompt handlers,
+        # model folders, patches...) must happen at startup, not when one of its nodes is first used
+        "side_effects": side_effects,
+        "deferrable": len(node_names) > 0 and len(side_effects) == 0,
+    }
+
+def load_custom_node_manifests(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning("Failed to load the custom node manifests {}, every custom node will be imported: {}".format(path, e))
+        return {}
+
+def save_custom_node_manifests(path, manifests):
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifests, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning("Failed to save the custom node manifests {}: {}".format(path, e))
+
+class LazyCustomNode:
+    """A custom node pack registered from its manifest and imported when one of its nodes is first used."""
+    def __init__(self, module_path, manifest, ignore):
+        self.module_path = module_path
+        self.manifest = manifest
+        self.ignore = ignore
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def register(self):
+        module_name = self.manifest["module_name"]
+        for name in self.manifest["nodes"]:
+            if name not in self.ignore:
+                NODE_CLASS_MAPPINGS[name] = LazyNodeClass(name, (), {"lazy_node": self, "lazy_name": name, "__module__": module_name})
+        NODE_DISPLAY_NAME_MAPPINGS.update(self.manifest["display_names"])
+        web_dir = self.manifest["web_directory"]
+        if web_dir is not None and os.path.isdir(web_dir):
+            EXTENSION_WEB_DIRS[module_name] = web_dir
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            time_before = time.perf_counter()
+            success = load_custom_node(self.module_path, self.ignore)
+            seconds = time.perf_counter() - time_before
+            logging.info("{:6.1f} seconds{}: {} (imported on first use)".format(seconds, "" if success else " (IMPORT FAILED)", self.module_path))
+            startup_report.report.add_custom_node("lazy_import", self.module_path, seconds, success)
+            if args.startup_report is not None:
+                startup_report.report.save(args.startup_report)
+            # the nodes it doesn't register anymore are gone
+            for name in self.manifest["nodes"]:
+                node_class = NODE_CLASS_MAPPINGS.get(name, None)
+                if isinstance(node_class, LazyNodeClass) and node_class.lazy_node is self:
+                    del NODE_CLASS_MAPPINGS[name]
+            self.loaded = True
+
+class LazyNodeClass(type):
+    """
+    Stands in for the node class of a custom node pack that wasn't imported yet.
+    Using the class (reading its attributes or creating an instance) imports the
+    pack, which replaces it with the real class in NODE_CLASS_MAPPINGS.
+    """
+    def __getattr__(cls, name):
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+        return getattr(cls.resolve_lazy_node(), name)
+
+    def __call__(cls, *args, **kwargs):
+        return cls.resolve_lazy_node()(*args, **kwargs)
+
+    def resolve_lazy_node(cls):
+        cls.lazy_node.load()
+        node_class = NODE_CLASS_MAPPINGS.get(cls.lazy_name, None)
+        if node_class is None or isinstance(node_class, LazyNodeClass):
+            raise ImportError("Custom node {} could not be imported from {}".format(cls.lazy_name, cls.lazy_node.module_path))
+        return node_class
+
+def import_custom_node_timed(module_path):
+    time_before = time.perf_counter()
+    try:
+        imported = import_custom_node(module_path)
+    except Exception as e:
+        imported = e
+    return imported, time.perf_counter() - time_before
+
 def load_custom_nodes():
     base_node_names = set(NODE_CLASS_MAPPINGS.keys())
     node_paths = folder_paths.get_folder_paths("custom_nodes")
-    node_import_times = []
+    module_paths = []
     for custom_node_path in node_paths:
         possible_modules = os.listdir(os.path.realpath(custom_node_path))
         if "__pycache__" in possible_modules:
@@ -443,9 +665,74 @@ def load_custom_nodes():
             module_path = os.path.join(custom_node_path, possible_module)
             if os.path.isfile(module_path) and os.path.splitext(module_path)[1] != ".py": continue
             if module_path.endswith(".disabled"): continue
-            time_before = time.perf_counter()
+            module_paths.append(module_path)
+
+    manifests = None
+    keys = {}
+    deferred = {}
+    # packs whose manifest has to be built, they are imported one at a time so their side effects can be told apart
+    outdated = set()
+    if args.custom_node_manifests is not None:
+        manifests = load_custom_node_manifests(args.custom_node_manifests)
+        for module_path in module_paths:
+            keys[module_path] = get_custom_node_key(module_path)
+            manifest = manifests.get(module_path, None)
+            if manifest is None or manifest.get("version", None) != CUSTOM_NODE_MANIFEST_VERSION or manifest.get("key", None) != keys[module_path]:
+                outdated.add(module_path)
+            elif manifest.get("deferrable", False):
+                deferred[module_path] = LazyCustomNode(module_path, manifest, base_node_names)
+
+    # packs whose manifest says they only register nodes are imported on a thread pool, they are still
+    # registered in order below and the ones that fail are imported again on their own in case it was
+    # because of another one. The others (and every pack without a manifest) may patch folder_paths,
+    # sys.path or ComfyUI modules when imported so they are imported one at a time in order.
+    imported = {}
+    if args.parallel_custom_nodes > 1 and manifests is not None:
+        to_import = [x for x in module_paths if x not in deferred and x not in outdated and len(manifests[x].get("side_effects", None) or []) == 0]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.parallel_custom_nodes, thread_name_prefix="custom_node_import") as pool:
+            for module_path, result in zip(to_import, pool.map(import_custom_node_timed, to_import)):
+                if not isinstance(result[0], Exception):
+                    imported[module_path] = result
+
+    node_import_times = []
+    manifests_changed = False
+    for module_path in module_paths:
+        if module_path in deferred:
+            deferred[module_path].register()
+            startup_report.report.add_custom_node("import", module_path, 0.0, True, deferred=True, nodes=len(deferred[module_path].manifest["nodes"]))
+            continue
+
+        state = None
+        if module_path in outdated:
+            state = get_import_state()
+        time_before = time.perf_counter()
+        if module_path in imported:
+            success = load_custom_node(module_path, base_node_names, imported=imported[module_path][0])
+            import_time = imported[module_path][1] + time.perf_counter() - time_before
+        else:
             success = load_custom_node(module_path, base_node_names)
-            node_import_times.append((time.perf_counter() - time_before, module_path, success))
+            import_time = time.perf_counter() - time_before
+        node_import_times.append((import_time, module_path, success))
+
+        module = None
+        module_name = get_custom_node_module_name(module_path)
+        if success:
+            module = sys.modules.get(module_name, None)
+        startup_report.report.add_custom_node("import", module_path, import_time, success, deferred=False,
+                                              parallel=module_path in imported, nodes=len(getattr(module, "NODE_CLASS_MAPPINGS", None) or {}))
+        if manifests is not None:
+            if not success or module is None:
+                manifests.pop(module_path, None)
+                manifests_changed = True
+            elif state is not None:
+                side_effects = get_import_side_effects(state, get_import_state())
+                if len(side_effects) > 0:
+                    logging.debug("{} is imported at startup because of what it does when imported: {}".format(module_path, ", ".join(side_effects)))
+                manifests[module_path] = get_custom_node_manifest(module_path, module_name, module, keys[module_path], base_node_names, side_effects)
+                manifests_changed = True
+
+    if manifests_changed:
+        save_custom_node_manifests(args.custom_node_manifests, manifests)
 
     if len(node_import_times) > 0:
         logging.info("\nImport times for custom nodes:")
@@ -456,6 +743,8 @@ def load_custom_nodes():
                 import_message = " (IMPORT FAILED)"
             logging.info("{:6.1f} seconds{}: {}".format(n[0], import_message, n[1]))
         logging.info("")
+    if len(deferred) > 0:
+        logging.info("{} custom node packs will be imported when their nodes are first used.".format(len(deferred)))
 
 def init_custom_nodes():
     extras_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "comfy_extras")
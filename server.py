@@ -1,6 +1,7 @@
 import os
 import sys
 import asyncio
+import threading
 import traceback
 
 import nodes
@@ -12,6 +13,9 @@ import json
 import glob
 import struct
 import ssl
+import collections
+import hashlib
+import concurrent.futures
 from PIL import Image, ImageOps
 from PIL.PngImagePlugin import PngInfo
 from io import BytesIO
@@ -20,15 +24,24 @@ import aiohttp
 from aiohttp import web
 import logging
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 import mimetypes
 from comfy.cli_args import args
 import comfy.utils
+import comfy_execution.caching
 
 from app.user_manager import UserManager
+from app.view_cache import ViewCache
 
 class BinaryEventTypes:
     PREVIEW_IMAGE = 1
     UNENCODED_PREVIEW_IMAGE = 2
+    # {"type": event, "data": data} encoded with msgpack, for sockets opened with ?encoding=msgpack
+    MSGPACK_EVENT = 3
 
 async def send_socket_catch_exception(function, message):
     try:
@@ -36,6 +49,75 @@ async def send_socket_catch_exception(function, message):
     except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError) as err:
         logging.warning("send error: {}".format(err))
 
+class SocketSender:
+    """
+    Messages waiting to be sent to one websocket. Every socket is sent to by
+    its own task so a slow client only delays itself. When more than
+    max_previews previews are waiting the oldest one is dropped, a client that
+    lets max_pending other messages pile up is disconnected.
+    """
+    def __init__(self, ws, encoding="json", max_pending=4096, max_previews=2):
+        self.ws = ws
+        self.encoding = encoding
+        self.max_pending = max_pending
+        self.max_previews = max_previews
+        self.pending = collections.deque()
+        self.previews = 0
+        self.closed = False
+        self.ready = asyncio.Event()
+        self.task = asyncio.ensure_future(self.run())
+
+    def put(self, message, preview=False):
+        # nothing is sent anymore, don't keep the messages until the sid is removed
+        if self.closed or self.ws.closed:
+            return
+        if preview:
+            if self.previews >= self.max_previews:
+                for x in self.pending:
+                    if x[1]:
+                        self.pending.remove(x)
+                        self.previews -= 1
+                        break
+            self.previews += 1
+        elif len(self.pending) - self.previews >= self.max_pending:
+            logging.warning("closing a websocket that doesn't keep up with the messages sent to it")
+            self.close()
+            asyncio.ensure_future(self.ws.close())
+            return
+        self.pending.append((message, preview))
+        self.ready.set()
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while len(self.pending) > 0:
+                message, preview = self.pending.popleft()
+                if preview:
+                    self.previews -= 1
+                if isinstance(message, str):
+                    await send_socket_catch_exception(self.ws.send_str, message)
+                else:
+                    await send_socket_catch_exception(self.ws.send_bytes, message)
+
+    def close(self):
+        self.closed = True
+        self.pending.clear()
+        self.previews = 0
+        self.task.cancel()
+
+def etag_matches(if_none_match, etag):
+    # a comma separated list of ETags, weak ones (W/"...") match too, or *
+    if if_none_match is None:
+        return False
+    for x in if_none_match.split(","):
+        x = x.strip()
+        if x.startswith("W/"):
+            x = x[2:]
+        if x == "*" or x == etag:
+            return True
+    return False
+
 @web.middleware
 async def cache_control(request: web.Request, handler):
     response: web.Response = await handler(request)
@@ -69,10 +151,18 @@ class PromptServer():
 
         self.user_manager = UserManager()
         self.supports = ["custom_nodes_from_web"]
+        if msgpack is not None:
+            self.supports.append("msgpack_events")
         self.prompt_queue = None
         self.loop = loop
         self.messages = asyncio.Queue()
         self.number = 0
+        # status and progress messages are coalesced, see queue_updated() and send_sync()
+        self.status_interval = 0.1
+        self.status_pending = False
+        self.last_status_time = 0
+        self.pending_progress = {}
+        self.coalesce_lock = threading.Lock()
 
         middlewares = [cache_control]
         if args.enable_cors_header:
@@ -81,14 +171,25 @@ class PromptServer():
         max_upload_size = round(args.max_upload_size * 1024 * 1024)
         self.app = web.Application(client_max_size=max_upload_size, middlewares=middlewares)
         self.sockets = dict()
+        self.socket_senders = dict()
         self.web_root = os.path.join(os.path.dirname(
             os.path.realpath(__file__)), "web")
         routes = web.RouteTableDef()
         self.routes = routes
+        # client_id, last_prompt_id and last_node_id are per prompt worker thread
+        self.execution_context = threading.local()
+        self.running_prompts = {}
         self.last_node_id = None
         self.client_id = None
 
         self.on_prompt_handlers = []
+        # decoding and encoding images is kept off the event loop on a bounded pool
+        self.image_pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.image_workers, thread_name_prefix="image_worker")
+        self.view_cache = ViewCache(os.path.join(folder_paths.get_temp_directory(), "view_cache"), args.view_cache_size * 1024 * 1024)
+        # node_info() results per class and the last /object_info response
+        self.object_info_lock = threading.Lock()
+        self.object_info_classes = {}
+        self.object_info_response = None
 
         @routes.get('/ws')
         async def websocket_handler(request):
@@ -98,23 +199,37 @@ class PromptServer():
             if sid:
                 # Reusing existing session, remove old
                 self.sockets.pop(sid, None)
+                old_sender = self.socket_senders.pop(sid, None)
+                if old_sender is not None:
+                    old_sender.close()
             else:
                 sid = uuid.uuid4().hex
 
+            # clients can ask for the events to be sent as msgpack instead of JSON text
+            encoding = "json"
+            if request.rel_url.query.get('encoding', '') == "msgpack" and msgpack is not None:
+                encoding = "msgpack"
+
             self.sockets[sid] = ws
+            sender = SocketSender(ws, encoding)
+            self.socket_senders[sid] = sender
 
             try:
                 # Send initial state to the new client
                 await self.send("status", { "status": self.get_queue_info(), 'sid': sid }, sid)
-                # On reconnect if we are the currently executing client send the current node
-                if self.client_id == sid and self.last_node_id is not None:
-                    await self.send("executing", { "node": self.last_node_id }, sid)
+                # On reconnect if we are a currently executing client send the current node
+                for prompt_id, (client_id, node_id) in list(self.running_prompts.items()):
+                    if client_id == sid:
+                        await self.send("executing", { "node": node_id, "prompt_id": prompt_id }, sid)
                     
                 async for msg in ws:
                     if msg.type == aiohttp.WSMsgType.ERROR:
                         logging.warning('ws connection closed with exception %s' % ws.exception())
             finally:
-                self.sockets.pop(sid, None)
+                if self.sockets.get(sid, None) is ws:
+                    self.sockets.pop(sid, None)
+                    self.socket_senders.pop(sid, None)
+                sender.close()
             return ws
 
         @routes.get("/")
@@ -199,7 +314,7 @@ class PromptServer():
         @routes.post("/upload/image")
         async def upload_image(request):
             post = await request.post()
-            return image_upload(post)
+            return await self.loop.run_in_executor(self.image_pool, image_upload, post)
 
 
         @routes.post("/upload/mask")
@@ -243,7 +358,7 @@ class PromptServer():
                         original_pil.putalpha(new_alpha)
                         original_pil.save(filepath, compress_level=4, pnginfo=metadata)
 
-            return image_upload(post, image_save_function)
+            return await self.loop.run_in_executor(self.image_pool, image_upload, post, image_save_function)
 
         @routes.get("/view")
         async def view_image(request):
@@ -272,64 +387,35 @@ class PromptServer():
                 file = os.path.join(output_dir, filename)
 
                 if os.path.isfile(file):
-                    if 'preview' in request.rel_url.query:
-                        with Image.open(file) as img:
-                            preview_info = request.rel_url.query['preview'].split(';')
-                            image_format = preview_info[0]
-                            if image_format not in ['webp', 'jpeg'] or 'a' in request.rel_url.query.get('channel', ''):
-                                image_format = 'webp'
-
-                            quality = 90
-                            if preview_info[-1].isdigit():
-                                quality = int(preview_info[-1])
-
-                            buffer = BytesIO()
-                            if image_format in ['jpeg'] or request.rel_url.query.get('channel', '') == 'rgb':
-                                img = img.convert("RGB")
-                            img.save(buffer, format=image_format, quality=quality)
-                            buffer.seek(0)
-
-                            return web.Response(body=buffer.read(), content_type=f'image/{image_format}',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-
+                    # output files can be overwritten, clients have to revalidate them (cheap with the 304s FileResponse sends)
+                    headers = {"Content-Disposition": f"filename=\"{filename}\"", "Cache-Control": "no-cache"}
                     if 'channel' not in request.rel_url.query:
                         channel = 'rgba'
                     else:
                         channel = request.rel_url.query["channel"]
 
-                    if channel == 'rgb':
-                        with Image.open(file) as img:
-                            if img.mode == "RGBA":
-                                r, g, b, a = img.split()
-                                new_img = Image.merge('RGB', (r, g, b))
-                            else:
-                                new_img = img.convert("RGB")
+                    variant = None
+                    if 'preview' in request.rel_url.query:
+                        preview_info = request.rel_url.query['preview'].split(';')
+                        image_format = preview_info[0]
+                        if image_format not in ['webp', 'jpeg'] or 'a' in request.rel_url.query.get('channel', ''):
+                            image_format = 'webp'
+
+                        quality = 90
+                        if preview_info[-1].isdigit():
+                            quality = int(preview_info[-1])
+                        variant = ("preview", image_format, quality, request.rel_url.query.get('channel', ''))
+                    elif channel == 'rgb':
+                        variant = ("rgb", "png")
+                    elif channel == 'a':
+                        variant = ("a", "png")
 
-                            buffer = BytesIO()
-                            new_img.save(buffer, format='PNG')
-                            buffer.seek(0)
+                    if variant is None:
+                        return web.FileResponse(file, headers=headers)
 
-                            return web.Response(body=buffer.read(), content_type='image/png',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-
-                    elif channel == 'a':
-                        with Image.open(file) as img:
-                            if img.mode == "RGBA":
-                                _, _, _, a = img.split()
-                            else:
-                                a = Image.new('L', img.size, 255)
-
-                            # alpha img
-                            alpha_img = Image.new('RGBA', img.size)
-                            alpha_img.putalpha(a)
-                            alpha_buffer = BytesIO()
-                            alpha_img.save(alpha_buffer, format='PNG')
-                            alpha_buffer.seek(0)
-
-                            return web.Response(body=alpha_buffer.read(), content_type='image/png',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-                    else:
-                        return web.FileResponse(file, headers={"Content-Disposition": f"filename=\"{filename}\""})
+                    path = await self.loop.run_in_executor(self.image_pool, self.view_cache.get, file, variant)
+                    headers["Content-Type"] = f"image/{variant[1]}"
+                    return web.FileResponse(path, headers=headers)
 
             return web.Response(status=404)
 
@@ -382,10 +468,10 @@ class PromptServer():
         async def get_prompt(request):
             return web.json_response(self.get_queue_info())
 
-        def node_info(node_class):
+        def node_info(node_class, input_types=None):
             obj_class = nodes.NODE_CLASS_MAPPINGS[node_class]
             info = {}
-            info['input'] = obj_class.INPUT_TYPES()
+            info['input'] = input_types if input_types is not None else comfy_execution.caching.get_input_types(obj_class)
             info['output'] = obj_class.RETURN_TYPES
             info['output_is_list'] = obj_class.OUTPUT_IS_LIST if hasattr(obj_class, 'OUTPUT_IS_LIST') else [False] * len(obj_class.RETURN_TYPES)
             info['output_name'] = obj_class.RETURN_NAMES if hasattr(obj_class, 'RETURN_NAMES') else info['output']
@@ -402,23 +488,58 @@ class PromptServer():
                 info['category'] = obj_class.CATEGORY
             return info
 
+        def cached_node_info(node_class):
+            # INPUT_TYPES() is called for every request, its result is only cached until the folders
+            # it lists change (or not at all), the info of a class is only built again when it differs
+            # so the response below and its ETag only change when the content does
+            obj_class = nodes.NODE_CLASS_MAPPINGS[node_class]
+            input_types = comfy_execution.caching.get_input_types(obj_class)
+            entry = self.object_info_classes.get(node_class, None)
+            if entry is not None and entry[0] is obj_class and (entry[1] is input_types or entry[1] == input_types):
+                return entry[2]
+            info = node_info(node_class, input_types)
+            self.object_info_classes[node_class] = (obj_class, info['input'], info)
+            return info
+
+        def single_node_info(node_class):
+            with self.object_info_lock:
+                return cached_node_info(node_class)
+
+        def object_info_response():
+            with self.object_info_lock:
+                infos = []
+                for x in list(nodes.NODE_CLASS_MAPPINGS):
+                    try:
+                        infos.append((x, cached_node_info(x)))
+                    except Exception as e:
+                        logging.error(f"[ERROR] An error occurred while retrieving information for the '{x}' node.")
+                        logging.error(traceback.format_exc())
+
+                last = self.object_info_response
+                if last is not None and len(last[0]) == len(infos) and all(a[0] == b[0] and a[1] is b[1] for a, b in zip(last[0], infos)):
+                    return last[1], last[2]
+                body = json.dumps(dict(infos)).encode("utf-8")
+                etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                self.object_info_response = (infos, body, etag)
+                return body, etag
+
         @routes.get("/object_info")
         async def get_object_info(request):
-            out = {}
-            for x in nodes.NODE_CLASS_MAPPINGS:
-                try:
-                    out[x] = node_info(x)
-                except Exception as e:
-                    logging.error(f"[ERROR] An error occurred while retrieving information for the '{x}' node.")
-                    logging.error(traceback.format_exc())
-            return web.json_response(out)
+            if request.rel_url.query.get("refresh", "false").lower() == "true":
+                # the options of some nodes come from more than the folders they list
+                comfy_execution.caching.input_types_cache.clear()
+            body, etag = await self.loop.run_in_executor(None, object_info_response)
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if etag_matches(request.headers.get("If-None-Match", None), etag):
+                return web.Response(status=304, headers=headers)
+            return web.Response(body=body, content_type="application/json", headers=headers)
 
         @routes.get("/object_info/{node_class}")
         async def get_object_info_node(request):
             node_class = request.match_info.get("node_class", None)
             out = {}
             if (node_class is not None) and (node_class in nodes.NODE_CLASS_MAPPINGS):
-                out[node_class] = node_info(node_class)
+                out[node_class] = await self.loop.run_in_executor(None, single_node_info, node_class)
             return web.json_response(out)
 
         @routes.get("/history")
@@ -426,13 +547,22 @@ class PromptServer():
             max_items = request.rel_url.query.get("max_items", None)
             if max_items is not None:
                 max_items = int(max_items)
-            return web.json_response(self.prompt_queue.get_history(max_items=max_items))
+            offset = int(request.rel_url.query.get("offset", -1))
+            return web.json_response(self.prompt_queue.get_history(max_items=max_items, offset=offset))
 
         @routes.get("/history/{prompt_id}")
         async def get_history(request):
             prompt_id = request.match_info.get("prompt_id", None)
             return web.json_response(self.prompt_queue.get_history(prompt_id=prompt_id))
 
+        @routes.get("/history/{prompt_id}/profile")
+        async def get_history_profile(request):
+            prompt_id = request.match_info.get("prompt_id", None)
+            history = self.prompt_queue.get_history(prompt_id=prompt_id)
+            if prompt_id not in history:
+                return web.Response(status=404)
+            return web.json_response({prompt_id: history[prompt_id].get("profile", None)})
+
         @routes.get("/queue")
         async def get_queue(request):
             queue_info = {}
@@ -460,18 +590,22 @@ class PromptServer():
                 self.number += 1
 
             if "prompt" in json_data:
+                if self.prompt_queue.is_full(json_data.get("client_id", None)):
+                    return web.json_response({"error": "too many prompts queued for this client", "node_errors": []}, status=429)
                 prompt = json_data["prompt"]
-                valid = execution.validate_prompt(prompt)
-                extra_data = {}
-                if "extra_data" in json_data:
-                    extra_data = json_data["extra_data"]
-
-                if "client_id" in json_data:
-                    extra_data["client_id"] = json_data["client_id"]
+                # INPUT_TYPES() and VALIDATE_INPUTS can hit the disk so keep them off the event loop
+                valid = await self.loop.run_in_executor(None, execution.validate_prompt, prompt)
+                try:
+                    extra_data = self.get_prompt_extra_data(json_data)
+                except ValueError as e:
+                    return web.json_response({"error": str(e), "node_errors": []}, status=400)
                 if valid[0]:
                     prompt_id = str(uuid.uuid4())
                     outputs_to_execute = valid[2]
-                    self.prompt_queue.put((number, prompt_id, prompt, extra_data, outputs_to_execute))
+                    try:
+                        self.prompt_queue.put((number, prompt_id, prompt, extra_data, outputs_to_execute))
+                    except execution.QueueFullError as e:
+                        return web.json_response({"error": str(e), "node_errors": []}, status=429)
                     response = {"prompt_id": prompt_id, "number": number, "node_errors": valid[3]}
                     return web.json_response(response)
                 else:
@@ -480,6 +614,44 @@ class PromptServer():
             else:
                 return web.json_response({"error": "no prompt", "node_errors": []}, status=400)
 
+        @routes.post("/prompt/batch")
+        async def post_prompt_batch(request):
+            json_data =  await request.json()
+            json_data = self.trigger_on_prompt(json_data)
+            if "prompt" not in json_data:
+                return web.json_response({"error": "no prompt", "node_errors": []}, status=400)
+            overrides = json_data.get("overrides", [])
+            if not isinstance(overrides, list) or len(overrides) == 0:
+                return web.json_response({"error": "overrides must be a non empty list", "node_errors": []}, status=400)
+            logging.info("got prompt batch of {}".format(len(overrides)))
+            try:
+                extra_data = self.get_prompt_extra_data(json_data)
+            except ValueError as e:
+                return web.json_response({"error": str(e), "node_errors": []}, status=400)
+
+            valid = await self.loop.run_in_executor(None, execution.validate_prompt_batch, json_data["prompt"], overrides)
+            if not valid[0]:
+                logging.warning("invalid prompt batch: {}".format(valid[1]))
+                return web.json_response({"error": valid[1], "node_errors": valid[3]}, status=400)
+
+            items = []
+            for prompt in valid[4]:
+                number = self.number
+                if json_data.get("front", False):
+                    number = -number
+                self.number += 1
+                items.append((number, str(uuid.uuid4()), prompt, dict(extra_data), valid[2]))
+            try:
+                self.prompt_queue.put_many(items)
+            except execution.QueueFullError as e:
+                return web.json_response({"error": str(e), "node_errors": []}, status=429)
+            response = {"prompt_ids": [x[1] for x in items], "numbers": [x[0] for x in items], "node_errors": valid[3]}
+            return web.json_response(response)
+
+        @routes.get("/queue/metrics")
+        async def get_queue_metrics(request):
+            return web.json_response(self.prompt_queue.get_metrics())
+
         @routes.post("/queue")
         async def post_queue(request):
             json_data =  await request.json()
@@ -487,16 +659,18 @@ class PromptServer():
                 if json_data["clear"]:
                     self.prompt_queue.wipe_queue()
             if "delete" in json_data:
-                to_delete = json_data['delete']
-                for id_to_delete in to_delete:
-                    delete_func = lambda a: a[1] == id_to_delete
-                    self.prompt_queue.delete_queue_item(delete_func)
+                self.prompt_queue.delete_queue_items(json_data['delete'])
 
             return web.Response(status=200)
 
         @routes.post("/interrupt")
         async def post_interrupt(request):
-            nodes.interrupt_processing()
+            prompt_id = None
+            if request.can_read_body:
+                json_data = await request.json()
+                if isinstance(json_data, dict):
+                    prompt_id = json_data.get("prompt_id", None)
+            self.prompt_queue.interrupt(prompt_id)
             return web.Response(status=200)
 
         @routes.post("/free")
@@ -536,6 +710,59 @@ class PromptServer():
             web.static('/', self.web_root),
         ])
 
+    @property
+    def client_id(self):
+        return getattr(self.execution_context, "client_id", None)
+
+    @client_id.setter
+    def client_id(self, client_id):
+        self.execution_context.client_id = client_id
+
+    @property
+    def last_prompt_id(self):
+        return getattr(self.execution_context, "last_prompt_id", None)
+
+    @last_prompt_id.setter
+    def last_prompt_id(self, prompt_id):
+        self.execution_context.last_prompt_id = prompt_id
+
+    @property
+    def last_node_id(self):
+        return getattr(self.execution_context, "last_node_id", None)
+
+    @last_node_id.setter
+    def last_node_id(self, node_id):
+        self.execution_context.last_node_id = node_id
+        prompt_id = self.last_prompt_id
+        if prompt_id is not None:
+            if node_id is None:
+                self.running_prompts.pop(prompt_id, None)
+            else:
+                self.running_prompts[prompt_id] = (self.client_id, node_id)
+
+    def get_execution_context(self):
+        return vars(self.execution_context).copy()
+
+    def set_execution_context(self, context):
+        vars(self.execution_context).update(context)
+
+    def get_prompt_extra_data(self, json_data):
+        extra_data = {}
+        if "extra_data" in json_data:
+            extra_data = json_data["extra_data"]
+
+        if "client_id" in json_data:
+            extra_data["client_id"] = json_data["client_id"]
+        if "priority_class" in json_data:
+            if json_data["priority_class"] not in args.priority_classes:
+                raise ValueError("unknown priority_class: {}".format(json_data["priority_class"]))
+            extra_data["priority_class"] = json_data["priority_class"]
+        if "worker_tag" in json_data:
+            if json_data["worker_tag"] not in (args.prompt_workers or []):
+                raise ValueError("unknown worker_tag: {}".format(json_data["worker_tag"]))
+            extra_data["worker_tag"] = json_data["worker_tag"]
+        return extra_data
+
     def get_queue_info(self):
         prompt_info = {}
         exec_info = {}
@@ -561,6 +788,11 @@ class PromptServer():
         return message
 
     async def send_image(self, image_data, sid=None):
+        # encoding the preview takes a while, keep it off the event loop
+        preview_bytes = await self.loop.run_in_executor(None, self.encode_image, image_data)
+        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+
+    def encode_image(self, image_data):
         image_type = image_data[0]
         image = image_data[1]
         max_size = image_data[2]
@@ -581,40 +813,81 @@ class PromptServer():
         header = struct.pack(">I", type_num)
         bytesIO.write(header)
         image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+        return bytesIO.getvalue()
+
+    def get_senders(self, sid):
+        if sid is None:
+            return list(self.socket_senders.values())
+        if sid in self.socket_senders:
+            return [self.socket_senders[sid]]
+        return []
 
+    # messages are encoded once and handed to the sender of every socket, they are sent concurrently
     async def send_bytes(self, event, data, sid=None):
         message = self.encode_bytes(event, data)
-
-        if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_bytes, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_bytes, message)
+        preview = event == BinaryEventTypes.PREVIEW_IMAGE
+        for sender in self.get_senders(sid):
+            sender.put(message, preview)
 
     async def send_json(self, event, data, sid=None):
         message = {"type": event, "data": data}
-
-        if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_json, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_json, message)
+        encoded = {}
+        for sender in self.get_senders(sid):
+            if sender.encoding not in encoded:
+                encoded[sender.encoding] = self.encode_message(message, sender.encoding)
+            sender.put(encoded[sender.encoding])
+
+    def encode_message(self, message, encoding):
+        if encoding == "msgpack":
+            try:
+                return self.encode_bytes(BinaryEventTypes.MSGPACK_EVENT, msgpack.packb(message))
+            except (TypeError, ValueError):
+                # fall back to JSON for data msgpack doesn't know about
+                pass
+        return json.dumps(message)
 
     def send_sync(self, event, data, sid=None):
+        if event == "progress":
+            # only the latest progress of a node is sent, the message queued first carries it
+            key = (sid, data.get("prompt_id", None), data.get("node", None))
+            with self.coalesce_lock:
+                queued = key in self.pending_progress
+                self.pending_progress[key] = data
+            if queued:
+                return
+            data = key
         self.loop.call_soon_threadsafe(
             self.messages.put_nowait, (event, data, sid))
 
     def queue_updated(self):
-        self.send_sync("status", { "status": self.get_queue_info() })
+        # can be called from any thread, the status is broadcast at most once per status_interval
+        with self.coalesce_lock:
+            if self.status_pending:
+                return
+            self.status_pending = True
+        self.loop.call_soon_threadsafe(self.schedule_status)
+
+    def schedule_status(self):
+        delay = self.last_status_time + self.status_interval - self.loop.time()
+        self.loop.call_later(max(delay, 0), self.send_status)
+
+    def send_status(self):
+        with self.coalesce_lock:
+            self.status_pending = False
+        self.last_status_time = self.loop.time()
+        self.messages.put_nowait(("status", { "status": self.get_queue_info() }, None))
 
     async def publish_loop(self):
         while True:
-            msg = await self.messages.get()
-            await self.send(*msg)
+            event, data, sid = await self.messages.get()
+            if event == "progress":
+                with self.coalesce_lock:
+                    data = self.pending_progress.pop(data)
+            try:
+                await self.send(event, data, sid)
+            except (TypeError, ValueError) as e:
+                # data that can't be encoded must not stop the messages that come after it
+                logging.warning("Failed to encode {} message: {}".format(event, e))
 
     async def start(self, address, port, verbose=True, call_on_start=None):
         runner = web.AppRunner(self.app, access_log=None)
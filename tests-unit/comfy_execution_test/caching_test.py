@@ -0,0 +1,110 @@
+import pytest
+
+import nodes
+from comfy_execution.caching import OutputCache
+
+class Add:
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"a": ("INT", {}), "b": ("INT", {})}}
+
+class Save:
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})},
+                "hidden": {"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"}}
+
+class Changing(Add):
+    @classmethod
+    def IS_CHANGED(s, a, b):
+        return float("NaN")
+
+@pytest.fixture(autouse=True)
+def node_classes(monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestAdd", Add)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestSave", Save)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestChanging", Changing)
+
+def add_prompt(first, second, value=1):
+    return {
+        first: {"class_type": "TestAdd", "inputs": {"a": value, "b": 2}},
+        second: {"class_type": "TestAdd", "inputs": {"a": [first, 0], "b": 3}},
+    }
+
+def no_is_changed(node_id):
+    return ""
+
+def run(cache, prompt, extra_data=None, is_changed=no_is_changed):
+    cache.set_prompt(prompt, is_changed, extra_data)
+    hits = [x for x in prompt if cache.get(x) is not None]
+    for x in prompt:
+        if cache.get(x) is None:
+            cache.set(x, [[x]], None)
+    cache.clean_unused()
+    return sorted(hits)
+
+def test_renumbered_graph_hits():
+    cache = OutputCache()
+    assert run(cache, add_prompt("1", "2")) == []
+    assert run(cache, add_prompt("7", "3")) == ["3", "7"]
+
+def test_changed_input_misses_downstream():
+    cache = OutputCache(lru_size=10)
+    run(cache, add_prompt("1", "2"))
+    assert run(cache, add_prompt("1", "2", value=5)) == []
+
+def test_always_changed_never_hits():
+    cache = OutputCache()
+    prompt = {"1": {"class_type": "TestChanging", "inputs": {"a": 1, "b": 2}}}
+    is_changed = lambda x: Changing.IS_CHANGED(**prompt[x]["inputs"])
+    run(cache, prompt, is_changed=is_changed)
+    assert run(cache, prompt, is_changed=is_changed) == []
+
+def test_lru_eviction():
+    cache = OutputCache(lru_size=2)
+    run(cache, add_prompt("1", "2", value=1))
+    run(cache, add_prompt("1", "2", value=2))
+    # two results of the first prompt are kept as extra entries
+    assert run(cache, add_prompt("1", "2", value=1)) == ["1", "2"]
+    run(cache, add_prompt("1", "2", value=3))
+    # the results of value=2 were least recently used and got evicted
+    assert run(cache, add_prompt("1", "2", value=2)) == []
+
+def test_no_lru_keeps_only_the_last_prompt():
+    cache = OutputCache()
+    run(cache, add_prompt("1", "2", value=1))
+    run(cache, add_prompt("1", "2", value=2))
+    assert run(cache, add_prompt("1", "2", value=1)) == []
+
+def test_pinned_results_survive_cleanup():
+    cache = OutputCache()
+    run(cache, add_prompt("1", "2", value=1))
+    cache.pin(cache.signatures.values())
+    run(cache, add_prompt("1", "2", value=2))
+    assert run(cache, add_prompt("1", "2", value=1)) == ["1", "2"]
+
+def save_prompt(first, second):
+    prompt = add_prompt(first, "5")
+    prompt[second] = {"class_type": "TestSave", "inputs": {"value": ["5", 0]}}
+    return prompt
+
+def test_hidden_prompt_input_is_part_of_the_signature():
+    cache = OutputCache()
+    run(cache, save_prompt("1", "2"))
+    # the producing nodes are reused, the node receiving PROMPT is not
+    assert run(cache, save_prompt("9", "2")) == ["5", "9"]
+    assert run(cache, save_prompt("9", "2")) == ["2", "5", "9"]
+
+def test_hidden_extra_pnginfo_is_part_of_the_signature():
+    cache = OutputCache()
+    prompt = save_prompt("1", "2")
+    run(cache, prompt, {"extra_pnginfo": {"workflow": 1}})
+    assert run(cache, prompt, {"extra_pnginfo": {"workflow": 2}}) == ["1", "5"]
+    assert run(cache, prompt, {"extra_pnginfo": {"workflow": 2}}) == ["1", "2", "5"]
@@ -0,0 +1,119 @@
+import pytest
+
+from comfy_execution.graph import ExecutionList, DependencyCycleError, postorder
+
+def node(*links, **values):
+    inputs = dict(values)
+    for i, link in enumerate(links):
+        inputs["in{}".format(i)] = [link, 0]
+    return {"class_type": "Test", "inputs": inputs}
+
+def run(execution_list):
+    order = []
+    while not execution_list.is_empty():
+        unique_id = execution_list.stage_node_execution()
+        order.append(unique_id)
+        execution_list.complete_node_execution(unique_id)
+    return order
+
+def run_until(execution_list, unique_id):
+    order = []
+    while True:
+        x = execution_list.stage_node_execution()
+        order.append(x)
+        if x == unique_id:
+            return order
+        execution_list.complete_node_execution(x)
+
+def test_postorder_dependencies_first():
+    prompt = {"1": node(), "2": node("1"), "3": node("1", "2"), "4": node("3")}
+    assert list(postorder(prompt, ["4"])) == ["1", "2", "3", "4"]
+
+def test_postorder_long_chain():
+    prompt = {"0": node()}
+    for i in range(1, 5000):
+        prompt[str(i)] = node(str(i - 1))
+    assert list(postorder(prompt, ["4999"])) == [str(i) for i in range(5000)]
+
+def test_execution_order():
+    prompt = {"1": node(), "2": node("1"), "3": node("1"), "4": node("2", "3")}
+    execution_list = ExecutionList(prompt, [])
+    execution_list.add_output("4")
+    assert run(execution_list) == ["1", "2", "3", "4"]
+
+def test_cached_nodes_are_skipped():
+    prompt = {"1": node(), "2": node("1"), "3": node("2")}
+    execution_list = ExecutionList(prompt, ["2"])
+    execution_list.add_output("3")
+    assert run(execution_list) == ["3"]
+
+def test_smallest_output_first():
+    prompt = {"1": node(), "2": node("1"), "3": node("2"), "4": node()}
+    execution_list = ExecutionList(prompt, [])
+    execution_list.add_output("3")
+    execution_list.add_output("4")
+    assert run(execution_list) == ["4", "1", "2", "3"]
+
+def test_shared_nodes_run_once():
+    prompt = {"1": node(), "2": node("1"), "3": node("1")}
+    execution_list = ExecutionList(prompt, [])
+    execution_list.add_output("2")
+    execution_list.add_output("3")
+    order = run(execution_list)
+    assert sorted(order) == ["1", "2", "3"]
+    assert order[0] == "1"
+
+def test_get_plan_does_not_change_the_list():
+    prompt = {"1": node(), "2": node("1"), "3": node("2")}
+    execution_list = ExecutionList(prompt, [])
+    execution_list.add_output("3")
+    assert execution_list.get_plan() == ["1", "2", "3"]
+    assert run(execution_list) == ["1", "2", "3"]
+
+def test_staged_nodes_block_until_completed():
+    prompt = {"1": node(), "2": node(), "3": node("1", "2")}
+    execution_list = ExecutionList(prompt, [])
+    execution_list.add_output("3")
+    assert execution_list.stage_node_execution() == "1"
+    assert execution_list.stage_node_execution() == "2"
+    assert execution_list.stage_node_execution() is None
+    execution_list.complete_node_execution("2")
+    assert execution_list.stage_node_execution() is None
+    execution_list.complete_node_execution("1")
+    assert execution_list.stage_node_execution() == "3"
+
+def test_other_outputs_are_staged_while_blocked():
+    prompt = {"1": node(), "2": node("1"), "3": node(), "4": node("3"), "5": node()}
+    execution_list = ExecutionList(prompt, [])
+    for x in ["2", "4", "5"]:
+        execution_list.add_output(x)
+    assert execution_list.stage_node_execution() == "5"
+    assert execution_list.stage_node_execution() is None
+    assert execution_list.stage_node_execution(lambda x: True) == "1"
+    assert execution_list.stage_node_execution(lambda x: x != "3") is None
+    assert execution_list.stage_node_execution(lambda x: True) == "3"
+    execution_list.complete_node_execution("3")
+    execution_list.complete_node_execution("5")
+    execution_list.complete_node_execution("1")
+    assert sorted(run(execution_list)) == ["2", "4"]
+
+def test_lazy_inputs_are_restaged():
+    prompt = {"1": node(), "2": node(), "3": node("1", "2")}
+    execution_list = ExecutionList(prompt, [], lambda x: {"in1"} if x == "3" else set())
+    execution_list.add_output("3")
+    assert run_until(execution_list, "3") == ["1", "3"]
+    execution_list.add_dependencies("3", ["2"])
+    assert run(execution_list) == ["2", "3"]
+
+def test_lazy_inputs_are_not_followed():
+    prompt = {"1": node(), "2": node(), "3": node("1", "2")}
+    execution_list = ExecutionList(prompt, [], lambda x: {"in1"} if x == "3" else set())
+    execution_list.add_output("3")
+    assert run(execution_list) == ["1", "3"]
+
+def test_cycle():
+    prompt = {"1": node("2"), "2": node("1"), "3": node("2")}
+    execution_list = ExecutionList(prompt, [])
+    execution_list.add_output("3")
+    with pytest.raises(DependencyCycleError):
+        run(execution_list)
@@ -0,0 +1,112 @@
+import pytest
+
+from comfy_execution.history import PromptHistory
+
+def entry(i):
+    return {"prompt": [i, "p{}".format(i)], "outputs": {}, "status": None}
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "history.db")
+
+def fill(history, count):
+    for i in range(count):
+        history.add("p{}".format(i), entry(i))
+
+def test_memory_only_keeps_the_newest():
+    history = PromptHistory(3)
+    fill(history, 5)
+    assert len(history) == 3
+    assert list(history.get_page()) == ["p2", "p3", "p4"]
+    assert "p0" not in history
+    assert history.get("p0") is None
+
+def test_memory_size_zero():
+    history = PromptHistory(0)
+    fill(history, 2)
+    assert len(history) == 0
+    assert history.get_page() == {}
+
+def test_memory_size_zero_with_db(db_path):
+    history = PromptHistory(0, db_path)
+    fill(history, 3)
+    assert len(history) == 3
+    assert history.get("p1") == entry(1)
+    assert list(history.get_page()) == ["p0", "p1", "p2"]
+
+def test_spilled_entries_are_read_back(db_path):
+    history = PromptHistory(2, db_path)
+    fill(history, 5)
+    assert len(history) == 5
+    assert len(history.entries) == 2
+    assert "p0" in history
+    assert history.get("p0") == entry(0)
+    assert list(history.get_page()) == ["p0", "p1", "p2", "p3", "p4"]
+
+def test_paging_across_disk_and_memory(db_path):
+    history = PromptHistory(2, db_path)
+    fill(history, 5)
+    assert list(history.get_page(max_items=2)) == ["p3", "p4"]
+    assert list(history.get_page(max_items=3, offset=1)) == ["p1", "p2", "p3"]
+    assert list(history.get_page(offset=3)) == ["p3", "p4"]
+    assert list(history.get_page(max_items=10, offset=4)) == ["p4"]
+
+def test_paging_memory_only():
+    history = PromptHistory(10)
+    fill(history, 6)
+    assert list(history.get_page(max_items=2, offset=1)) == ["p1", "p2"]
+    assert list(history.get_page(max_items=2, offset=3)) == ["p3", "p4"]
+    assert list(history.get_page(max_items=2)) == ["p4", "p5"]
+
+def test_reloaded_from_db(db_path):
+    fill(PromptHistory(2, db_path), 4)
+    history = PromptHistory(2, db_path)
+    assert len(history) == 4
+    assert list(history.get_page()) == ["p0", "p1", "p2", "p3"]
+
+def test_add_again_moves_to_the_end(db_path):
+    history = PromptHistory(2, db_path)
+    fill(history, 3)
+    history.add("p0", entry(10))
+    assert len(history) == 3
+    assert list(history.get_page()) == ["p1", "p2", "p0"]
+    assert history.get("p0") == entry(10)
+
+def test_delete_and_clear(db_path):
+    history = PromptHistory(2, db_path)
+    fill(history, 4)
+    history.delete("p0")
+    history.delete("p3")
+    assert len(history) == 2
+    assert list(history.get_page()) == ["p1", "p2"]
+    history.clear()
+    assert len(history) == 0
+    assert history.get_page() == {}
+
+def test_failed_write_is_kept_in_memory(db_path):
+    history = PromptHistory(1, db_path)
+    fill(history, 2)
+    broken = entry(2)
+    broken["outputs"] = {"1": {"value": {1, 2}}}
+    history.add("p2", broken)
+    history.add("p3", entry(3))
+    assert len(history) == 4
+    assert history.get("p2") == broken
+    assert list(history.get_page()) == ["p0", "p1", "p3", "p2"]
+    assert list(history.get_page(max_items=2, offset=1)) == ["p1", "p3"]
+    assert list(PromptHistory(1, db_path).get_page()) == ["p0", "p1", "p3"]
+
+    # written with the next entry once it can be
+    broken["outputs"] = {}
+    history.add("p4", entry(4))
+    assert len(history) == 5
+    assert len(history.unsaved) == 0
+    assert list(PromptHistory(1, db_path).get_page()) == ["p0", "p1", "p3", "p2", "p4"]
+
+def test_failed_write_can_be_deleted(db_path):
+    history = PromptHistory(2, db_path)
+    history.add("p0", {"value": {1}})
+    assert len(history) == 1
+    history.delete("p0")
+    assert len(history) == 0
+    assert history.get_page() == {}
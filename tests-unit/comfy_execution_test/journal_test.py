@@ -0,0 +1,103 @@
+import pytest
+
+import execution
+from comfy.cli_args import args
+from comfy_execution.journal import QueueJournal
+
+def item(number):
+    return (number, "p{}".format(number), {"1": {"class_type": "Test", "inputs": {}}}, {"client_id": "a"}, ["1"])
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queue.jsonl")
+
+def reopen(journal, path):
+    assert journal.flush(timeout=10.0)
+    journal.file.close()
+    return QueueJournal(path, sync_interval=0.0)
+
+def recovered(journal):
+    return [(x[1], started) for x, started in journal.recovered]
+
+def test_empty(path):
+    journal = QueueJournal(path, sync_interval=0.0)
+    assert journal.recovered == []
+
+def test_pending_and_running_prompts_are_recovered(path):
+    journal = QueueJournal(path, sync_interval=0.0)
+    for i in range(4):
+        journal.record("put", item(i))
+    journal.record("start", "p0")
+    journal.record("done", "p0")
+    journal.record("start", "p1")
+    journal.record("delete", "p2")
+    journal = reopen(journal, path)
+    assert recovered(journal) == [("p1", True), ("p3", False)]
+    assert journal.recovered[0][0] == item(1)
+
+def test_running_prompts_are_pending_after_a_restart(path):
+    journal = QueueJournal(path, sync_interval=0.0)
+    journal.record("put", item(1))
+    journal.record("start", "p1")
+    journal = reopen(journal, path)
+    assert recovered(journal) == [("p1", True)]
+    # it was queued again, if the server stops again before it runs it is still pending
+    journal = reopen(journal, path)
+    assert recovered(journal) == [("p1", False)]
+
+def test_clear_keeps_running_prompts(path):
+    journal = QueueJournal(path, sync_interval=0.0)
+    for i in range(3):
+        journal.record("put", item(i))
+    journal.record("start", "p1")
+    journal.record("clear", None)
+    journal = reopen(journal, path)
+    assert recovered(journal) == [("p1", True)]
+
+def test_incomplete_last_line_is_ignored(path):
+    journal = QueueJournal(path, sync_interval=0.0)
+    journal.record("put", item(1))
+    journal.record("put", item(2))
+    assert journal.flush(timeout=10.0)
+    journal.file.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('["start", "p')
+    journal = QueueJournal(path, sync_interval=0.0)
+    assert recovered(journal) == [("p1", False), ("p2", False)]
+
+def test_compaction(path):
+    journal = QueueJournal(path, sync_interval=0.0, compact_size=10)
+    for i in range(20):
+        journal.record("put", item(i))
+        journal.record("start", "p{}".format(i))
+        if i != 7:
+            journal.record("done", "p{}".format(i))
+    assert journal.flush(timeout=10.0)
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) < 20
+    journal = reopen(journal, path)
+    assert recovered(journal) == [("p7", True)]
+
+class FakeServer:
+    number = 0
+
+    def queue_updated(self):
+        pass
+
+def test_unknown_worker_tag_is_dropped_on_recovery(path, monkeypatch):
+    journal = QueueJournal(path, sync_interval=0.0)
+    tagged = item(1)
+    tagged[3]["worker_tag"] = "gone"
+    journal.record("put", tagged)
+    other = item(2)
+    other[3]["worker_tag"] = "cpu"
+    journal.record("put", other)
+    assert journal.flush(timeout=10.0)
+    journal.file.close()
+
+    monkeypatch.setattr(args, "queue_journal", path)
+    monkeypatch.setattr(args, "prompt_workers", ["cpu"])
+    q = execution.PromptQueue(FakeServer())
+    assert q.get(timeout=0, worker_tag="cpu")[0][1] == "p1"
+    assert q.get(timeout=0, worker_tag="cpu")[0][3]["worker_tag"] == "cpu"
+    assert q.journal.flush(timeout=10.0)
@@ -0,0 +1,176 @@
+from comfy_execution.scheduler import FairQueue
+
+def item(number, client_id=None, **extra_data):
+    extra_data["client_id"] = client_id
+    return (number, "p{}".format(number), {}, extra_data, [])
+
+def drain(queue, accept=None):
+    out = []
+    while True:
+        x = queue.pop(accept)
+        if x is None:
+            return out
+        out.append(x[0])
+
+def test_single_client_is_fifo():
+    queue = FairQueue(["normal"], "normal")
+    for i in [3, 1, 2]:
+        queue.push(item(i, "a"))
+    assert drain(queue) == [1, 2, 3]
+
+def test_clients_take_turns():
+    queue = FairQueue(["normal"], "normal")
+    for i in range(6):
+        queue.push(item(i, "a"))
+    queue.push(item(10, "b"))
+    queue.push(item(11, "b"))
+    assert drain(queue) == [0, 10, 1, 11, 2, 3, 4, 5]
+
+def test_client_weights():
+    queue = FairQueue(["normal"], "normal", {"a": 2.0})
+    for i in range(6):
+        queue.push(item(i, "a"))
+    for i in range(10, 13):
+        queue.push(item(i, "b"))
+    order = drain(queue)
+    # a gets two prompts started for every one of b
+    assert order[:6] == [0, 10, 1, 2, 11, 3]
+
+def test_idle_client_does_not_get_missed_turns():
+    queue = FairQueue(["normal"], "normal")
+    for i in range(4):
+        queue.push(item(i, "a"))
+    drain(queue)
+    for i in range(4, 8):
+        queue.push(item(i, "a"))
+    queue.pop()
+    queue.pop()
+    for i in range(10, 13):
+        queue.push(item(i, "b"))
+    assert drain(queue) == [10, 6, 11, 7, 12]
+
+def test_priority_classes():
+    queue = FairQueue(["high", "normal", "low"], "normal")
+    queue.push(item(1, "a", priority_class="low"))
+    queue.push(item(2, "a"))
+    queue.push(item(3, "b", priority_class="high"))
+    assert drain(queue) == [3, 2, 1]
+
+def test_front_skips_the_rotation():
+    queue = FairQueue(["normal"], "normal")
+    queue.push(item(1, "a"))
+    queue.push(item(2, "b"))
+    queue.push(item(-1, "a"))
+    assert drain(queue) == [-1, 2, 1]
+
+def test_worker_tags():
+    queue = FairQueue(["normal"], "normal")
+    queue.push(item(1, "a", worker_tag="gpu"))
+    queue.push(item(2, "a"))
+    queue.push(item(3, "b", worker_tag="cpu"))
+    accept = lambda x: x[3].get("worker_tag", None) in (None, "cpu")
+    assert drain(queue, accept) == [2, 3]
+    assert len(queue) == 1
+    assert queue.pop()[0] == 1
+
+def test_metrics():
+    queue = FairQueue(["high", "normal"], "normal")
+    queue.push(item(1, "a"))
+    queue.push(item(2, "b"))
+    queue.push(item(3, "b", priority_class="high"))
+    queue.pop()
+    metrics = queue.get_metrics()
+    assert metrics["high"]["pending"] == 0
+    assert metrics["high"]["started"] == 1
+    assert metrics["normal"]["pending"] == 2
+    assert metrics["normal"]["clients"] == 2
+    assert metrics["normal"]["submitted"] == 2
+
+def test_pop_compatible_charges_turns():
+    queue = FairQueue(["normal"], "normal")
+    for i in range(4):
+        queue.push(item(i, "a", batch=True))
+    queue.push(item(10, "b"))
+    queue.push(item(11, "b"))
+    compatible = lambda x: x[3].get("batch", False)
+    assert queue.pop()[0] == 0
+    assert [x[0] for x in queue.pop_compatible(compatible, 3)] == [1, 2, 3]
+    assert queue.get_metrics()["normal"]["started"] == 4
+    # client a used four turns, b goes next even though a prompt of a would be older
+    queue.push(item(4, "a"))
+    assert drain(queue) == [10, 11, 4]
+
+def test_pop_compatible_respects_classes():
+    queue = FairQueue(["high", "normal", "low"], "normal")
+    queue.push(item(1, "a", batch=True))
+    queue.push(item(2, "a", batch=True, priority_class="low"))
+    queue.push(item(3, "b", batch=True, priority_class="high"))
+    queue.push(item(4, "b", priority_class="high"))
+    compatible = lambda x: x[3].get("batch", False)
+    # the waiting high prompt can't be batched, nothing of a lower class rides ahead of it
+    assert [x[0] for x in queue.pop_compatible(compatible, 3)] == [3]
+    assert queue.pop_compatible(compatible, 3) == []
+    assert queue.pop()[0] == 4
+    assert [x[0] for x in queue.pop_compatible(compatible, 3)] == [1, 2]
+
+def test_pop_compatible_worker_tags():
+    queue = FairQueue(["high", "normal"], "normal")
+    queue.push(item(1, "a", worker_tag="gpu", priority_class="high"))
+    queue.push(item(2, "a", batch=True))
+    queue.push(item(3, "a", batch=True, worker_tag="gpu"))
+    accept = lambda x: x[3].get("worker_tag", None) in (None, "cpu")
+    compatible = lambda x: x[3].get("batch", False)
+    # a high prompt only another worker can run doesn't hold this one back
+    assert [x[0] for x in queue.pop_compatible(compatible, 3, accept)] == [2]
+    assert len(queue) == 2
+
+def test_lookup_by_prompt_id():
+    queue = FairQueue(["normal"], "normal")
+    queue.push(item(1, "a"))
+    queue.push(item(2, "b"))
+    assert "p1" in queue
+    assert queue.get("p2")[0] == 2
+    assert queue.get("p3") is None
+    assert sorted(x[0] for x in queue) == [1, 2]
+
+def test_removed_prompts_are_skipped():
+    queue = FairQueue(["normal"], "normal")
+    for i in range(5):
+        queue.push(item(i, "a"))
+    queue.remove(queue.get("p0"))
+    queue.remove(queue.get("p2"))
+    assert len(queue) == 3
+    assert "p2" not in queue
+    assert sorted(x[0] for x in queue) == [1, 3, 4]
+    assert queue.client_depth("a") == 3
+    assert drain(queue) == [1, 3, 4]
+    assert queue.client_depth("a") == 0
+
+def test_heap_is_compacted_when_mostly_removed():
+    queue = FairQueue(["normal"], "normal")
+    for i in range(10):
+        queue.push(item(i, "a"))
+    for i in range(1, 9):
+        queue.remove(queue.get("p{}".format(i)))
+    client_queue = queue.order[0].clients["a"]
+    assert len(client_queue.heap) < 10
+    assert len(client_queue) == 2
+    assert drain(queue) == [0, 9]
+
+def test_prompt_queued_again_after_removal():
+    queue = FairQueue(["normal"], "normal")
+    queue.push(item(1, "a"))
+    queue.push(item(2, "a"))
+    queue.remove(queue.get("p1"))
+    queue.push(item(1, "a"))
+    assert len(queue) == 2
+    assert drain(queue) == [1, 2]
+
+def test_clear():
+    queue = FairQueue(["normal"], "normal")
+    queue.push(item(1, "a"))
+    queue.push(item(2, "b"))
+    queue.clear()
+    assert len(queue) == 0
+    assert queue.pop() is None
+    assert queue.client_depth("a") == 0
@@ -0,0 +1,105 @@
+import pytest
+
+import execution
+import nodes
+
+class Sample:
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+    BATCH_FUNCTION = "run_batch"
+    calls = []
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"seed": ("INT", {})}}
+
+    def run(self, seed):
+        Sample.calls.append([seed])
+        return (seed * 2,)
+
+    def run_batch(self, inputs):
+        Sample.calls.append([x["seed"] for x in inputs])
+        return [(x["seed"] * 2,) for x in inputs]
+
+class Out:
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {}), "label": ("STRING", {})}}
+
+    def run(self, value, label):
+        return {"ui": {"value": [value]}}
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+    def queue_updated(self):
+        pass
+
+    def get_execution_context(self):
+        return {}
+
+    def set_execution_context(self, context):
+        pass
+
+@pytest.fixture(autouse=True)
+def node_classes(monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestSample", Sample)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestOut", Out)
+    Sample.calls = []
+
+def item(number, seed, label="a", **extra_data):
+    prompt = {
+        "1": {"class_type": "TestSample", "inputs": {"seed": seed}},
+        "2": {"class_type": "TestOut", "inputs": {"value": ["1", 0], "label": label}},
+    }
+    return (number, "p{}".format(number), prompt, extra_data, ["2"])
+
+def test_batch_compatible():
+    assert execution.batch_compatible(item(0, 1), item(1, 2))
+    # identical prompts don't need a batched call
+    assert not execution.batch_compatible(item(0, 1), item(1, 1))
+    # only the inputs of nodes with a BATCH_FUNCTION can differ
+    assert not execution.batch_compatible(item(0, 1), item(1, 2, label="b"))
+    assert not execution.batch_compatible(item(0, 1, worker_tag="cpu"), item(1, 2))
+
+def test_get_compatible_takes_compatible_prompts():
+    q = execution.PromptQueue(FakeServer())
+    q.put(item(0, 1))
+    q.put(item(1, 2, label="b"))
+    q.put(item(2, 3))
+    q.put(item(3, 4))
+    first, _ = q.get(timeout=0)
+    batch = q.get_compatible(first, 3)
+    assert [x[0][1] for x in batch] == ["p2", "p3"]
+    assert len(q.queue) == 1
+    assert len(q.currently_running) == 3
+    assert q.get_metrics()["normal"]["started"] == 3
+
+def test_batched_node_runs_once_for_the_batch():
+    items = [item(i, i + 1) for i in range(3)]
+    e = execution.PromptExecutor(FakeServer())
+    e.set_batch(items)
+    results = []
+    for x in items:
+        e.execute(x[2], x[1], x[3], x[4])
+        assert e.success
+        results.append((e.outputs_ui["2"]["value"], e.profiler.get_records()))
+    e.clear_batch()
+
+    assert Sample.calls == [[1, 2, 3]]
+    assert [x[0] for x in results] == [[2], [4], [6]]
+    sample_record = [r for r in results[1][1] if r["node_id"] == "1"][0]
+    assert sample_record["batched"] and sample_record["batch_size"] == 3
+
+    # outside of a batch the node is called on its own
+    x = item(3, 7)
+    e.execute(x[2], x[1], x[3], x[4])
+    assert Sample.calls[-1] == [7]
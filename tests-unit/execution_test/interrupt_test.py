@@ -0,0 +1,93 @@
+import pytest
+
+import execution
+import nodes
+
+class Value:
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})}}
+
+    def run(self, value):
+        return (value,)
+
+class Out:
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})}}
+
+    def run(self, value):
+        return {"ui": {"value": [value]}}
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+    def queue_updated(self):
+        pass
+
+    def get_execution_context(self):
+        return {}
+
+    def set_execution_context(self, context):
+        pass
+
+PROMPT = {
+    "value": {"class_type": "TestValue", "inputs": {"value": 1}},
+    "out": {"class_type": "TestOut", "inputs": {"value": ["value", 0]}},
+}
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestValue", Value)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestOut", Out)
+    q = execution.PromptQueue(FakeServer())
+    yield q
+    nodes.interrupted_prompts.clear()
+
+def start(queue, prompt_id):
+    queue.put((len(queue.queue), prompt_id, PROMPT, {}, ["out"]))
+    return queue.get(timeout=0)
+
+def run(prompt_id):
+    e = execution.PromptExecutor(FakeServer())
+    e.execute(PROMPT, prompt_id, {}, ["out"])
+    return e
+
+def test_interrupt_only_stops_the_targeted_prompt(queue):
+    start(queue, "a")
+    start(queue, "b")
+    assert queue.interrupt("a") == 1
+
+    b = run("b")
+    assert b.success
+    a = run("a")
+    assert not a.success
+    assert [x[0] for x in a.status_messages][-1] == "execution_interrupted"
+
+def test_interrupt_without_prompt_id_stops_every_running_prompt(queue):
+    start(queue, "a")
+    start(queue, "b")
+    assert queue.interrupt() == 2
+    assert not run("a").success
+    assert not run("b").success
+
+def test_interrupt_is_cleared_when_the_prompt_is_done(queue):
+    item_a = start(queue, "a")
+    assert queue.interrupt("c") == 0
+    queue.interrupt("a")
+    queue.task_done(item_a[1], {}, None)
+    assert len(nodes.interrupted_prompts) == 0
+    # a prompt started afterwards with the same id runs normally
+    start(queue, "a")
+    assert run("a").success
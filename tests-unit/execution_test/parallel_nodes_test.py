@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+import execution
+import nodes
+from comfy.cli_args import args
+
+class Slow:
+    THREAD_SAFE = True
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+    spans = []
+    lock = threading.Lock()
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})}}
+
+    def run(self, value):
+        start = time.perf_counter()
+        time.sleep(0.2)
+        with Slow.lock:
+            Slow.spans.append((start, time.perf_counter()))
+        return (value,)
+
+class SlowSerial(Slow):
+    THREAD_SAFE = False
+
+class Out:
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})}}
+
+    def run(self, value):
+        return {"ui": {"value": [value]}}
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+    def get_execution_context(self):
+        return {}
+
+    def set_execution_context(self, context):
+        pass
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(args, "parallel_cpu_nodes", 4)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestSlow", Slow)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestSlowSerial", SlowSerial)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestOut", Out)
+    Slow.spans = []
+    e = execution.PromptExecutor(FakeServer())
+    yield e
+    e.thread_pool.shutdown()
+
+def test_branches_of_different_outputs_overlap(executor):
+    prompt = {}
+    for i in range(4):
+        prompt["slow{}".format(i)] = {"class_type": "TestSlow", "inputs": {"value": i}}
+        prompt["out{}".format(i)] = {"class_type": "TestOut", "inputs": {"value": ["slow{}".format(i), 0]}}
+    executor.execute(prompt, "test", {}, ["out{}".format(i) for i in range(4)])
+
+    assert executor.success
+    assert sorted(executor.outputs_ui) == ["out0", "out1", "out2", "out3"]
+    assert len(Slow.spans) == 4
+    # all four ran at the same time instead of one output after another
+    assert max(x[0] for x in Slow.spans) < min(x[1] for x in Slow.spans)
+
+def test_workers_run_nodes_that_are_not_thread_safe_one_at_a_time(executor):
+    # a second prompt worker with its own executor
+    other = execution.PromptExecutor(FakeServer())
+    prompt = {
+        "slow": {"class_type": "TestSlowSerial", "inputs": {"value": 1}},
+        "out": {"class_type": "TestOut", "inputs": {"value": ["slow", 0]}},
+    }
+    threads = [threading.Thread(target=e.execute, args=(prompt, "test", {}, ["out"])) for e in (executor, other)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    other.thread_pool.shutdown()
+
+    assert executor.success and other.success
+    spans = sorted(Slow.spans)
+    assert len(spans) == 2
+    assert spans[0][1] <= spans[1][0]
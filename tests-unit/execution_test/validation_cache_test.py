@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+import comfy_execution.caching
+import execution
+import folder_paths
+import nodes
+
+class Loader:
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+    calls = 0
+
+    @classmethod
+    def INPUT_TYPES(s):
+        Loader.calls += 1
+        return {"required": {"name": (folder_paths.get_filename_list("test_models"),), "strength": ("INT", {"min": 0, "max": 10})}}
+
+class Dynamic(Loader):
+    @classmethod
+    def INPUT_TYPES(s):
+        Loader.calls += 1
+        return {"required": {"strength": ("INT", {"min": 0, "max": 10})}}
+
+class Out:
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})}}
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestLoader", Loader)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestDynamic", Dynamic)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestOut", Out)
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "test_models", ([str(tmp_path)], {".safetensors"}))
+    monkeypatch.setattr(comfy_execution.caching, "input_types_cache", comfy_execution.caching.InputTypesCache())
+    monkeypatch.setattr(comfy_execution.caching, "validation_cache", comfy_execution.caching.ValidationCache())
+    Loader.calls = 0
+    (tmp_path / "a.safetensors").write_bytes(b"")
+    yield tmp_path
+    folder_paths.filename_list_cache.pop("test_models", None)
+    folder_paths.full_path_cache.pop("test_models", None)
+
+def touch(path, offset):
+    # folder mtimes can have a coarse resolution, move it explicitly
+    t = os.path.getmtime(path) + offset
+    os.utime(path, (t, t))
+
+def prompt(name="a.safetensors", strength=1):
+    return {
+        "1": {"class_type": "TestLoader", "inputs": {"name": name, "strength": strength}},
+        "2": {"class_type": "TestOut", "inputs": {"value": ["1", 0]}},
+    }
+
+def test_input_types_cached_until_the_folder_changes(models):
+    first = comfy_execution.caching.get_input_types(Loader)
+    assert comfy_execution.caching.get_input_types(Loader) is first
+    assert Loader.calls == 1
+
+    (models / "b.safetensors").write_bytes(b"")
+    touch(models, 10)
+    second = comfy_execution.caching.get_input_types(Loader)
+    assert Loader.calls == 2
+    assert second["required"]["name"][0] == ["a.safetensors", "b.safetensors"]
+
+def test_input_types_without_folders_are_not_cached(models):
+    comfy_execution.caching.get_input_types(Dynamic)
+    comfy_execution.caching.get_input_types(Dynamic)
+    assert Loader.calls == 2
+
+def test_clear(models):
+    comfy_execution.caching.get_input_types(Loader)
+    comfy_execution.caching.input_types_cache.clear()
+    comfy_execution.caching.get_input_types(Loader)
+    assert Loader.calls == 2
+
+def test_validation_is_reused(models, monkeypatch):
+    assert execution.validate_prompt(prompt())[0]
+    cache = comfy_execution.caching.validation_cache
+    assert len(cache.cache) == 2
+
+    hits = []
+    get = cache.get
+    monkeypatch.setattr(cache, "get", lambda *a: hits.append(get(*a)) or hits[-1])
+    # renumbered, the signatures are the same
+    renumbered = {"7": dict(prompt()["1"]), "8": {"class_type": "TestOut", "inputs": {"value": ["7", 0]}}}
+    assert execution.validate_prompt(renumbered)[0]
+    assert len(hits) == 2 and all(x is not None for x in hits)
+
+    # another literal input is validated again
+    hits.clear()
+    assert not execution.validate_prompt(prompt(strength=20))[0]
+    assert hits[0] is None
+
+def test_validation_is_invalidated_when_the_folder_changes(models):
+    assert execution.validate_prompt(prompt())[0]
+    os.remove(models / "a.safetensors")
+    touch(models, 10)
+    valid, error, outputs, node_errors = execution.validate_prompt(prompt())
+    assert not valid
+    assert node_errors["1"]["errors"][0]["type"] == "value_not_in_list"
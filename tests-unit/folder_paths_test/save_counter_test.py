@@ -0,0 +1,63 @@
+import os
+import threading
+
+import pytest
+
+import folder_paths
+
+def save(output_dir, prefix="ComfyUI", data=b"image"):
+    full_output_folder, filename, counter, _, _ = folder_paths.get_save_image_path(prefix, output_dir)
+    with folder_paths.create_save_file(full_output_folder, filename, counter, lambda c: f"{filename}_{c:05}_.png") as (f, file, counter):
+        f.write(data)
+    return file
+
+def test_counter_continues_after_existing_files(tmp_path):
+    for x in ["ComfyUI_00003_.png", "ComfyUI_00001_.png", "Other_00010_.png"]:
+        (tmp_path / x).write_bytes(b"")
+    assert save(str(tmp_path)) == "ComfyUI_00004_.png"
+
+def test_folder_is_listed_once(tmp_path, monkeypatch):
+    output_dir = str(tmp_path)
+    save(output_dir)
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listed.append(path) or listdir(path))
+    assert [save(output_dir) for i in range(3)] == ["ComfyUI_00002_.png", "ComfyUI_00003_.png", "ComfyUI_00004_.png"]
+    assert listed == []
+
+def test_file_created_by_another_process_is_not_overwritten(tmp_path):
+    output_dir = str(tmp_path)
+    save(output_dir)
+    (tmp_path / "ComfyUI_00002_.png").write_bytes(b"other")
+    (tmp_path / "ComfyUI_00003_.png").write_bytes(b"other")
+    assert save(output_dir) == "ComfyUI_00004_.png"
+    assert (tmp_path / "ComfyUI_00002_.png").read_bytes() == b"other"
+    assert save(output_dir) == "ComfyUI_00005_.png"
+
+def test_concurrent_saves_get_different_files(tmp_path):
+    output_dir = str(tmp_path)
+    files = []
+    lock = threading.Lock()
+
+    def saver():
+        for i in range(20):
+            file = save(output_dir)
+            with lock:
+                files.append(file)
+
+    threads = [threading.Thread(target=saver) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(files)) == 160
+    assert sorted(os.listdir(output_dir)) == sorted(files)
+
+def test_failed_save_leaves_no_file(tmp_path):
+    output_dir = str(tmp_path)
+    with pytest.raises(ValueError):
+        with folder_paths.create_save_file(output_dir, "ComfyUI", 1, lambda c: f"ComfyUI_{c:05}_.png") as (f, file, counter):
+            f.write(b"partial")
+            raise ValueError("encoder failed")
+    assert os.listdir(output_dir) == []
+    assert save(output_dir).startswith("ComfyUI_")
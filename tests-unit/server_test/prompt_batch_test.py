@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import execution
+import folder_paths
+import nodes
+import server
+from comfy.cli_args import args
+
+class Sample:
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"seed": ("INT", {"min": 0, "max": 100}), "sampler": (["euler", "ddim"],)}}
+
+class Out:
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"value": ("INT", {})}}
+
+PROMPT = {
+    "1": {"class_type": "TestSample", "inputs": {"seed": 1, "sampler": "euler"}},
+    "2": {"class_type": "TestOut", "inputs": {"value": ["1", 0]}},
+}
+
+@pytest.fixture(autouse=True)
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestSample", Sample)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestOut", Out)
+    monkeypatch.setattr(folder_paths, "user_directory", str(tmp_path / "user"))
+    monkeypatch.setattr(folder_paths, "temp_directory", str(tmp_path / "temp"))
+
+def post(path, data):
+    """POST data to a new server, returns the status, the response and the queue."""
+    async def run():
+        s = server.PromptServer(asyncio.get_running_loop())
+        q = execution.PromptQueue(s)
+        s.add_routes()
+        client = TestClient(TestServer(s.app))
+        await client.start_server()
+        try:
+            response = await client.post(path, json=data)
+            return response.status, await response.json(), q
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+def queued(q):
+    return sorted((x[2]["1"]["inputs"]["seed"], x[2]["1"]["inputs"]["sampler"]) for x in q.get_current_queue()[1])
+
+def test_variants_are_queued():
+    overrides = [{"1": {"seed": 5}}, {"1": {"seed": 6, "sampler": "ddim"}}, {}]
+    status, response, q = post("/prompt/batch", {"prompt": PROMPT, "overrides": overrides, "client_id": "a"})
+    assert status == 200
+    assert len(response["prompt_ids"]) == 3
+    assert len(set(response["prompt_ids"])) == 3
+    assert queued(q) == [(1, "euler"), (5, "euler"), (6, "ddim")]
+    assert all(x[3]["client_id"] == "a" and x[4] == ["2"] for x in q.get_current_queue()[1])
+
+def test_invalid_variant_queues_nothing():
+    overrides = [{"1": {"seed": 5}}, {"1": {"sampler": "unknown"}}]
+    status, response, q = post("/prompt/batch", {"prompt": PROMPT, "overrides": overrides})
+    assert status == 400
+    assert response["error"]["type"] == "prompt_variant_failed_validation"
+    assert response["error"]["extra_info"]["variant"] == 1
+    assert "1" in response["node_errors"]
+    assert len(q.queue) == 0
+
+@pytest.mark.parametrize("overrides", [
+    [{"9": {"seed": 5}}],
+    [{"2": {"value": 5}}],
+    [[1]],
+])
+def test_invalid_override(overrides):
+    status, response, q = post("/prompt/batch", {"prompt": PROMPT, "overrides": overrides})
+    assert status == 400
+    assert response["error"]["type"] == "invalid_override"
+    assert len(q.queue) == 0
+
+def test_invalid_template():
+    prompt = {"1": dict(PROMPT["1"], inputs={"seed": 500, "sampler": "euler"}), "2": PROMPT["2"]}
+    status, response, q = post("/prompt/batch", {"prompt": prompt, "overrides": [{"1": {"seed": 5}}]})
+    assert status == 400
+    assert len(q.queue) == 0
+
+def test_empty_overrides():
+    status, response, q = post("/prompt/batch", {"prompt": PROMPT, "overrides": []})
+    assert status == 400
+
+def test_client_limit_queues_nothing(monkeypatch):
+    monkeypatch.setattr(args, "max_queue_per_client", 2)
+    overrides = [{"1": {"seed": x}} for x in range(3)]
+    status, response, q = post("/prompt/batch", {"prompt": PROMPT, "overrides": overrides, "client_id": "a"})
+    assert status == 429
+    assert len(q.queue) == 0
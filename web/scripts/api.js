@@ -183,10 +183,11 @@ class ComfyApi extends EventTarget {
 
 	/**
 	 * Loads node object definitions for the graph
+	 * @param {boolean} refresh Compute the input types of every node again instead of using the cached ones
 	 * @returns The node definitions
 	 */
-	async getNodeDefs() {
-		const resp = await this.fetchApi("/object_info", { cache: "no-store" });
+	async getNodeDefs({ refresh = false } = {}) {
+		const resp = await this.fetchApi("/object_info" + (refresh ? "?refresh=true" : ""), { cache: "no-store" });
 		return await resp.json();
 	}
 
@@ -319,10 +320,11 @@ class ComfyApi extends EventTarget {
 	}
 
 	/**
-	 * Interrupts the execution of the running prompt
+	 * Interrupts the execution of the running prompts
+	 * @param {string} [promptId] Only interrupt this prompt
 	 */
-	async interrupt() {
-		await this.#postItem("interrupt", null);
+	async interrupt(promptId) {
+		await this.#postItem("interrupt", promptId ? { prompt_id: promptId } : null);
 	}
 
 	/**
@@ -2206,7 +2206,7 @@ export class ComfyApp {
 	 * Refresh combo list on whole nodes
 	 */
 	async refreshComboInNodes() {
-		const defs = await api.getNodeDefs();
+		const defs = await api.getNodeDefs({ refresh: true });
 
 		for (const nodeId in defs) {
 			this.registerNodeDef(nodeId, defs[nodeId]);